@@ -1,22 +1,30 @@
 import numpy as np
 import pandas as pd
-from typing import List, Dict, Any, Optional, Tuple, Union
+from typing import List, Dict, Any, Optional, Tuple, Union, Iterable
 import sys
 import os
+import json
+import time
+import threading
+import argparse
 from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
 
 # 添加项目根目录到系统路径，以便导入backend模块
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 
 # 导入后端模型和工具
+from backend.models import db
 from backend.models.user import User
 from backend.models.place import Place
 from backend.models.food import Food
+from backend.models.interaction import Interaction
 from backend.utils.helpers import calculate_distance
+from ai_recommendation.versioned_store import VersionedStore
 
 # 尝试导入科学计算库
 try:
-    from scipy.sparse import csr_matrix
+    from scipy.sparse import coo_matrix, csr_matrix, diags, save_npz, load_npz
     from scipy.sparse.linalg import svds
     SCIPY_AVAILABLE = True
 except ImportError:
@@ -24,69 +32,1023 @@ except ImportError:
     print("Warning: scipy not installed. Using fallback similarity methods.")
 
 
+# 没有显式评分时，隐式行为折算成的评分
+IMPLICIT_RATINGS = {
+    'like': 4.0,
+    'view': 3.0
+}
+
+
+def merge_interactions(records: Iterable[Tuple[int, int, str, Optional[float]]]) -> List[Dict[str, Any]]:
+    """把按时间顺序排列的交互记录合并为每个(用户, 物品)一条评分
+    
+    显式评分以最后一次为准；没有评分时，点赞（扣除取消点赞后仍为正）和浏览按IMPLICIT_RATINGS折算
+    
+    Args:
+        records: (user_id, item_id, action, value)的序列，按记录ID升序
+    
+    Returns:
+        交互记录列表，包含user_id, item_id, rating和explicit
+    """
+    explicit = {}
+    likes = defaultdict(int)
+    viewed = set()
+    
+    for user_id, item_id, action, value in records:
+        key = (user_id, item_id)
+        
+        if action == 'rate' and value is not None:
+            explicit[key] = value
+        elif action == 'like':
+            likes[key] += 1
+        elif action == 'unlike':
+            likes[key] -= 1
+        elif action == 'view':
+            viewed.add(key)
+    
+    interactions = []
+    for key in set(explicit) | set(likes) | viewed:
+        if key in explicit:
+            rating, is_explicit = explicit[key], True
+        elif likes.get(key, 0) > 0:
+            rating, is_explicit = IMPLICIT_RATINGS['like'], False
+        elif key in viewed:
+            rating, is_explicit = IMPLICIT_RATINGS['view'], False
+        else:
+            continue
+        
+        interactions.append({
+            'user_id': key[0],
+            'item_id': key[1],
+            'rating': rating,
+            'explicit': is_explicit
+        })
+    
+    return interactions
+
+
+def load_interactions(item_type: str, after_id: int = 0, batch_size: int = 10000) -> Tuple[List[Dict[str, Any]], int]:
+    """从交互记录表读取某类物品的交互，合并为每个(用户, 物品)一条评分
+    
+    Args:
+        item_type: 物品类型，'place'或'food'
+        after_id: 只读取ID大于该值的记录，用于增量刷新
+        batch_size: 每次从数据库读取的行数
+    
+    Returns:
+        (交互记录列表, 读取到的最大记录ID)，记录包含user_id, item_id, rating和explicit，合并规则见merge_interactions
+    """
+    last_id = after_id
+    
+    query = db.session.query(
+        Interaction.id, Interaction.user_id, Interaction.item_id, Interaction.action, Interaction.value
+    ).filter(
+        Interaction.item_type == item_type,
+        Interaction.id > after_id
+    ).order_by(Interaction.id).yield_per(batch_size)
+    
+    def records():
+        nonlocal last_id
+        for record_id, user_id, item_id, action, value in query:
+            last_id = record_id
+            yield user_id, item_id, action, value
+    
+    interactions = merge_interactions(records())
+    return interactions, last_id
+
+
+def load_unliked_interactions(item_type: str, after_id: int, last_id: int) -> List[Dict[str, Any]]:
+    """重新合并在(after_id, last_id]范围内被取消点赞的(用户, 物品)的全部交互历史
+    
+    增量刷新只合并新记录时，取消点赞对应的点赞可能在更早的记录中，单独合并新记录无法降低已有评分。
+    这些(用户, 物品)按截至last_id的全部记录重新合并，结果标记为explicit以替换已有评分；
+    合并后既没有评分、点赞也没有浏览的记录评分为0，表示从模型中删除
+    
+    Args:
+        item_type: 物品类型
+        after_id: 本次刷新读取的起始记录ID（不含）
+        last_id: 本次刷新读取到的最大记录ID
+    
+    Returns:
+        交互记录列表，包含user_id, item_id, rating和explicit
+    """
+    keys = set(db.session.query(Interaction.user_id, Interaction.item_id).filter(
+        Interaction.item_type == item_type,
+        Interaction.id > after_id,
+        Interaction.id <= last_id,
+        Interaction.action == 'unlike'
+    ).distinct())
+    if not keys:
+        return []
+    
+    records = db.session.query(
+        Interaction.user_id, Interaction.item_id, Interaction.action, Interaction.value
+    ).filter(
+        Interaction.item_type == item_type,
+        Interaction.id <= last_id,
+        Interaction.user_id.in_({user_id for user_id, _ in keys}),
+        Interaction.item_id.in_({item_id for _, item_id in keys})
+    ).order_by(Interaction.id)
+    
+    merged = {(interaction['user_id'], interaction['item_id']): interaction
+              for interaction in merge_interactions(record for record in records if (record[0], record[1]) in keys)}
+    
+    return [dict(merged[key], explicit=True) if key in merged else
+            {'user_id': key[0], 'item_id': key[1], 'rating': 0.0, 'explicit': True}
+            for key in keys]
+
+
+class ItemNeighborTable:
+    """物品的Top-K相似物品表
+    
+    离线用稀疏矩阵乘法一次算出所有物品两两之间的余弦相似度，每个物品只保留最相似的K个，
+    以两个(物品数, K)的紧凑数组保存：neighbors为邻居的物品索引（不足K个时用-1补齐），
+    similarities为对应的相似度，按相似度降序排列。在线预测只需查表，不再逐对计算相似度
+    """
+    
+    def __init__(self, neighbors: np.ndarray = None, similarities: np.ndarray = None):
+        """初始化邻居表
+        
+        Args:
+            neighbors: 形状为(物品数, K)的int32邻居索引
+            similarities: 形状为(物品数, K)的float32相似度
+        """
+        self.neighbors = neighbors if neighbors is not None else np.zeros((0, 0), dtype='int32')
+        self.similarities = similarities if similarities is not None else np.zeros((0, 0), dtype='float32')
+    
+    @property
+    def k(self) -> int:
+        return self.neighbors.shape[1]
+    
+    def __len__(self) -> int:
+        return self.neighbors.shape[0]
+    
+    @classmethod
+    def build(cls, user_item_matrix, k: int = 50, block_size: int = 256) -> 'ItemNeighborTable':
+        """从用户-物品评分矩阵计算邻居表
+        
+        物品向量（各用户的评分）归一化后分块与全部物品相乘，每块得到block_size行相似度，
+        用argpartition取Top-K，峰值内存为block_size×物品数
+        
+        Args:
+            user_item_matrix: 用户-物品评分矩阵（scipy.sparse或numpy数组）
+            k: 每个物品保留的邻居数量
+            block_size: 每次计算相似度的物品数
+        
+        Returns:
+            邻居表
+        """
+        n_items = user_item_matrix.shape[1]
+        k = max(0, min(k, n_items - 1))
+        neighbors = np.full((n_items, k), -1, dtype='int32')
+        similarities = np.zeros((n_items, k), dtype='float32')
+        
+        if k == 0:
+            return cls(neighbors, similarities)
+        
+        # 物品×用户矩阵，只使用正评分
+        if SCIPY_AVAILABLE:
+            item_vectors = csr_matrix(user_item_matrix).T.tocsr().astype('float32')
+            item_vectors.data[item_vectors.data < 0] = 0
+            item_vectors.eliminate_zeros()
+            norms = np.sqrt(np.asarray(item_vectors.multiply(item_vectors).sum(axis=1)).ravel())
+            item_vectors = diags(np.divide(1.0, norms, out=np.zeros_like(norms), where=norms > 0)) @ item_vectors
+            item_vectors_t = item_vectors.T.tocsc()
+        else:
+            item_vectors = np.maximum(np.asarray(user_item_matrix, dtype='float32').T, 0)
+            norms = np.linalg.norm(item_vectors, axis=1, keepdims=True)
+            item_vectors = np.divide(item_vectors, norms, out=np.zeros_like(item_vectors), where=norms > 0)
+            item_vectors_t = item_vectors.T
+        
+        for start in range(0, n_items, block_size):
+            end = min(start + block_size, n_items)
+            block = item_vectors[start:end] @ item_vectors_t
+            block = block.toarray() if hasattr(block, 'toarray') else np.asarray(block)
+            
+            # 排除物品自身
+            block[np.arange(end - start), np.arange(start, end)] = -np.inf
+            
+            top = np.argpartition(-block, k - 1, axis=1)[:, :k]
+            top_scores = np.take_along_axis(block, top, axis=1)
+            order = np.argsort(-top_scores, axis=1)
+            top = np.take_along_axis(top, order, axis=1)
+            top_scores = np.take_along_axis(top_scores, order, axis=1)
+            
+            # 相似度为0的物品没有共同用户，不作为邻居
+            valid = top_scores > 0
+            neighbors[start:end] = np.where(valid, top, -1)
+            similarities[start:end] = np.where(valid, top_scores, 0)
+        
+        return cls(neighbors, similarities)
+    
+    def get(self, item_idx: int) -> Tuple[np.ndarray, np.ndarray]:
+        """获取物品的邻居
+        
+        Args:
+            item_idx: 物品索引
+        
+        Returns:
+            (邻居物品索引, 相似度)，按相似度降序，不含补齐的-1
+        """
+        neighbors = self.neighbors[item_idx]
+        valid = neighbors >= 0
+        return neighbors[valid], self.similarities[item_idx][valid]
+    
+    def save(self, path: str):
+        """保存为.npz文件
+        
+        Args:
+            path: 文件路径
+        """
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        np.savez(path, neighbors=self.neighbors, similarities=self.similarities)
+    
+    @classmethod
+    def load(cls, path: str) -> 'ItemNeighborTable':
+        """从.npz文件加载
+        
+        Args:
+            path: 文件路径
+        
+        Returns:
+            邻居表
+        """
+        with np.load(path) as data:
+            return cls(data['neighbors'], data['similarities'])
+
+
+class ImplicitALS:
+    """隐式反馈的加权交替最小二乘（weighted ALS）矩阵分解
+    
+    把每个评分不低于positive_rating的(用户, 物品)视为偏好1、置信度1+alpha×评分，
+    低于positive_rating的显式低分视为偏好0、置信度1+alpha×(positive_rating-评分)，即越低的评分越确定不喜欢，
+    未观察到的视为偏好0、置信度1，交替固定一边的因子求解另一边。每行的线性方程组用共轭梯度从上一轮的结果出发迭代少数几步，
+    只访问该行的非零项，计算量与交互数成正比，不需要构造稠密矩阵。
+    用户（物品）按块分给线程池并行求解，每块的计算都是稀疏矩阵乘法和numpy数组运算。
+    训练时每个用户随机留出一部分交互作为验证集，每轮之后计算验证集上的Recall@K，
+    连续patience轮没有提升时提前停止并恢复最好的因子，最后在全部数据上再更新一轮
+    """
+    
+    def __init__(self, n_factors: int = 32, regularization: float = 0.05, alpha: float = 2.0,
+                 positive_rating: float = 3.0, iterations: int = 15, cg_steps: int = 3, n_threads: int = 0, block_size: int = 2048,
+                 validation_fraction: float = 0.1, patience: int = 2, eval_k: int = 10,
+                 max_eval_users: int = 5000, random_state: int = 42):
+        """初始化训练器
+        
+        Args:
+            n_factors: 潜在因子数量
+            regularization: L2正则系数
+            alpha: 置信度系数，置信度为1+alpha×评分
+            positive_rating: 视为正反馈的最低评分，浏览和点赞的隐式评分都不低于它，更低的显式评分视为负反馈
+            iterations: 最多训练的轮数
+            cg_steps: 每轮每行共轭梯度的迭代步数
+            n_threads: 并行求解的线程数，为0时使用CPU核数
+            block_size: 每个线程每次求解的行数
+            validation_fraction: 留作验证集的交互比例，为0时不做验证和提前停止
+            patience: 验证指标连续多少轮没有提升时停止
+            eval_k: 验证指标Recall@K中的K
+            max_eval_users: 参与验证的最多用户数，超过时随机抽样
+            random_state: 随机种子
+        """
+        self.n_factors = n_factors
+        self.regularization = regularization
+        self.alpha = alpha
+        self.positive_rating = positive_rating
+        self.iterations = iterations
+        self.cg_steps = cg_steps
+        self.n_threads = n_threads or os.cpu_count() or 1
+        self.block_size = block_size
+        self.validation_fraction = validation_fraction
+        self.patience = patience
+        self.eval_k = eval_k
+        self.max_eval_users = max_eval_users
+        self.random_state = random_state
+        self.user_factors = None
+        self.item_factors = None
+        # 每轮的验证指标，[{'iteration': 轮次, 'recall': Recall@K, 'seconds': 累计耗时}]
+        self.history = []
+        self.best_iteration = 0
+    
+    def fit(self, user_item_matrix) -> 'ImplicitALS':
+        """训练用户和物品因子
+        
+        Args:
+            user_item_matrix: scipy.sparse的用户-物品评分矩阵，只使用正评分，低于positive_rating的评分作为负反馈
+        
+        Returns:
+            训练器自身，因子保存在user_factors和item_factors中
+        """
+        rng = np.random.default_rng(self.random_state)
+        matrix = csr_matrix(user_item_matrix, dtype='float32', copy=True)
+        matrix.data[matrix.data < 0] = 0
+        matrix.eliminate_zeros()
+        matrix.sort_indices()
+        n_users, n_items = matrix.shape
+        
+        # 初始化为较小的随机值
+        scale = 0.01 / np.sqrt(self.n_factors)
+        user_factors = (rng.standard_normal((n_users, self.n_factors)) * scale).astype('float32')
+        item_factors = (rng.standard_normal((n_items, self.n_factors)) * scale).astype('float32')
+        
+        train, validation = matrix, None
+        if self.validation_fraction > 0 and self.iterations > 1:
+            train, validation = self.split(matrix, self.validation_fraction, rng)
+            # 验证集只统计正反馈的命中
+            validation.data[validation.data < self.positive_rating] = 0
+            validation.eliminate_zeros()
+        train_t = train.T.tocsr()
+        
+        self.history = []
+        self.best_iteration = 0
+        best_recall = -1.0
+        best_factors = (user_factors.copy(), item_factors.copy())
+        start_time = time.perf_counter()
+        
+        with ThreadPoolExecutor(max_workers=self.n_threads) as pool:
+            for iteration in range(1, self.iterations + 1):
+                self._update(pool, train, user_factors, item_factors)
+                self._update(pool, train_t, item_factors, user_factors)
+                
+                if validation is None:
+                    self.best_iteration = iteration
+                    continue
+                
+                recall = self.evaluate(train, validation, user_factors, item_factors, self.eval_k,
+                                       self.max_eval_users, rng)
+                self.history.append({
+                    'iteration': iteration,
+                    'recall': recall,
+                    'seconds': time.perf_counter() - start_time
+                })
+                
+                if recall > best_recall:
+                    best_recall = recall
+                    self.best_iteration = iteration
+                    best_factors = (user_factors.copy(), item_factors.copy())
+                elif iteration - self.best_iteration >= self.patience:
+                    break
+            
+            if validation is not None:
+                # 恢复验证集上最好的因子，再在包含验证集的全部数据上更新一轮
+                user_factors, item_factors = best_factors
+                self._update(pool, matrix, user_factors, item_factors)
+                self._update(pool, matrix.T.tocsr(), item_factors, user_factors)
+        
+        self.user_factors = user_factors
+        self.item_factors = item_factors
+        return self
+    
+    def _update(self, pool: ThreadPoolExecutor, matrix, factors: np.ndarray, fixed_factors: np.ndarray):
+        """固定另一边的因子，分块并行更新matrix各行对应的因子
+        
+        Args:
+            pool: 线程池
+            matrix: 行为待更新一方的CSR矩阵
+            factors: 待更新的因子，原地修改
+            fixed_factors: 固定的另一边的因子
+        """
+        gram = fixed_factors.T @ fixed_factors + self.regularization * np.eye(self.n_factors, dtype='float32')
+        blocks = range(0, matrix.shape[0], self.block_size)
+        
+        def solve_block(start):
+            end = min(start + self.block_size, matrix.shape[0])
+            factors[start:end] = self.solve(matrix[start:end], fixed_factors, factors[start:end], gram,
+                                            self.alpha, self.cg_steps, self.positive_rating)
+        
+        # list()等待所有块完成并抛出线程中的异常
+        list(pool.map(solve_block, blocks))
+    
+    @staticmethod
+    def solve(rows, fixed_factors: np.ndarray, initial: np.ndarray, gram: np.ndarray,
+              alpha: float, cg_steps: int, positive_rating: float = 3.0) -> np.ndarray:
+        """用共轭梯度求解一组行的因子
+        
+        每行求解(YᵀY + λI + Yᵀ(Cᵤ-I)Y)x = YᵀCᵤp，其中Y为固定的因子，Cᵤ为该行的置信度，
+        评分不低于positive_rating的项偏好p为1，更低的偏好为0。所有行同时迭代，每步只需两次稀疏矩阵乘法
+        
+        Args:
+            rows: 待求解行的CSR矩阵，值为评分
+            fixed_factors: 固定的另一边的因子
+            initial: 迭代的初始值
+            gram: YᵀY + λI
+            alpha: 置信度系数
+            cg_steps: 迭代步数
+            positive_rating: 视为正反馈的最低评分
+        
+        Returns:
+            求解后的因子
+        """
+        n_rows = rows.shape[0]
+        row_ids = np.repeat(np.arange(n_rows), np.diff(rows.indptr))
+        neighbor_factors = fixed_factors[rows.indices]
+        # 置信度减1，即未观察到的项之外多出的权重；低分的置信度随评分降低而增大
+        positive = rows.data >= positive_rating
+        extra = alpha * np.where(positive, rows.data, positive_rating - rows.data)
+        
+        def weighted_sum(weights):
+            return csr_matrix((weights, rows.indices, rows.indptr), shape=rows.shape) @ fixed_factors
+        
+        def apply(vectors):
+            dots = np.einsum('ij,ij->i', neighbor_factors, vectors[row_ids])
+            return vectors @ gram + weighted_sum(extra * dots)
+        
+        x = np.array(initial, dtype='float32')
+        # 右端YᵀCᵤp只包含偏好为1的项
+        residual = weighted_sum(np.where(positive, 1.0 + extra, 0.0)) - apply(x)
+        direction = residual.copy()
+        residual_norm = np.einsum('ij,ij->i', residual, residual)
+        
+        for _ in range(cg_steps):
+            applied = apply(direction)
+            denominator = np.einsum('ij,ij->i', direction, applied)
+            step = np.divide(residual_norm, denominator, out=np.zeros_like(residual_norm), where=denominator > 1e-20)
+            x += step[:, None] * direction
+            residual -= step[:, None] * applied
+            new_norm = np.einsum('ij,ij->i', residual, residual)
+            if new_norm.max(initial=0.0) < 1e-10:
+                break
+            beta = np.divide(new_norm, residual_norm, out=np.zeros_like(new_norm), where=residual_norm > 1e-20)
+            direction = residual + beta[:, None] * direction
+            residual_norm = new_norm
+        
+        return x
+    
+    @staticmethod
+    def split(matrix, fraction: float, rng: np.random.Generator) -> Tuple[Any, Any]:
+        """每个用户随机留出一部分交互作为验证集，每个用户至少保留一条训练交互
+        
+        Args:
+            matrix: 用户-物品CSR矩阵
+            fraction: 留出的比例
+            rng: 随机数生成器
+        
+        Returns:
+            (训练矩阵, 验证矩阵)，形状都与matrix相同
+        """
+        counts = np.diff(matrix.indptr)
+        held_out = rng.random(matrix.nnz) < fraction
+        
+        # 每个有交互的用户随机保护一条交互
+        users = np.flatnonzero(counts)
+        protected = matrix.indptr[users] + (rng.random(len(users)) * counts[users]).astype('int64')
+        held_out[protected] = False
+        
+        def subset(mask):
+            result = matrix.copy()
+            result.data = np.where(mask, result.data, 0).astype(result.dtype)
+            result.eliminate_zeros()
+            return result
+        
+        return subset(~held_out), subset(held_out)
+    
+    @staticmethod
+    def evaluate(train, validation, user_factors: np.ndarray, item_factors: np.ndarray, k: int = 10,
+                 max_users: int = 5000, rng: np.random.Generator = None, block_size: int = 1024) -> float:
+        """计算验证集上的Recall@K
+        
+        对每个有验证交互的用户，为训练集之外的所有物品打分取前K个，
+        命中数除以min(K, 验证交互数)，再对用户取平均
+        
+        Args:
+            train: 训练矩阵，其中的物品不参与排序
+            validation: 验证矩阵
+            user_factors: 用户因子
+            item_factors: 物品因子
+            k: 推荐数量
+            max_users: 最多评估的用户数
+            rng: 抽样用的随机数生成器
+            block_size: 每次打分的用户数
+        
+        Returns:
+            平均Recall@K，没有验证用户时为0
+        """
+        users = np.flatnonzero(np.diff(validation.indptr))
+        if len(users) > max_users:
+            users = (rng or np.random.default_rng()).choice(users, max_users, replace=False)
+        if not len(users):
+            return 0.0
+        
+        k = min(k, item_factors.shape[0])
+        recall_sum = 0.0
+        for start in range(0, len(users), block_size):
+            block = users[start:start + block_size]
+            scores = user_factors[block] @ item_factors.T
+            
+            # 训练集中的物品不参与排序
+            seen = train[block]
+            scores[np.repeat(np.arange(len(block)), np.diff(seen.indptr)), seen.indices] = -np.inf
+            top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+            
+            expected = validation[block]
+            hits = np.asarray(expected[np.arange(len(block))[:, None], top].astype(bool).sum(axis=1)).ravel()
+            recall_sum += (hits / np.minimum(k, np.diff(expected.indptr))).sum()
+        
+        return float(recall_sum / len(users))
+
+
 class CollaborativeFilterRecommender:
     """协同过滤推荐系统
     
-    基于用户行为和偏好进行景点和美食推荐
+    基于用户行为和偏好进行景点和美食推荐。
+    用户-物品评分矩阵以scipy.sparse的CSR（按用户取行）和CSC（按物品取列）格式保存，
+    内存与交互记录数成正比，而不是用户数×物品数；没有scipy时退回到稠密矩阵
     """
     
-    def __init__(self, use_svd: bool = True):
+    # 缓存的用户邻居数量上限，超过后清空
+    MAX_NEIGHBOR_CACHE_SIZE = 10000
+    
+    def __init__(self, use_svd: bool = True, n_neighbors: int = 50, factorization: str = 'svd',
+                 als_options: Dict[str, Any] = None):
         """初始化推荐器
         
         Args:
-            use_svd: 是否使用奇异值分解(SVD)进行矩阵分解，如果为False则使用基础的协同过滤
+            use_svd: 是否进行矩阵分解，如果为False则使用基础的协同过滤
+            n_neighbors: 离线为每个物品保留的相似物品数量，为0时基于物品的预测逐对计算相似度
+            factorization: 矩阵分解方法，'svd'为对中心化评分做奇异值分解，
+                'als'为隐式反馈的加权交替最小二乘（ImplicitALS），适合浏览、点赞等隐式行为
+            als_options: 传给ImplicitALS的参数，如n_factors、iterations、n_threads
         """
         self.use_svd = use_svd and SCIPY_AVAILABLE
+        self.n_neighbors = n_neighbors
+        self.factorization = factorization
+        self.als_options = als_options or {}
+        # 最近一次ALS训练的验证记录
+        self.training_history = []
         self.user_item_matrix = None
+        # 同一矩阵的CSC副本，用于按物品取评分
+        self.item_user_matrix = None
         self.user_factors = None
         self.item_factors = None
+        # 物品的Top-K相似物品表，由build_item_neighbors生成
+        self.item_neighbors = None
+        # (用户索引, k) -> 该用户的Top-k相似用户，矩阵重建时清空
+        self._user_neighbor_cache = {}
         self.user_means = None
         self.item_means = None
         self.user_indices = {}
         self.item_indices = {}
         self.items = []
         self.users = []
+        # 已读取的最大交互记录ID，refresh_from_log从这里继续读取
+        self.last_interaction_id = 0
     
     def _build_user_item_matrix(self, interactions: List[Dict[str, Any]], item_type: str = 'place'):
         """构建用户-物品交互矩阵
         
+        一次性收集(用户, 物品, 评分)数组后用coo_matrix批量构建，再转换为CSR和CSC。
+        同一用户对同一物品有多条记录时以最后一条为准
+        
         Args:
             interactions: 用户与物品的交互记录列表，每个记录包含user_id, item_id和rating
             item_type: 物品类型，'place'或'food'
         """
-        # 创建用户和物品的索引映射
-        user_ids = set()
-        item_ids = set()
+        user_ids = np.asarray([interaction['user_id'] for interaction in interactions])
+        item_ids = np.asarray([interaction['item_id'] for interaction in interactions])
+        ratings = np.asarray([interaction['rating'] for interaction in interactions], dtype='float64')
         
-        for interaction in interactions:
-            user_ids.add(interaction['user_id'])
-            item_ids.add(interaction['item_id'])
+        # 创建用户和物品的索引映射，np.unique返回排序后的ID和每条记录对应的下标
+        users, rows = np.unique(user_ids, return_inverse=True)
+        items, cols = np.unique(item_ids, return_inverse=True)
         
-        self.users = sorted(list(user_ids))
-        self.items = sorted(list(item_ids))
+        self.users = users.tolist()
+        self.items = items.tolist()
         
         self.user_indices = {user_id: i for i, user_id in enumerate(self.users)}
         self.item_indices = {item_id: i for i, item_id in enumerate(self.items)}
         
-        # 创建用户-物品矩阵
-        matrix = np.zeros((len(self.users), len(self.items)))
+        # 去掉重复的(用户, 物品)，保留最后一条；评分为0的记录不算作交互
+        if len(ratings):
+            keys = rows.astype('int64') * len(self.items) + cols
+            _, last = np.unique(keys[::-1], return_index=True)
+            keep = len(keys) - 1 - last
+            keep = keep[ratings[keep] != 0]
+            rows, cols, ratings = rows[keep], cols[keep], ratings[keep]
+        
+        shape = (len(self.users), len(self.items))
+        self._user_neighbor_cache = {}
+        
+        if SCIPY_AVAILABLE:
+            # coo转换为csr时按行列排序，每行的物品下标有序
+            self.user_item_matrix = coo_matrix((ratings, (rows, cols)), shape=shape).tocsr()
+            self.item_user_matrix = self.user_item_matrix.tocsc()
+        else:
+            matrix = np.zeros(shape)
+            matrix[rows, cols] = ratings
+            self.user_item_matrix = matrix
+            self.item_user_matrix = matrix
+        
+        # 进行矩阵分解
+        if self.use_svd and SCIPY_AVAILABLE:
+            if self.factorization == 'als':
+                self._perform_als()
+            else:
+                self._perform_svd()
+        
+        # 预先计算物品的相似物品表
+        self.item_neighbors = None
+        if self.n_neighbors > 0:
+            self.build_item_neighbors(self.n_neighbors)
+    
+    def build_item_neighbors(self, k: int = 50, block_size: int = 256) -> ItemNeighborTable:
+        """离线计算每个物品的Top-K相似物品表，之后基于物品的预测只查表
+        
+        相似度为两个物品评分向量（全部用户）的余弦，而不是只在共同评分用户上计算，
+        这样只有一个共同用户的物品不会得到1.0的相似度
+        
+        Args:
+            k: 每个物品保留的邻居数量
+            block_size: 每次计算相似度的物品数
+        
+        Returns:
+            邻居表
+        """
+        self.item_neighbors = ItemNeighborTable.build(self.user_item_matrix, k=k, block_size=block_size)
+        return self.item_neighbors
+    
+    def train_from_log(self, item_type: str = 'place'):
+        """从交互记录表读取全部记录训练模型
+        
+        Args:
+            item_type: 物品类型，'place'或'food'
+        """
+        interactions, self.last_interaction_id = load_interactions(item_type)
+        self._build_user_item_matrix(interactions, item_type=item_type)
+    
+    def refresh_from_log(self, item_type: str = 'place') -> Dict[str, int]:
+        """读取上次训练或刷新之后的新交互记录，增量加入模型
+        
+        Args:
+            item_type: 物品类型
+        
+        Returns:
+            fold_in的统计结果
+        """
+        after_id = self.last_interaction_id
+        interactions, self.last_interaction_id = load_interactions(item_type, after_id=after_id)
+        
+        # 被取消点赞的(用户, 物品)按全部历史重新合并，替换新记录单独合并的结果
+        unliked = load_unliked_interactions(item_type, after_id, self.last_interaction_id)
+        if unliked:
+            keys = {(interaction['user_id'], interaction['item_id']) for interaction in unliked}
+            interactions = [interaction for interaction in interactions
+                            if (interaction['user_id'], interaction['item_id']) not in keys] + unliked
+        
+        return self.fold_in(interactions)
+    
+    def fold_in(self, interactions: List[Dict[str, Any]]) -> Dict[str, int]:
+        """把新的交互记录增量加入模型，不重新训练
         
+        新用户和新物品追加到索引映射末尾；评分矩阵加上新旧评分之差；
+        矩阵分解因子只为受影响的用户和新物品求解，求解方式与训练时一致（见_fold_in_factors）。已有物品的因子、物品邻居表不变，新物品在下次完整训练前没有邻居。
+        所有新的矩阵和映射计算完成后才替换旧对象，其他线程可以在更新期间继续用旧模型预测
+        
+        Args:
+            interactions: 交互记录列表，每个记录包含user_id, item_id和rating，
+                可选的explicit为False时表示隐式行为，不会降低已有评分；
+                explicit不为False且rating为0时删除模型中已有的评分
+        
+        Returns:
+            {'interactions': 加入的记录数, 'new_users': 新用户数, 'new_items': 新物品数}
+        """
+        stats = {'interactions': 0, 'new_users': 0, 'new_items': 0}
+        if self.user_item_matrix is None or not self.users:
+            interactions = [interaction for interaction in interactions if interaction['rating']]
+            if not interactions:
+                return stats
+            self._build_user_item_matrix(interactions)
+            stats.update(interactions=len(interactions), new_users=len(self.users), new_items=len(self.items))
+            return stats
+        
+        # 评分为0的记录只用于删除已有的(用户, 物品)评分
+        interactions = [interaction for interaction in interactions
+                        if interaction['rating'] or (interaction.get('explicit', True)
+                                                     and interaction['user_id'] in self.user_indices
+                                                     and interaction['item_id'] in self.item_indices)]
+        if not interactions:
+            return stats
+        
+        n_users, n_items = len(self.users), len(self.items)
+        users, items = list(self.users), list(self.items)
+        user_indices, item_indices = dict(self.user_indices), dict(self.item_indices)
+        
+        # 新用户和新物品追加到映射末尾，已有索引不变
         for interaction in interactions:
-            user_idx = self.user_indices.get(interaction['user_id'])
-            item_idx = self.item_indices.get(interaction['item_id'])
+            if interaction['user_id'] not in user_indices:
+                user_indices[interaction['user_id']] = len(users)
+                users.append(interaction['user_id'])
+            if interaction['item_id'] not in item_indices:
+                item_indices[interaction['item_id']] = len(items)
+                items.append(interaction['item_id'])
+        
+        rows = np.asarray([user_indices[interaction['user_id']] for interaction in interactions], dtype='int64')
+        cols = np.asarray([item_indices[interaction['item_id']] for interaction in interactions], dtype='int64')
+        ratings = np.asarray([interaction['rating'] for interaction in interactions], dtype='float64')
+        explicit = np.asarray([interaction.get('explicit', True) for interaction in interactions], dtype=bool)
+        
+        # 同一(用户, 物品)保留最后一条
+        keys = rows * len(items) + cols
+        _, last = np.unique(keys[::-1], return_index=True)
+        keep = len(keys) - 1 - last
+        rows, cols, ratings, explicit = rows[keep], cols[keep], ratings[keep], explicit[keep]
+        
+        shape = (len(users), len(items))
+        matrix = self.user_item_matrix
+        
+        # 已有评分，新用户和新物品为0
+        current = np.zeros(len(rows))
+        known = (rows < n_users) & (cols < n_items)
+        if SCIPY_AVAILABLE:
+            current[known] = np.asarray(matrix[rows[known], cols[known]]).ravel()
+            # 共用原矩阵的数据数组，只在末尾补上新用户的空行并扩大列数
+            matrix = csr_matrix((matrix.data, matrix.indices,
+                                 np.concatenate([matrix.indptr, np.full(shape[0] - n_users, matrix.indptr[-1])])),
+                                shape=shape)
+        else:
+            current[known] = matrix[rows[known], cols[known]]
+            matrix = np.pad(matrix, ((0, shape[0] - n_users), (0, shape[1] - n_items)))
+        
+        # 隐式行为不降低已有评分
+        ratings = np.where(explicit, ratings, np.maximum(ratings, current))
+        
+        if SCIPY_AVAILABLE:
+            matrix = (matrix + coo_matrix((ratings - current, (rows, cols)), shape=shape).tocsr()).tocsr()
+            matrix.eliminate_zeros()
+            matrix.sort_indices()
+            item_user_matrix = matrix.tocsc()
+        else:
+            matrix[rows, cols] = ratings
+            item_user_matrix = matrix
+        
+        new_items = np.arange(n_items, shape[1])
+        item_neighbors = self.item_neighbors
+        if item_neighbors is not None and len(new_items):
+            k = item_neighbors.k
+            item_neighbors = ItemNeighborTable(
+                np.vstack([item_neighbors.neighbors, np.full((len(new_items), k), -1, dtype='int32')]),
+                np.vstack([item_neighbors.similarities, np.zeros((len(new_items), k), dtype='float32')])
+            )
+        
+        factors = None
+        if self.user_factors is not None:
+            factors = self._fold_in_factors(matrix, item_user_matrix, np.unique(rows), new_items, n_users)
+        
+        # 替换模型状态，先替换矩阵和因子，最后替换映射，映射中的新索引总能在矩阵中找到
+        self.user_item_matrix, self.item_user_matrix = matrix, item_user_matrix
+        self.item_neighbors = item_neighbors
+        if factors is not None:
+            self.user_factors, self.item_factors, self.user_means = factors
+        self._user_neighbor_cache = {}
+        self.users, self.items = users, items
+        self.user_indices, self.item_indices = user_indices, item_indices
+        
+        stats.update(interactions=len(rows), new_users=shape[0] - n_users, new_items=len(new_items))
+        return stats
+    
+    def _fold_in_factors(self, matrix, item_user_matrix, affected_users: np.ndarray, new_items: np.ndarray,
+                         n_old_users: int) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """为受影响的用户和新物品求解矩阵分解因子
+        
+        ALS模型用ImplicitALS.solve求解与训练时相同的加权最小二乘问题，正则系数和置信度系数取自模型的ALS参数。
+        SVD训练把缺失评分视为用户平均分（中心化后为0），训练得到的因子满足用户因子 = X·V、物品因子 = Xᵀ·用户因子/σ²
+        （X为中心化的评分矩阵，σ为奇异值），这里按同样的投影计算，不引入训练时没有的正则项
+        
+        Args:
+            matrix: 加入新评分后的用户-物品矩阵
+            item_user_matrix: 同一矩阵的CSC副本
+            affected_users: 有新评分的用户索引
+            new_items: 新物品的索引
+            n_old_users: 加入新用户前的用户数
+        
+        Returns:
+            (用户因子, 物品因子, 用户平均分)，都是新数组
+        """
+        n_factors = self.user_factors.shape[1]
+        n_new_users = matrix.shape[0] - n_old_users
+        dtype = self.user_factors.dtype
+        
+        user_factors = np.vstack([self.user_factors, np.zeros((n_new_users, n_factors), dtype=dtype)])
+        item_factors = np.vstack([self.item_factors, np.zeros((len(new_items), n_factors), dtype=dtype)])
+        user_means = np.concatenate([self.user_means, np.zeros(n_new_users)])
+        
+        def user_row(user_idx):
+            start, end = matrix.indptr[user_idx], matrix.indptr[user_idx + 1]
+            return matrix.indices[start:end], matrix.data[start:end]
+        
+        # 先更新受影响用户的平均分
+        for user_idx in affected_users:
+            _, values = user_row(user_idx)
+            user_means[user_idx] = values.mean() if len(values) else 0.0
+        
+        if self.factorization == 'als':
+            als = ImplicitALS(**self.als_options)
+            
+            def solve(rows, indices, factors, fixed_factors):
+                # 共轭梯度迭代n_factors步即得到精确解
+                gram = fixed_factors.T @ fixed_factors + als.regularization * np.eye(n_factors, dtype=dtype)
+                factors[indices] = ImplicitALS.solve(rows.astype(dtype), fixed_factors, factors[indices], gram,
+                                                     als.alpha, n_factors, als.positive_rating)
+            
+            # 新物品只使用已有用户的交互，与SVD的处理相同
+            if len(new_items):
+                new_item_rows = item_user_matrix[:, new_items].T.tocsr()
+                new_item_rows = new_item_rows[:, :n_old_users]
+                solve(new_item_rows, new_items, item_factors, user_factors[:n_old_users])
+            if len(affected_users):
+                solve(matrix[affected_users], affected_users, user_factors, item_factors)
             
-            if user_idx is not None and item_idx is not None:
-                matrix[user_idx, item_idx] = interaction['rating']
+            return user_factors, item_factors, user_means
+        
+        # 奇异值的平方，即训练时各列用户因子的平方和
+        singular_values_sq = (self.user_factors.astype('float64') ** 2).sum(axis=0)
+        scale = np.divide(1.0, singular_values_sq, out=np.zeros(n_factors), where=singular_values_sq > 0)
+        
+        # 已有用户的因子投影出新物品的因子，只使用已有用户的交互
+        for item_idx in new_items:
+            start, end = item_user_matrix.indptr[item_idx], item_user_matrix.indptr[item_idx + 1]
+            users, values = item_user_matrix.indices[start:end], item_user_matrix.data[start:end]
+            known = users < n_old_users
+            users, values = users[known], values[known]
+            if len(users):
+                item_factors[item_idx] = ((values - user_means[users]) @ user_factors[users]) * scale
+        
+        # 物品因子投影出受影响用户的因子
+        for user_idx in affected_users:
+            items, values = user_row(user_idx)
+            user_factors[user_idx] = (values - user_means[user_idx]) @ item_factors[items] if len(items) else 0.0
+        
+        return user_factors, item_factors, user_means
+    
+    def save(self, path: str):
+        """保存训练好的模型
         
-        self.user_item_matrix = matrix
+        写入以path为前缀的一组文件：.json为元数据，.ids.npz为用户和物品ID，.matrix.npz为评分矩阵，
+        .user_factors.npy/.item_factors.npy/.user_means.npy为矩阵分解因子，.neighbors.npz为物品邻居表
         
-        # 如果使用SVD，则进行矩阵分解
-        if self.use_svd and SCIPY_AVAILABLE:
-            self._perform_svd()
+        Args:
+            path: 文件路径前缀，如<版本目录>/place.cf
+        """
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        
+        np.savez(f"{path}.ids.npz", users=np.asarray(self.users, dtype='int64'),
+                 items=np.asarray(self.items, dtype='int64'))
+        
+        if SCIPY_AVAILABLE:
+            save_npz(f"{path}.matrix.npz", csr_matrix(self.user_item_matrix))
+        else:
+            np.savez(f"{path}.matrix.npz", dense=self.user_item_matrix)
+        
+        has_factors = self.user_factors is not None
+        if has_factors:
+            np.save(f"{path}.user_factors.npy", np.ascontiguousarray(self.user_factors))
+            np.save(f"{path}.item_factors.npy", np.ascontiguousarray(self.item_factors))
+            np.save(f"{path}.user_means.npy", np.ascontiguousarray(self.user_means))
+        
+        if self.item_neighbors is not None:
+            self.item_neighbors.save(f"{path}.neighbors.npz")
+        
+        # 元数据最后写入，作为文件完整的标志
+        with open(f"{path}.json", 'w', encoding='utf-8') as f:
+            json.dump({
+                'n_users': len(self.users),
+                'n_items': len(self.items),
+                'use_svd': self.use_svd,
+                'factorization': self.factorization,
+                'n_neighbors': self.n_neighbors,
+                'has_factors': has_factors,
+                'has_neighbors': self.item_neighbors is not None,
+                'last_interaction_id': int(self.last_interaction_id),
+                'trained_at': time.strftime('%Y-%m-%d %H:%M:%S')
+            }, f)
+    
+    def load(self, path: str, mmap: bool = True) -> bool:
+        """加载save保存的模型
+        
+        Args:
+            path: 文件路径前缀
+            mmap: 是否以内存映射方式加载矩阵分解因子
+        
+        Returns:
+            是否找到并加载了模型
+        """
+        if not os.path.exists(f"{path}.json"):
+            return False
+        
+        with open(f"{path}.json", 'r', encoding='utf-8') as f:
+            meta = json.load(f)
+        
+        with np.load(f"{path}.ids.npz") as ids:
+            users, items = ids['users'].tolist(), ids['items'].tolist()
+        
+        if SCIPY_AVAILABLE:
+            matrix = load_npz(f"{path}.matrix.npz").tocsr()
+            matrix.sort_indices()
+            item_user_matrix = matrix.tocsc()
+        else:
+            with np.load(f"{path}.matrix.npz") as data:
+                matrix = item_user_matrix = data['dense'] if 'dense' in data else None
+            if matrix is None:
+                print(f"Cannot load sparse CF matrix without scipy: {path}")
+                return False
+        
+        mmap_mode = 'r' if mmap else None
+        if meta.get('has_factors'):
+            self.user_factors = np.load(f"{path}.user_factors.npy", mmap_mode=mmap_mode)
+            self.item_factors = np.load(f"{path}.item_factors.npy", mmap_mode=mmap_mode)
+            self.user_means = np.load(f"{path}.user_means.npy")
+        else:
+            self.user_factors = self.item_factors = self.user_means = None
+        
+        self.item_neighbors = ItemNeighborTable.load(f"{path}.neighbors.npz") if meta.get('has_neighbors') else None
+        self.user_item_matrix, self.item_user_matrix = matrix, item_user_matrix
+        self.use_svd = meta.get('use_svd', self.use_svd) and SCIPY_AVAILABLE
+        self.factorization = meta.get('factorization', 'svd')
+        self.n_neighbors = meta.get('n_neighbors', self.n_neighbors)
+        self.last_interaction_id = meta.get('last_interaction_id', 0)
+        self._user_neighbor_cache = {}
+        self.users, self.items = users, items
+        self.user_indices = {user_id: i for i, user_id in enumerate(users)}
+        self.item_indices = {item_id: i for i, item_id in enumerate(items)}
+        
+        return True
+    
+    def _user_ratings(self, user_idx: int) -> Tuple[np.ndarray, np.ndarray]:
+        """获取用户评分过的物品
+        
+        Args:
+            user_idx: 用户索引
+        
+        Returns:
+            (按升序排列的物品索引, 对应的评分)
+        """
+        matrix = self.user_item_matrix
+        if not SCIPY_AVAILABLE:
+            indices = np.flatnonzero(matrix[user_idx])
+            return indices, matrix[user_idx, indices]
+        
+        start, end = matrix.indptr[user_idx], matrix.indptr[user_idx + 1]
+        return matrix.indices[start:end], matrix.data[start:end]
+    
+    def _item_ratings(self, item_idx: int) -> Tuple[np.ndarray, np.ndarray]:
+        """获取对物品评分过的用户
+        
+        Args:
+            item_idx: 物品索引
+        
+        Returns:
+            (按升序排列的用户索引, 对应的评分)
+        """
+        matrix = self.item_user_matrix
+        if not SCIPY_AVAILABLE:
+            indices = np.flatnonzero(matrix[:, item_idx])
+            return indices, matrix[indices, item_idx]
+        
+        start, end = matrix.indptr[item_idx], matrix.indptr[item_idx + 1]
+        return matrix.indices[start:end], matrix.data[start:end]
+    
+    def _get_rating(self, user_idx: int, item_idx: int) -> float:
+        """读取用户对物品的评分，没有评分时返回0"""
+        indices, values = self._user_ratings(user_idx)
+        pos = np.searchsorted(indices, item_idx)
+        if pos < len(indices) and indices[pos] == item_idx:
+            return float(values[pos])
+        return 0.0
+    
+    def _user_mean_rating(self, user_idx: int) -> float:
+        """用户的平均评分，没有评分时返回默认值3.0"""
+        _, values = self._user_ratings(user_idx)
+        positive = values[values > 0]
+        return float(np.mean(positive)) if len(positive) else 3.0
+    
+    def _perform_als(self):
+        """使用隐式反馈的加权ALS进行矩阵分解
+        
+        用户平均分仍然计算并保存，因子的点积为偏好程度而不是相对平均分的偏差
+        """
+        matrix = self.user_item_matrix
+        if min(matrix.shape) < 1:
+            self.user_factors = None
+            self.item_factors = None
+            return
+        
+        counts = np.diff(matrix.indptr)
+        sums = np.asarray(matrix.sum(axis=1)).ravel()
+        self.user_means = np.divide(sums, counts, out=np.zeros(len(counts)), where=counts > 0)
+        
+        als = ImplicitALS(**self.als_options).fit(matrix)
+        self.user_factors = als.user_factors
+        self.item_factors = als.item_factors
+        self.training_history = als.history
     
     def _perform_svd(self, n_factors: int = 20):
         """使用SVD进行矩阵分解
         
+        只对已有评分减去用户平均分，缺失项保持为0（即视为等于用户平均分），
+        矩阵保持稀疏，直接交给scipy.sparse.linalg.svds
+        
         Args:
             n_factors: 潜在因子数量
         """
@@ -94,20 +1056,33 @@ class CollaborativeFilterRecommender:
             print("SVD not available. Using fallback methods.")
             return
         
-        # 计算每个用户的平均评分
-        self.user_means = np.mean(self.user_item_matrix, axis=1)
+        matrix = self.user_item_matrix
+        k = min(n_factors, min(matrix.shape) - 1)
+        if k < 1:
+            self.user_factors = None
+            self.item_factors = None
+            return
+        
+        # 计算每个用户已有评分的平均值
+        counts = np.diff(matrix.indptr)
+        sums = np.asarray(matrix.sum(axis=1)).ravel()
+        self.user_means = np.divide(sums, counts, out=np.zeros(len(counts)), where=counts > 0)
         
-        # 中心化矩阵
-        matrix_centered = self.user_item_matrix - self.user_means.reshape(-1, 1)
+        # 中心化已有评分，稀疏结构不变
+        matrix_centered = csr_matrix((matrix.data - np.repeat(self.user_means, counts), matrix.indices, matrix.indptr),
+                                     shape=matrix.shape)
         
-        # 转换为稀疏矩阵
-        matrix_sparse = csr_matrix(matrix_centered)
+        # 所有用户的评分都等于各自的平均分（例如只有浏览记录）时没有可分解的结构，ARPACK会报错
+        if not np.any(matrix_centered.data):
+            self.user_factors = np.zeros((matrix.shape[0], k))
+            self.item_factors = np.zeros((matrix.shape[1], k))
+            return
         
         # 执行SVD
-        u, sigma, vt = svds(matrix_sparse, k=min(n_factors, min(matrix_sparse.shape)-1))
+        u, sigma, vt = svds(matrix_centered, k=k)
         
-        # 重构用户和物品因子
-        self.user_factors = u
+        # 重构用户和物品因子，奇异值并入用户因子，使两者点积即为中心化后的评分
+        self.user_factors = u * sigma
         self.item_factors = vt.T
     
     def _calculate_similarity_user_based(self, user1_idx: int, user2_idx: int) -> float:
@@ -116,31 +1091,14 @@ class CollaborativeFilterRecommender:
         Args:
             user1_idx: 第一个用户的索引
             user2_idx: 第二个用户的索引
-            
+        
         Returns:
             两个用户的余弦相似度
         """
-        user1_vector = self.user_item_matrix[user1_idx]
-        user2_vector = self.user_item_matrix[user2_idx]
+        items1, ratings1 = self._user_ratings(user1_idx)
+        items2, ratings2 = self._user_ratings(user2_idx)
         
-        # 只考虑两个用户都有评分的物品
-        mask = np.logical_and(user1_vector > 0, user2_vector > 0)
-        
-        if not np.any(mask):
-            return 0.0
-        
-        user1_filtered = user1_vector[mask]
-        user2_filtered = user2_vector[mask]
-        
-        # 计算余弦相似度
-        dot_product = np.dot(user1_filtered, user2_filtered)
-        norm1 = np.linalg.norm(user1_filtered)
-        norm2 = np.linalg.norm(user2_filtered)
-        
-        if norm1 == 0 or norm2 == 0:
-            return 0.0
-        
-        return dot_product / (norm1 * norm2)
+        return self._cosine_on_common(items1, ratings1, items2, ratings2)
     
     def _calculate_similarity_item_based(self, item1_idx: int, item2_idx: int) -> float:
         """计算两个物品的相似度
@@ -148,59 +1106,212 @@ class CollaborativeFilterRecommender:
         Args:
             item1_idx: 第一个物品的索引
             item2_idx: 第二个物品的索引
-            
+        
         Returns:
             两个物品的余弦相似度
         """
-        item1_vector = self.user_item_matrix[:, item1_idx]
-        item2_vector = self.user_item_matrix[:, item2_idx]
+        users1, ratings1 = self._item_ratings(item1_idx)
+        users2, ratings2 = self._item_ratings(item2_idx)
+        
+        return self._cosine_on_common(users1, ratings1, users2, ratings2)
+    
+    @staticmethod
+    def _cosine_on_common(indices1: np.ndarray, values1: np.ndarray,
+                          indices2: np.ndarray, values2: np.ndarray) -> float:
+        """只在两个稀疏向量共同的非零位置上计算余弦相似度
         
-        # 只考虑对两个物品都有评分的用户
-        mask = np.logical_and(item1_vector > 0, item2_vector > 0)
+        Args:
+            indices1: 第一个向量的非零位置（升序）
+            values1: 第一个向量的非零值
+            indices2: 第二个向量的非零位置（升序）
+            values2: 第二个向量的非零值
         
-        if not np.any(mask):
+        Returns:
+            余弦相似度，没有共同位置时为0
+        """
+        # 只考虑两边都有正评分的位置
+        positive1, positive2 = values1 > 0, values2 > 0
+        _, pos1, pos2 = np.intersect1d(indices1[positive1], indices2[positive2],
+                                       assume_unique=True, return_indices=True)
+        
+        if len(pos1) == 0:
             return 0.0
         
-        item1_filtered = item1_vector[mask]
-        item2_filtered = item2_vector[mask]
+        filtered1 = values1[positive1][pos1]
+        filtered2 = values2[positive2][pos2]
         
         # 计算余弦相似度
-        dot_product = np.dot(item1_filtered, item2_filtered)
-        norm1 = np.linalg.norm(item1_filtered)
-        norm2 = np.linalg.norm(item2_filtered)
+        dot_product = np.dot(filtered1, filtered2)
+        norm1 = np.linalg.norm(filtered1)
+        norm2 = np.linalg.norm(filtered2)
         
         if norm1 == 0 or norm2 == 0:
             return 0.0
         
         return dot_product / (norm1 * norm2)
     
-    def _predict_rating_user_based(self, user_idx: int, item_idx: int, k: int = 10) -> float:
+    def _user_similarities(self, user_idx: int) -> np.ndarray:
+        """一次计算用户与所有用户的相似度
+        
+        与_calculate_similarity_user_based相同，余弦只在两人都有正评分的物品上计算；
+        只取出该用户评分过的物品列，用三次稀疏矩阵-向量乘法得到点积和两边在共同物品上的范数
+        
+        Args:
+            user_idx: 用户索引
+        
+        Returns:
+            形状为(用户数,)的相似度，用户自身为0
+        """
+        n_users = len(self.users)
+        items, values = self._user_ratings(user_idx)
+        positive = values > 0
+        items, values = items[positive], values[positive]
+        
+        if not len(items):
+            return np.zeros(n_users)
+        
+        # 用户数×该用户评分过的物品数
+        if SCIPY_AVAILABLE:
+            columns = self.item_user_matrix[:, items].maximum(0).tocsr()
+            columns.eliminate_zeros()
+            rated = columns.sign()
+            squared = columns.multiply(columns)
+        else:
+            columns = np.maximum(self.user_item_matrix[:, items], 0)
+            rated = (columns > 0).astype('float64')
+            squared = columns ** 2
+        
+        dot_products = columns @ values
+        own_norms = np.sqrt(rated @ (values ** 2))
+        other_norms = np.sqrt(squared @ np.ones(len(items)))
+        
+        norms = own_norms * other_norms
+        similarities = np.divide(dot_products, norms, out=np.zeros(n_users), where=norms > 0)
+        similarities[user_idx] = 0.0
+        
+        return similarities
+    
+    def _user_neighbors(self, user_idx: int, k: int = 50) -> Tuple[np.ndarray, np.ndarray]:
+        """获取用户最相似的k个用户，结果在矩阵重建前缓存
+        
+        Args:
+            user_idx: 用户索引
+            k: 邻居数量
+        
+        Returns:
+            (邻居用户索引, 相似度)，按相似度降序，只包含相似度为正的用户
+        """
+        key = (user_idx, k)
+        cached = self._user_neighbor_cache.get(key)
+        if cached is not None:
+            return cached
+        
+        similarities = self._user_similarities(user_idx)
+        candidates = np.flatnonzero(similarities > 0)
+        if len(candidates) > k:
+            candidates = candidates[np.argpartition(-similarities[candidates], k - 1)[:k]]
+        
+        neighbors = candidates[np.argsort(-similarities[candidates], kind='stable')]
+        result = (neighbors, similarities[neighbors])
+        
+        if len(self._user_neighbor_cache) >= self.MAX_NEIGHBOR_CACHE_SIZE:
+            self._user_neighbor_cache.clear()
+        self._user_neighbor_cache[key] = result
+        
+        return result
+    
+    def _predict_ratings_user_based(self, user_idx: int, item_indices: List[int], k: int = 50) -> np.ndarray:
+        """基于用户的协同过滤批量预测评分
+        
+        取用户的Top-k邻居，用一次(邻居相似度 × 邻居评分矩阵)乘积得到所有物品的加权评分和，
+        再除以对该物品有评分的邻居的相似度之和
+        
+        Args:
+            user_idx: 用户索引
+            item_indices: 待预测的物品索引
+            k: 邻居用户数量
+        
+        Returns:
+            与item_indices对应的预测评分，用户已评分的物品返回原评分，没有邻居评分的物品返回用户平均分
+        """
+        item_indices = np.asarray(item_indices, dtype='int64')
+        predictions = np.full(len(item_indices), self._user_mean_rating(user_idx))
+        
+        if not len(item_indices):
+            return predictions
+        
+        neighbors, similarities = self._user_neighbors(user_idx, k)
+        if len(neighbors):
+            if SCIPY_AVAILABLE:
+                neighbor_ratings = self.user_item_matrix[neighbors].maximum(0)
+                neighbor_rated = neighbor_ratings.sign()
+            else:
+                neighbor_ratings = np.maximum(self.user_item_matrix[neighbors], 0)
+                neighbor_rated = (neighbor_ratings > 0).astype('float64')
+            
+            weighted_sums = (neighbor_ratings.T @ similarities)[item_indices]
+            similarity_sums = (neighbor_rated.T @ similarities)[item_indices]
+            
+            has_neighbors = similarity_sums > 0
+            predictions[has_neighbors] = weighted_sums[has_neighbors] / similarity_sums[has_neighbors]
+        
+        # 用户已经评分的物品直接返回原评分
+        rated_items, rated_values = self._user_ratings(user_idx)
+        if len(rated_items):
+            pos = np.minimum(np.searchsorted(rated_items, item_indices), len(rated_items) - 1)
+            rated = (rated_items[pos] == item_indices) & (rated_values[pos] > 0)
+            predictions[rated] = rated_values[pos[rated]]
+        
+        return predictions
+    
+    def _predict_rating_user_based(self, user_idx: int, item_idx: int, k: int = 50) -> float:
         """基于用户的协同过滤预测评分
         
         Args:
             user_idx: 用户索引
             item_idx: 物品索引
             k: 考虑的最近邻数量
-            
+        
+        Returns:
+            预测的评分
+        """
+        return float(self._predict_ratings_user_based(user_idx, [item_idx], k)[0])
+    
+    def _predict_rating_item_based(self, user_idx: int, item_idx: int, k: int = 10) -> float:
+        """基于物品的协同过滤预测评分
+        
+        Args:
+            user_idx: 用户索引
+            item_idx: 物品索引
+            k: 考虑的最近邻数量
+        
         Returns:
             预测的评分
         """
         # 如果用户已经对该物品有评分，直接返回
-        if self.user_item_matrix[user_idx, item_idx] > 0:
-            return self.user_item_matrix[user_idx, item_idx]
+        rating = self._get_rating(user_idx, item_idx)
+        if rating > 0:
+            return rating
         
-        # 计算用户与其他所有用户的相似度
-        similarities = []
-        for other_idx in range(len(self.users)):
-            if other_idx != user_idx and self.user_item_matrix[other_idx, item_idx] > 0:
-                sim = self._calculate_similarity_user_based(user_idx, other_idx)
-                similarities.append((other_idx, sim))
+        # 获取用户评分过的物品
+        rated_items, rated_values = self._user_ratings(user_idx)
+        positive = rated_values > 0
+        rated_items, rated_values = rated_items[positive], rated_values[positive]
+        
+        # 如果用户没有评分过任何物品，返回默认值
+        if not len(rated_items):
+            return 3.0
+        
+        if self.item_neighbors is not None and len(self.item_neighbors) == len(self.items):
+            return self._predict_rating_from_neighbors(user_idx, item_idx, rated_items, rated_values, k)
         
-        # 如果没有相似用户，返回用户的平均评分或默认值
-        if not similarities:
-            return np.mean(self.user_item_matrix[user_idx][self.user_item_matrix[user_idx] > 0]) or 3.0
+        # 计算目标物品与用户评分过的物品的相似度
+        similarities = []
+        for rated_item_idx, rated_value in zip(rated_items, rated_values):
+            sim = self._calculate_similarity_item_based(item_idx, rated_item_idx)
+            similarities.append((rated_value, sim))
         
-        # 选择最相似的k个用户
+        # 选择最相似的k个物品
         similarities.sort(key=lambda x: x[1], reverse=True)
         nearest_neighbors = similarities[:k]
         
@@ -208,133 +1319,240 @@ class CollaborativeFilterRecommender:
         weighted_sum = 0
         similarity_sum = 0
         
-        for neighbor_idx, similarity in nearest_neighbors:
-            weighted_sum += similarity * self.user_item_matrix[neighbor_idx, item_idx]
+        for neighbor_rating, similarity in nearest_neighbors:
+            weighted_sum += similarity * neighbor_rating
             similarity_sum += similarity
         
         if similarity_sum == 0:
-            return np.mean(self.user_item_matrix[user_idx][self.user_item_matrix[user_idx] > 0]) or 3.0
+            return self._user_mean_rating(user_idx)
         
         return weighted_sum / similarity_sum
     
-    def _predict_rating_item_based(self, user_idx: int, item_idx: int, k: int = 10) -> float:
-        """基于物品的协同过滤预测评分
+    def _predict_rating_from_neighbors(self, user_idx: int, item_idx: int, rated_items: np.ndarray,
+                                       rated_values: np.ndarray, k: int = 10) -> float:
+        """用预先计算的邻居表预测评分，只查看目标物品的Top-K邻居中用户评分过的物品
         
         Args:
             user_idx: 用户索引
             item_idx: 物品索引
-            k: 考虑的最近邻数量
-            
+            rated_items: 用户正评分过的物品索引（升序）
+            rated_values: 对应的评分
+            k: 参与加权的最近邻数量
+        
+        Returns:
+            预测的评分
+        """
+        neighbors, similarities = self.item_neighbors.get(item_idx)
+        
+        # 邻居中用户评分过的物品，邻居表已按相似度降序排列
+        pos = np.minimum(np.searchsorted(rated_items, neighbors), len(rated_items) - 1)
+        hit = rated_items[pos] == neighbors
+        neighbor_ratings = rated_values[pos[hit]][:k]
+        neighbor_similarities = similarities[hit][:k]
+        
+        similarity_sum = neighbor_similarities.sum()
+        if similarity_sum <= 0:
+            return self._user_mean_rating(user_idx)
+        
+        return float(np.dot(neighbor_similarities, neighbor_ratings) / similarity_sum)
+    
+    def _predict_rating_svd(self, user_idx: int, item_idx: int) -> float:
+        """使用矩阵分解因子预测评分
+        
+        SVD因子的点积为相对用户平均分的偏差；ALS因子的点积为偏好程度（约0到1），线性映射到1-5分
+        
+        Args:
+            user_idx: 用户索引
+            item_idx: 物品索引
+        
         Returns:
             预测的评分
         """
+        if not self.use_svd or not SCIPY_AVAILABLE or self.user_factors is None:
+            return self._predict_rating_item_based(user_idx, item_idx)
+        
         # 如果用户已经对该物品有评分，直接返回
-        if self.user_item_matrix[user_idx, item_idx] > 0:
-            return self.user_item_matrix[user_idx, item_idx]
+        rating = self._get_rating(user_idx, item_idx)
+        if rating > 0:
+            return rating
+        
+        # 使用矩阵分解预测评分
+        score = float(np.dot(self.user_factors[user_idx], self.item_factors[item_idx]))
+        if self.factorization == 'als':
+            predicted_rating = 1.0 + 4.0 * score
+        else:
+            predicted_rating = self.user_means[user_idx] + score
+        
+        # 限制评分范围
+        return max(1.0, min(5.0, predicted_rating))
+    
+    def _predict_ratings_item_based(self, user_idx: int, item_indices: np.ndarray, k: int = 10) -> np.ndarray:
+        """基于物品的协同过滤批量预测评分
+        
+        把用户的评分展开为长度为物品数的向量，一次取出所有候选物品的Top-K邻居表中的评分，
+        每行只保留前k个用户评分过的邻居做相似度加权平均，与_predict_rating_from_neighbors的结果相同
+        
+        Args:
+            user_idx: 用户索引
+            item_indices: 待预测的物品索引
+            k: 参与加权的最近邻数量
+        
+        Returns:
+            与item_indices对应的预测评分，用户已评分的物品返回原评分
+        """
+        item_indices = np.asarray(item_indices, dtype='int64')
+        
+        if self.item_neighbors is None or len(self.item_neighbors) != len(self.items):
+            return np.array([self._predict_rating_item_based(user_idx, item_idx, k) for item_idx in item_indices])
+        
+        rated_items, rated_values = self._user_ratings(user_idx)
+        positive = rated_values > 0
+        rated_items, rated_values = rated_items[positive], rated_values[positive]
+        
+        if not len(rated_items):
+            return np.full(len(item_indices), 3.0)
+        
+        user_ratings = np.zeros(len(self.items) + 1)
+        user_ratings[rated_items] = rated_values
+        
+        # 补齐的-1指向末尾的0
+        neighbors = self.item_neighbors.neighbors[item_indices]
+        similarities = self.item_neighbors.similarities[item_indices].astype('float64')
+        neighbor_ratings = user_ratings[np.where(neighbors >= 0, neighbors, len(self.items))]
         
-        # 获取用户评分过的物品
-        rated_items = []
-        for i in range(self.user_item_matrix.shape[1]):
-            if self.user_item_matrix[user_idx, i] > 0:
-                rated_items.append(i)
+        # 邻居表已按相似度降序排列，只保留前k个有评分的邻居
+        hit = neighbor_ratings > 0
+        hit &= np.cumsum(hit, axis=1) <= k
+        weights = np.where(hit, similarities, 0.0)
         
-        # 如果用户没有评分过任何物品，返回默认值
-        if not rated_items:
-            return 3.0
+        similarity_sums = weights.sum(axis=1)
+        predictions = np.full(len(item_indices), self._user_mean_rating(user_idx))
+        has_neighbors = similarity_sums > 0
+        predictions[has_neighbors] = ((weights * neighbor_ratings).sum(axis=1)[has_neighbors]
+                                      / similarity_sums[has_neighbors])
         
-        # 计算目标物品与用户评分过的物品的相似度
-        similarities = []
-        for rated_item_idx in rated_items:
-            sim = self._calculate_similarity_item_based(item_idx, rated_item_idx)
-            similarities.append((rated_item_idx, sim))
+        # 用户已经评分的物品直接返回原评分
+        rated = user_ratings[item_indices] > 0
+        predictions[rated] = user_ratings[item_indices[rated]]
         
-        # 选择最相似的k个物品
-        similarities.sort(key=lambda x: x[1], reverse=True)
-        nearest_neighbors = similarities[:k]
+        return predictions
+    
+    def _predict_ratings_factors(self, user_idx: int, item_indices: np.ndarray) -> np.ndarray:
+        """用矩阵分解因子批量预测评分，一次矩阵-向量乘法为所有候选物品打分
         
-        # 加权平均预测评分
-        weighted_sum = 0
-        similarity_sum = 0
+        Args:
+            user_idx: 用户索引
+            item_indices: 待预测的物品索引
         
-        for neighbor_idx, similarity in nearest_neighbors:
-            weighted_sum += similarity * self.user_item_matrix[user_idx, neighbor_idx]
-            similarity_sum += similarity
+        Returns:
+            与item_indices对应的预测评分，范围为1-5
+        """
+        item_indices = np.asarray(item_indices, dtype='int64')
         
-        if similarity_sum == 0:
-            return np.mean(self.user_item_matrix[user_idx][self.user_item_matrix[user_idx] > 0]) or 3.0
+        if self.user_factors is None:
+            return self._predict_ratings_item_based(user_idx, item_indices)
         
-        return weighted_sum / similarity_sum
+        scores = self.item_factors[item_indices] @ self.user_factors[user_idx]
+        if self.factorization == 'als':
+            predictions = 1.0 + 4.0 * scores
+        else:
+            predictions = self.user_means[user_idx] + scores
+        
+        return np.clip(predictions, 1.0, 5.0)
     
-    def _predict_rating_svd(self, user_idx: int, item_idx: int) -> float:
-        """使用SVD预测评分
+    def _top_items(self, user_idx: int, item_indices: np.ndarray = None, top_n: int = 10,
+                   method: str = 'item') -> Tuple[np.ndarray, np.ndarray]:
+        """为用户一次性给候选物品打分，去掉已评分的物品后取前top_n个
         
         Args:
             user_idx: 用户索引
-            item_idx: 物品索引
-            
+            item_indices: 候选物品索引，为None时为全部物品
+            top_n: 返回的数量
+            method: 'user'、'item'或'mf'（矩阵分解因子）
+        
         Returns:
-            预测的评分
+            (按预测评分降序排列的物品索引, 预测评分)
         """
-        if not self.use_svd or not SCIPY_AVAILABLE:
-            return self._predict_rating_item_based(user_idx, item_idx)
+        if item_indices is None:
+            item_indices = np.arange(len(self.items))
+        item_indices = np.asarray(item_indices, dtype='int64')
         
-        # 如果用户已经对该物品有评分，直接返回
-        if self.user_item_matrix[user_idx, item_idx] > 0:
-            return self.user_item_matrix[user_idx, item_idx]
+        # 去掉用户已经评分过的物品
+        rated_items, rated_values = self._user_ratings(user_idx)
+        rated_items = rated_items[rated_values > 0]
+        if len(rated_items):
+            item_indices = item_indices[~np.isin(item_indices, rated_items)]
         
-        # 使用矩阵分解预测评分
-        predicted_rating = self.user_means[user_idx] + np.dot(self.user_factors[user_idx], self.item_factors[item_idx])
+        if not len(item_indices) or top_n <= 0:
+            return np.zeros(0, dtype='int64'), np.zeros(0)
         
-        # 限制评分范围
-        return max(1.0, min(5.0, predicted_rating))
+        if method == 'user':
+            predictions = self._predict_ratings_user_based(user_idx, item_indices)
+        elif method == 'mf':
+            predictions = self._predict_ratings_factors(user_idx, item_indices)
+        else:
+            predictions = self._predict_ratings_item_based(user_idx, item_indices)
+        
+        if len(predictions) > top_n:
+            top = np.argpartition(-predictions, top_n - 1)[:top_n]
+        else:
+            top = np.arange(len(predictions))
+        top = top[np.argsort(-predictions[top], kind='stable')]
+        
+        return item_indices[top], predictions[top]
     
-    def recommend_places_user_based(self, user: User, places: List[Place], top_n: int = 10) -> List[Dict[str, Any]]:
-        """基于用户的协同过滤推荐景点
+    def recommend_item_ids(self, user_id: int, top_n: int = 10, method: str = 'item',
+                           candidate_ids: List[int] = None) -> List[Tuple[int, float]]:
+        """为用户推荐物品ID，不需要先加载候选物品对象
         
         Args:
-            user: 用户对象
-            places: 候选景点列表
+            user_id: 用户ID
             top_n: 返回的推荐数量
-            
+            method: 'user'、'item'或'mf'
+            candidate_ids: 候选物品ID，为None时为模型中的全部物品
+        
         Returns:
-            推荐景点列表，包含预测评分
+            [(物品ID, 预测评分)]，按预测评分降序
         """
-        # 获取用户索引
-        user_idx = self.user_indices.get(user.id)
+        user_idx = self.user_indices.get(user_id)
+        if user_idx is None:
+            return []
         
+        item_indices = None
+        if candidate_ids is not None:
+            item_indices = [self.item_indices[item_id] for item_id in candidate_ids if item_id in self.item_indices]
+        
+        indices, predictions = self._top_items(user_idx, item_indices, top_n, method)
+        return [(self.items[item_idx], float(prediction)) for item_idx, prediction in zip(indices, predictions)]
+    
+    def _recommend(self, user: User, items: List[Any], top_n: int, method: str) -> List[Dict[str, Any]]:
+        """为用户从候选对象中推荐，返回对象字典并附上预测评分"""
+        user_idx = self.user_indices.get(user.id)
         if user_idx is None:
             return []
         
-        # 计算用户对每个景点的预测评分
-        place_ratings = []
-        for place in places:
-            item_idx = self.item_indices.get(place.id)
-            
+        # 模型中的候选物品索引 -> 对象
+        candidates = {}
+        for item in items:
+            item_idx = self.item_indices.get(item.id)
             if item_idx is not None:
-                # 预测评分
-                predicted_rating = self._predict_rating_user_based(user_idx, item_idx)
-                
-                place_ratings.append({
-                    'place': place,
-                    'predicted_rating': predicted_rating
-                })
+                candidates.setdefault(item_idx, item)
         
-        # 按预测评分排序
-        place_ratings.sort(key=lambda x: x['predicted_rating'], reverse=True)
+        indices, predictions = self._top_items(user_idx, list(candidates), top_n, method)
         
-        # 返回前N个结果
         result = []
-        for item in place_ratings[:top_n]:
-            place_dict = item['place'].to_dict() if hasattr(item['place'], 'to_dict') else {}
-            place_dict.update({
-                'predicted_rating': float(item['predicted_rating'])
+        for item_idx, predicted_rating in zip(indices, predictions):
+            item = candidates[item_idx]
+            item_dict = item.to_dict() if hasattr(item, 'to_dict') else {}
+            item_dict.update({
+                'predicted_rating': float(predicted_rating)
             })
-            result.append(place_dict)
+            result.append(item_dict)
         
         return result
     
-    def recommend_places_item_based(self, user: User, places: List[Place], top_n: int = 10) -> List[Dict[str, Any]]:
-        """基于物品的协同过滤推荐景点
+    def recommend_places_user_based(self, user: User, places: List[Place], top_n: int = 10) -> List[Dict[str, Any]]:
+        """基于用户的协同过滤推荐景点
         
         Args:
             user: 用户对象
@@ -342,41 +1560,22 @@ class CollaborativeFilterRecommender:
             top_n: 返回的推荐数量
             
         Returns:
-            推荐景点列表，包含预测评分
+            推荐景点列表，包含预测评分，不含用户已评分的景点
         """
-        # 获取用户索引
-        user_idx = self.user_indices.get(user.id)
-        
-        if user_idx is None:
-            return []
+        return self._recommend(user, places, top_n, 'user')
+    
+    def recommend_places_item_based(self, user: User, places: List[Place], top_n: int = 10) -> List[Dict[str, Any]]:
+        """基于物品的协同过滤推荐景点
         
-        # 计算用户对每个景点的预测评分
-        place_ratings = []
-        for place in places:
-            item_idx = self.item_indices.get(place.id)
+        Args:
+            user: 用户对象
+            places: 候选景点列表
+            top_n: 返回的推荐数量
             
-            if item_idx is not None:
-                # 预测评分
-                predicted_rating = self._predict_rating_item_based(user_idx, item_idx)
-                
-                place_ratings.append({
-                    'place': place,
-                    'predicted_rating': predicted_rating
-                })
-        
-        # 按预测评分排序
-        place_ratings.sort(key=lambda x: x['predicted_rating'], reverse=True)
-        
-        # 返回前N个结果
-        result = []
-        for item in place_ratings[:top_n]:
-            place_dict = item['place'].to_dict() if hasattr(item['place'], 'to_dict') else {}
-            place_dict.update({
-                'predicted_rating': float(item['predicted_rating'])
-            })
-            result.append(place_dict)
-        
-        return result
+        Returns:
+            推荐景点列表，包含预测评分，不含用户已评分的景点
+        """
+        return self._recommend(user, places, top_n, 'item')
     
     def recommend_foods_user_based(self, user: User, foods: List[Food], top_n: int = 10) -> List[Dict[str, Any]]:
         """基于用户的协同过滤推荐美食
@@ -387,41 +1586,9 @@ class CollaborativeFilterRecommender:
             top_n: 返回的推荐数量
             
         Returns:
-            推荐美食列表，包含预测评分
+            推荐美食列表，包含预测评分，不含用户已评分的美食
         """
-        # 获取用户索引
-        user_idx = self.user_indices.get(user.id)
-        
-        if user_idx is None:
-            return []
-        
-        # 计算用户对每个美食的预测评分
-        food_ratings = []
-        for food in foods:
-            item_idx = self.item_indices.get(food.id)
-            
-            if item_idx is not None:
-                # 预测评分
-                predicted_rating = self._predict_rating_user_based(user_idx, item_idx)
-                
-                food_ratings.append({
-                    'food': food,
-                    'predicted_rating': predicted_rating
-                })
-        
-        # 按预测评分排序
-        food_ratings.sort(key=lambda x: x['predicted_rating'], reverse=True)
-        
-        # 返回前N个结果
-        result = []
-        for item in food_ratings[:top_n]:
-            food_dict = item['food'].to_dict() if hasattr(item['food'], 'to_dict') else {}
-            food_dict.update({
-                'predicted_rating': float(item['predicted_rating'])
-            })
-            result.append(food_dict)
-        
-        return result
+        return self._recommend(user, foods, top_n, 'user')
     
     def recommend_foods_item_based(self, user: User, foods: List[Food], top_n: int = 10) -> List[Dict[str, Any]]:
         """基于物品的协同过滤推荐美食
@@ -432,103 +1599,420 @@ class CollaborativeFilterRecommender:
             top_n: 返回的推荐数量
             
         Returns:
-            推荐美食列表，包含预测评分
+            推荐美食列表，包含预测评分，不含用户已评分的美食
         """
-        # 获取用户索引
-        user_idx = self.user_indices.get(user.id)
+        return self._recommend(user, foods, top_n, 'item')
+
+
+class CollaborativeFilterStore(VersionedStore):
+    """版本化的协同过滤模型目录
+    
+    每次训练的模型写入model_dir/versions/<版本号>/<类型>.cf.*，写完后原子地切换current链接，
+    布局和切换方式与向量索引目录相同
+    """
+    
+    ITEM_FILE_SUFFIX = 'cf'
+    
+    def publish_models(self, models: Dict[str, CollaborativeFilterRecommender],
+                       item_types: Tuple[str, ...] = ('place', 'food')) -> str:
+        """把模型保存为一个新版本并发布，没有传入的类型沿用当前版本的文件
         
-        if user_idx is None:
-            return []
+        Args:
+            models: 类型到模型的映射
+            item_types: 版本中包含的所有类型
         
-        # 计算用户对每个美食的预测评分
-        food_ratings = []
-        for food in foods:
-            item_idx = self.item_indices.get(food.id)
-            
-            if item_idx is not None:
-                # 预测评分
-                predicted_rating = self._predict_rating_item_based(user_idx, item_idx)
-                
-                food_ratings.append({
-                    'food': food,
-                    'predicted_rating': predicted_rating
-                })
+        Returns:
+            新版本的目录
+        """
+        active = self.active_dir()
+        version_dir = self.new_version_dir()
         
-        # 按预测评分排序
-        food_ratings.sort(key=lambda x: x['predicted_rating'], reverse=True)
+        for item_type in item_types:
+            if item_type in models:
+                models[item_type].save(self.item_path(version_dir, item_type))
+            else:
+                self.link_item_files(item_type, active, version_dir)
         
-        # 返回前N个结果
-        result = []
-        for item in food_ratings[:top_n]:
-            food_dict = item['food'].to_dict() if hasattr(item['food'], 'to_dict') else {}
-            food_dict.update({
-                'predicted_rating': float(item['predicted_rating'])
-            })
-            result.append(food_dict)
+        self.publish(version_dir)
+        self.prune()
+        return version_dir
+
+
+class CollaborativeFilterRegistry:
+    """进程级协同过滤模型注册表
+    
+    在应用启动时创建一次，持有训练好的景点和美食模型，请求中只做查表和向量运算，不再每次重新训练。
+    启动时从模型目录的当前版本加载；其他进程发布新版本后，在下一次取模型时换用新模型；
+    refresh把交互表中的新记录增量加入已加载的模型
+    """
+    
+    ITEM_TYPES = ('place', 'food')
+    
+    def __init__(self, model_dir: str = None, use_svd: bool = SCIPY_AVAILABLE, n_neighbors: int = 50,
+                 reload_interval: float = 30.0, keep_versions: int = 3, factorization: str = 'svd',
+                 als_options: Dict[str, Any] = None):
+        """初始化注册表
         
-        return result
+        Args:
+            model_dir: 模型目录，为None时不读写模型文件
+            use_svd: 是否训练矩阵分解因子
+            n_neighbors: 每个物品保留的相似物品数量
+            reload_interval: 检查模型目录是否发布了新版本的最小间隔（秒），为None时不检查
+            keep_versions: 模型目录中保留的版本数量
+            factorization: 矩阵分解方法，'svd'或'als'
+            als_options: 传给ImplicitALS的参数
+        """
+        self.model_dir = model_dir
+        self.store = CollaborativeFilterStore(model_dir, keep_versions) if model_dir else None
+        self.use_svd = use_svd
+        self.n_neighbors = n_neighbors
+        self.factorization = factorization
+        self.als_options = als_options or {}
+        self.reload_interval = reload_interval
+        self.models = {}
+        # 已加载的版本目录和上次检查的时间
+        self.loaded_dir = None
+        self._last_reload_check = 0.0
+        self._lock = threading.Lock()
+        # 第一次取模型时只训练一次
+        self._train_lock = threading.Lock()
+    
+    def _new_model(self) -> CollaborativeFilterRecommender:
+        return CollaborativeFilterRecommender(use_svd=self.use_svd, n_neighbors=self.n_neighbors,
+                                              factorization=self.factorization, als_options=self.als_options)
+    
+    def load(self):
+        """从模型目录的当前版本加载模型，全部加载完成后才替换旧模型"""
+        if not self.store:
+            return
+        
+        active = self.store.active_dir()
+        models = {}
+        for item_type in self.ITEM_TYPES:
+            model = self._new_model()
+            if model.load(self.store.item_path(active, item_type)):
+                models[item_type] = model
+        
+        self.models = models
+        self.loaded_dir = active
+        self._last_reload_check = time.monotonic()
+    
+    def reload_if_changed(self, force: bool = False) -> bool:
+        """模型目录发布了新版本时重新加载
+        
+        Args:
+            force: 是否忽略检查间隔立即检查
+        
+        Returns:
+            是否加载了新版本
+        """
+        if not self.store or (self.reload_interval is None and not force):
+            return False
+        
+        now = time.monotonic()
+        if not force and now - self._last_reload_check < self.reload_interval:
+            return False
+        self._last_reload_check = now
+        
+        if self.store.active_dir() == self.loaded_dir:
+            return False
+        
+        with self._lock:
+            if self.store.active_dir() == self.loaded_dir:
+                return False
+            self.load()
+        return True
+    
+    def train(self, item_type: str, save: bool = True) -> CollaborativeFilterRecommender:
+        """从交互记录表完整训练指定类型的模型，训练完成后替换旧模型
+        
+        Args:
+            item_type: 物品类型，'place'或'food'
+            save: 是否保存为模型目录的新版本
+        
+        Returns:
+            新模型
+        """
+        model = self._new_model()
+        model.train_from_log(item_type)
+        
+        with self._lock:
+            self.models = dict(self.models, **{item_type: model})
+            if save:
+                self.save()
+        
+        return model
+    
+    def refresh(self, item_type: str) -> Dict[str, int]:
+        """把交互表中的新记录增量加入已加载的模型
+        
+        Args:
+            item_type: 物品类型
+        
+        Returns:
+            fold_in的统计结果，模型尚未加载时为空字典
+        """
+        model = self.models.get(item_type)
+        if model is None:
+            return {}
+        
+        with self._lock:
+            return model.refresh_from_log(item_type)
+    
+    def save(self):
+        """把已加载的模型保存为模型目录的新版本并发布"""
+        if not self.store:
+            return
+        
+        self.loaded_dir = self.store.publish_models(self.models, self.ITEM_TYPES)
+    
+    def get_model(self, item_type: str) -> CollaborativeFilterRecommender:
+        """获取指定类型的模型
+        
+        模型既没有从文件加载也没有训练过时，在第一次调用时训练一次；
+        每隔reload_interval秒检查一次模型目录是否发布了新版本
+        
+        Args:
+            item_type: 物品类型，'place'或'food'
+        
+        Returns:
+            协同过滤模型
+        """
+        self.reload_if_changed()
+        
+        if item_type not in self.models:
+            with self._train_lock:
+                if item_type not in self.models:
+                    self.train(item_type)
+        
+        return self.models[item_type]
+
+
+class CollaborativeFilterScheduler:
+    """后台训练调度
+    
+    在后台线程中定时把新交互增量加入模型（refresh_interval），并定时完整重新训练和发布新版本（retrain_interval）。
+    启动时某个类型既没有已保存的模型也没有训练过，先在后台线程中训练一次，推荐请求中不会训练模型。
+    多进程部署时建议只在一个进程或定时任务中完整训练（python -m ai_recommendation.collaborative_filter train），
+    其他进程通过模型目录的current链接换用新版本
+    """
+    
+    def __init__(self, registry: CollaborativeFilterRegistry, app, refresh_interval: float = 60.0,
+                 retrain_interval: float = 0.0):
+        """初始化调度器
+        
+        Args:
+            registry: 协同过滤模型注册表
+            app: Flask应用实例，任务在其应用上下文中访问数据库
+            refresh_interval: 增量更新的间隔（秒），为0时不做增量更新
+            retrain_interval: 完整训练的间隔（秒），为0时不在进程内完整训练
+        """
+        self.registry = registry
+        self.app = app
+        self.refresh_interval = refresh_interval or 0
+        self.retrain_interval = retrain_interval or 0
+        self._stop = threading.Event()
+        self._thread = None
+    
+    def start(self):
+        """启动后台线程"""
+        if self._thread is not None:
+            return
+        if self.refresh_interval <= 0 and self.retrain_interval <= 0 and not self._missing_item_types():
+            return
+        
+        self._thread = threading.Thread(target=self._run, name='cf-training-scheduler', daemon=True)
+        self._thread.start()
+    
+    def stop(self):
+        """停止后台线程"""
+        self._stop.set()
+    
+    def _missing_item_types(self) -> List[str]:
+        return [item_type for item_type in self.registry.ITEM_TYPES if item_type not in self.registry.models]
+    
+    def _train_missing(self):
+        """训练还没有模型的类型，并发布为新版本"""
+        missing = self._missing_item_types()
+        if not missing:
+            return
+        
+        with self.app.app_context():
+            for item_type in missing:
+                try:
+                    self.registry.train(item_type, save=False)
+                except Exception as e:
+                    print(f"Error training initial {item_type} collaborative filtering model: {e}")
+            if len(missing) > len(self._missing_item_types()):
+                self.registry.save()
+    
+    def _run(self):
+        self._train_missing()
+        
+        intervals = [interval for interval in (self.refresh_interval, self.retrain_interval) if interval > 0]
+        if not intervals:
+            return
+        tick = min(intervals)
+        last_refresh = last_retrain = time.monotonic()
+        
+        while not self._stop.wait(tick):
+            now = time.monotonic()
+            retrain = self.retrain_interval > 0 and now - last_retrain >= self.retrain_interval
+            refresh = self.refresh_interval > 0 and now - last_refresh >= self.refresh_interval
+            
+            try:
+                with self.app.app_context():
+                    if retrain:
+                        for item_type in self.registry.ITEM_TYPES:
+                            self.registry.train(item_type, save=False)
+                        self.registry.save()
+                        last_retrain = last_refresh = time.monotonic()
+                    elif refresh:
+                        self.registry.reload_if_changed()
+                        for item_type in self.registry.ITEM_TYPES:
+                            self.registry.refresh(item_type)
+                        last_refresh = time.monotonic()
+            except Exception as e:
+                print(f"Error updating collaborative filtering models: {e}")
+
+
+_registry = None
+_registry_lock = threading.Lock()
+
+
+def als_options_from_config(config) -> Dict[str, Any]:
+    """从配置中读取ImplicitALS的参数
+    
+    Args:
+        config: Flask配置或配置类
+    
+    Returns:
+        ImplicitALS的参数字典，只包含配置了的项
+    """
+    get = config.get if hasattr(config, 'get') else lambda name, default=None: getattr(config, name, default)
+    names = {
+        'CF_ALS_FACTORS': 'n_factors',
+        'CF_ALS_REGULARIZATION': 'regularization',
+        'CF_ALS_ALPHA': 'alpha',
+        'CF_ALS_POSITIVE_RATING': 'positive_rating',
+        'CF_ALS_ITERATIONS': 'iterations',
+        'CF_ALS_THREADS': 'n_threads',
+        'CF_ALS_VALIDATION_FRACTION': 'validation_fraction'
+    }
+    return {option: get(name) for name, option in names.items() if get(name) is not None}
+
+
+def init_collaborative_filter(app=None) -> CollaborativeFilterRegistry:
+    """创建进程级协同过滤注册表，加载已保存的模型并启动后台训练调度
+    
+    应在create_app中调用，每个工作进程只执行一次
+    
+    Args:
+        app: Flask应用实例，从中读取CF_MODEL_DIR等配置
+    
+    Returns:
+        协同过滤模型注册表
+    """
+    global _registry
+    
+    model_dir = None
+    n_neighbors = 50
+    reload_interval = 30.0
+    keep_versions = 3
+    factorization = 'svd'
+    als_options = {}
+    if app is not None:
+        model_dir = app.config.get('CF_MODEL_DIR')
+        n_neighbors = app.config.get('CF_ITEM_NEIGHBORS', n_neighbors)
+        reload_interval = app.config.get('CF_RELOAD_INTERVAL', reload_interval)
+        keep_versions = app.config.get('CF_KEEP_VERSIONS', keep_versions)
+        factorization = app.config.get('CF_FACTORIZATION', factorization)
+        als_options = als_options_from_config(app.config)
+    
+    registry = CollaborativeFilterRegistry(model_dir=model_dir, n_neighbors=n_neighbors,
+                                           reload_interval=reload_interval, keep_versions=keep_versions,
+                                           factorization=factorization, als_options=als_options)
+    registry.load()
+    
+    if app is not None:
+        app.extensions['collaborative_filter'] = registry
+        
+        if not app.config.get('TESTING'):
+            scheduler = CollaborativeFilterScheduler(registry, app,
+                                                     refresh_interval=app.config.get('CF_REFRESH_INTERVAL', 60.0),
+                                                     retrain_interval=app.config.get('CF_RETRAIN_INTERVAL', 0.0))
+            scheduler.start()
+            app.extensions['collaborative_filter_scheduler'] = scheduler
+    
+    with _registry_lock:
+        _registry = registry
+    
+    return registry
+
+
+def get_collaborative_filter_registry() -> CollaborativeFilterRegistry:
+    """获取进程级协同过滤注册表
+    
+    在应用之外（如脚本中）调用时，按默认配置懒加载创建
+    
+    Returns:
+        协同过滤模型注册表
+    """
+    global _registry
+    
+    if _registry is None:
+        with _registry_lock:
+            if _registry is None:
+                _registry = CollaborativeFilterRegistry()
+    
+    return _registry
 
 
 # 提供一个简单的函数接口，方便后端调用
 def get_collaborative_recommendations(user_id: int, item_type: str = 'place', method: str = 'item', top_n: int = 10) -> List[Dict[str, Any]]:
     """获取协同过滤推荐
     
+    在模型中的全部物品上一次打分并取前top_n个，只从数据库加载被推荐的物品
+    
     Args:
         user_id: 用户ID
         item_type: 推荐项目类型，'place'或'food'
-        method: 推荐方法，'user'表示基于用户的协同过滤，'item'表示基于物品的协同过滤
+        method: 推荐方法，'user'表示基于用户的协同过滤，'item'表示基于物品的协同过滤，'mf'表示矩阵分解
         top_n: 返回的推荐数量
         
     Returns:
         推荐项目列表
     """
-    # 初始化推荐器
-    recommender = CollaborativeFilterRecommender(use_svd=SCIPY_AVAILABLE)
-    
     # 获取用户
     user = User.query.get(user_id)
     if not user:
         return []
     
-    # 获取用户交互数据
-    interactions = []
-    
     if item_type == 'place':
-        # 这里应该从数据库中获取用户对景点的评分记录
-        # 在实际应用中，应该有一个专门的表存储用户对景点的评分
-        # 这里使用模拟数据
-        
-        # 构建用户-物品矩阵
-        recommender._build_user_item_matrix(interactions, item_type='place')
-        
-        # 获取所有景点
-        places = Place.query.all()
-        
-        # 根据方法选择推荐函数
-        if method == 'user':
-            return recommender.recommend_places_user_based(user, places, top_n)
-        else:
-            return recommender.recommend_places_item_based(user, places, top_n)
-    
+        model_class = Place
     elif item_type == 'food':
-        # 这里应该从数据库中获取用户对美食的评分记录
-        # 在实际应用中，应该有一个专门的表存储用户对美食的评分
-        # 这里使用模拟数据
-        
-        # 构建用户-物品矩阵
-        recommender._build_user_item_matrix(interactions, item_type='food')
-        
-        # 获取所有美食
-        foods = Food.query.all()
-        
-        # 根据方法选择推荐函数
-        if method == 'user':
-            return recommender.recommend_foods_user_based(user, foods, top_n)
-        else:
-            return recommender.recommend_foods_item_based(user, foods, top_n)
-    
+        model_class = Food
     else:
         return []
+    
+    # 进程级注册表中已训练的模型
+    recommender = get_collaborative_filter_registry().get_model(item_type)
+    scored = recommender.recommend_item_ids(user.id, top_n, method)
+    if not scored:
+        return []
+    
+    # 只加载被推荐的物品，按预测评分的顺序返回
+    items = model_class.query.filter(model_class.id.in_([item_id for item_id, _ in scored])).all()
+    items_by_id = {item.id: item for item in items}
+    
+    result = []
+    for item_id, predicted_rating in scored:
+        if item_id in items_by_id:
+            item_dict = items_by_id[item_id].to_dict()
+            item_dict['predicted_rating'] = predicted_rating
+            result.append(item_dict)
+    
+    return result
 
 
 # 提供一个考虑地理位置的推荐函数
@@ -549,24 +2033,18 @@ def get_location_aware_collaborative_recommendations(user_id: int, latitude: flo
     Returns:
         推荐项目列表
     """
-    # 初始化推荐器
-    recommender = CollaborativeFilterRecommender(use_svd=SCIPY_AVAILABLE)
-    
     # 获取用户
     user = User.query.get(user_id)
     if not user:
         return []
     
-    # 获取用户交互数据
-    interactions = []
-    
     if item_type == 'place':
         # 获取附近的景点
         nearby_places = Place.get_nearby_places(latitude, longitude, radius)
         
         if nearby_places:
-            # 构建用户-物品矩阵
-            recommender._build_user_item_matrix(interactions, item_type='place')
+            # 进程级注册表中已训练的模型
+            recommender = get_collaborative_filter_registry().get_model('place')
             
             # 根据方法选择推荐函数
             if method == 'user':
@@ -587,8 +2065,8 @@ def get_location_aware_collaborative_recommendations(user_id: int, latitude: flo
         nearby_foods = Food.get_nearby_foods(latitude, longitude, radius)
         
         if nearby_foods:
-            # 构建用户-物品矩阵
-            recommender._build_user_item_matrix(interactions, item_type='food')
+            # 进程级注册表中已训练的模型
+            recommender = get_collaborative_filter_registry().get_model('food')
             
             # 根据方法选择推荐函数
             if method == 'user':
@@ -602,4 +2080,85 @@ def get_location_aware_collaborative_recommendations(user_id: int, latitude: flo
             
             return recommendations
         else:
-            return []
\ No newline at end of file
+            return []
+
+
+def main():
+    """命令行入口：从交互记录训练模型并发布新版本、查看和切换模型版本"""
+    parser = argparse.ArgumentParser(description='协同过滤模型训练工具')
+    parser.add_argument('--env', choices=['dev', 'prod'], default='dev',
+                        help='环境配置: dev (开发) 或 prod (生产)')
+    parser.add_argument('--model-dir', help='模型根目录，默认使用配置中的CF_MODEL_DIR')
+    
+    subparsers = parser.add_subparsers(dest='command', help='命令')
+    
+    # train命令
+    train_parser = subparsers.add_parser('train', help='从交互记录表训练模型并发布为新版本')
+    train_parser.add_argument('--types', nargs='+', choices=CollaborativeFilterRegistry.ITEM_TYPES,
+                              help='需要训练的类型，默认全部训练，未训练的类型沿用当前版本')
+    train_parser.add_argument('--neighbors', type=int, help='每个物品保留的相似物品数量')
+    train_parser.add_argument('--factorization', choices=['svd', 'als'], help='矩阵分解方法，默认使用配置中的CF_FACTORIZATION')
+    train_parser.add_argument('--factors', type=int, help='ALS的潜在因子数量')
+    train_parser.add_argument('--iterations', type=int, help='ALS最多训练的轮数')
+    train_parser.add_argument('--threads', type=int, help='ALS并行求解的线程数')
+    train_parser.add_argument('--keep', type=int, default=3, help='保留的版本数量')
+    
+    # versions命令
+    subparsers.add_parser('versions', help='列出所有模型版本')
+    
+    # activate命令
+    activate_parser = subparsers.add_parser('activate', help='切换到已有的模型版本（回滚）')
+    activate_parser.add_argument('version', help='版本号')
+    
+    args = parser.parse_args()
+    
+    from backend.config import DevelopmentConfig, ProductionConfig
+    config = DevelopmentConfig if args.env == 'dev' else ProductionConfig
+    model_dir = args.model_dir or config.CF_MODEL_DIR
+    
+    if not model_dir:
+        print("未配置模型目录")
+        return
+    
+    store = CollaborativeFilterStore(model_dir)
+    
+    if args.command == 'train':
+        from ai_recommendation.vector_search import _create_cli_app
+        
+        als_options = als_options_from_config(config)
+        for option, value in (('n_factors', args.factors), ('iterations', args.iterations), ('n_threads', args.threads)):
+            if value is not None:
+                als_options[option] = value
+        
+        registry = CollaborativeFilterRegistry(model_dir=model_dir, keep_versions=args.keep,
+                                               n_neighbors=args.neighbors or config.CF_ITEM_NEIGHBORS,
+                                               factorization=args.factorization or config.CF_FACTORIZATION,
+                                               als_options=als_options)
+        with _create_cli_app(config).app_context():
+            for item_type in args.types or CollaborativeFilterRegistry.ITEM_TYPES:
+                start_time = time.perf_counter()
+                model = registry.train(item_type, save=False)
+                print(f"Trained {item_type} model: {len(model.users)} users, {len(model.items)} items "
+                      f"in {time.perf_counter() - start_time:.1f}s")
+                for record in model.training_history:
+                    print(f"  iteration {record['iteration']}: recall@10={record['recall']:.4f} "
+                          f"({record['seconds']:.1f}s)")
+        registry.save()
+        print(f"已发布模型版本: {os.path.basename(registry.loaded_dir)}")
+    
+    elif args.command == 'versions':
+        active = store.active_version()
+        for version in store.list_versions():
+            status = "[当前]" if version == active else ""
+            print(f"  {version} {status}")
+    
+    elif args.command == 'activate':
+        store.activate(args.version)
+        print(f"已切换到模型版本: {args.version}")
+    
+    else:
+        parser.print_help()
+
+
+if __name__ == '__main__':
+    main()
@@ -12,6 +12,9 @@ from backend.models.user import User
 from backend.models.place import Place
 from backend.models.food import Food
 from backend.utils.helpers import calculate_distance
+from ai_recommendation.embedding_cache import EmbeddingCache, get_embedding_cache
+from ai_recommendation.hashing_embedder import HashingEmbedder
+from ai_recommendation.text_encoders import TextEncoder, create_encoder, TRANSFORMERS_AVAILABLE
 
 # 尝试导入NLP相关库，如果不存在则提供备用方案
 try:
@@ -22,13 +25,8 @@ except ImportError:
     WORD2VEC_AVAILABLE = False
     print("Warning: gensim not installed. Using fallback similarity methods.")
 
-try:
-    import torch
-    from transformers import BertModel, BertTokenizer
-    BERT_AVAILABLE = True
-except ImportError:
-    BERT_AVAILABLE = False
-    print("Warning: transformers not installed. Using fallback similarity methods.")
+# BERT等模型编码器见text_encoders
+BERT_AVAILABLE = TRANSFORMERS_AVAILABLE
 
 
 class ContentBasedRecommender:
@@ -37,22 +35,28 @@ class ContentBasedRecommender:
     使用文本特征和用户偏好进行景点和美食推荐
     """
     
-    def __init__(self, use_bert: bool = False):
+    def __init__(self, use_bert: bool = False, embedding_cache: EmbeddingCache = None, encoder: TextEncoder = None):
         """初始化推荐器
         
         Args:
-            use_bert: 是否使用BERT模型，如果为False则使用Word2Vec或备用方法
+            use_bert: 没有传入encoder时是否使用BERT模型，如果为False则使用Word2Vec或备用方法
+            embedding_cache: 持久化的文本向量缓存，为None时不使用
+            encoder: 文本编码器，如句向量模型或ONNX模型，见text_encoders.create_encoder
         """
         self.use_bert = use_bert and BERT_AVAILABLE
+        self.embedding_cache = embedding_cache
         self.word2vec_model = None
-        self.bert_model = None
-        self.bert_tokenizer = None
+        self.encoder = encoder
         
         # 初始化模型
-        if self.use_bert:
-            self._init_bert()
-        elif WORD2VEC_AVAILABLE:
+        if self.encoder is None and self.use_bert:
+            self.encoder = create_encoder('bert')
+        
+        if self.encoder is None and WORD2VEC_AVAILABLE:
             self._init_word2vec()
+        
+        # 备用的确定性哈希向量化，编码器推理出错时维度与编码器一致
+        self.hashing_embedder = HashingEmbedder(dim=self.encoder.dim if self.encoder is not None else 100)
     
     def _init_word2vec(self, vector_size: int = 100):
         """初始化Word2Vec模型"""
@@ -62,19 +66,41 @@ class ContentBasedRecommender:
         # 模拟模型初始化
         self.word2vec_model = None
     
-    def _init_bert(self):
-        """初始化BERT模型"""
-        # 加载预训练的BERT模型和分词器
-        # 在实际应用中，应该使用预训练好的模型
-        if BERT_AVAILABLE:
-            try:
-                self.bert_tokenizer = BertTokenizer.from_pretrained('bert-base-chinese')
-                self.bert_model = BertModel.from_pretrained('bert-base-chinese')
-                # 设置为评估模式
-                self.bert_model.eval()
-            except Exception as e:
-                print(f"Error loading BERT model: {e}")
-                self.use_bert = False
+    def _embedding_model_id(self) -> Optional[str]:
+        """当前文本向量化模型的标识，用作向量缓存键的一部分
+        
+        备用的哈希方法计算很快，不需要缓存，返回None
+        """
+        if self.encoder is not None:
+            return self.encoder.model_id
+        elif WORD2VEC_AVAILABLE and self.word2vec_model is not None:
+            return f"word2vec:{self.vector_size}"
+        return None
+    
+    def _text_to_vector(self, text: str) -> np.ndarray:
+        """使用选定的方法将文本转换为向量，文本没有变化时直接使用缓存的向量
+        
+        Args:
+            text: 输入文本
+            
+        Returns:
+            文本的向量表示
+        """
+        model_id = self._embedding_model_id()
+        if self.embedding_cache is not None and model_id is not None:
+            vector = self.embedding_cache.get(model_id, text)
+            if vector is not None:
+                return vector
+        
+        if self.encoder is not None:
+            vector = self._text_to_vector_encoder(text)
+        else:
+            vector = self._text_to_vector_word2vec(text)
+        
+        if self.embedding_cache is not None and model_id is not None:
+            self.embedding_cache.put(model_id, text, vector)
+        
+        return vector
     
     def _text_to_vector_word2vec(self, text: str) -> np.ndarray:
         """使用Word2Vec将文本转换为向量
@@ -104,8 +130,8 @@ class ContentBasedRecommender:
             # 如果没有词向量，返回零向量
             return np.zeros(self.vector_size)
     
-    def _text_to_vector_bert(self, text: str) -> np.ndarray:
-        """使用BERT将文本转换为向量
+    def _text_to_vector_encoder(self, text: str) -> np.ndarray:
+        """使用文本编码器将文本转换为向量
         
         Args:
             text: 输入文本
@@ -113,28 +139,17 @@ class ContentBasedRecommender:
         Returns:
             文本的向量表示
         """
-        if not BERT_AVAILABLE or self.bert_model is None:
-            # 备用方法
-            return self._text_to_vector_fallback(text)
-        
         try:
-            # 对文本进行编码
-            inputs = self.bert_tokenizer(text, return_tensors="pt", padding=True, truncation=True, max_length=512)
-            
-            # 不计算梯度
-            with torch.no_grad():
-                outputs = self.bert_model(**inputs)
-            
-            # 使用[CLS]标记的输出作为文本的向量表示
-            return outputs.last_hidden_state[:, 0, :].numpy()[0]
+            return self.encoder.encode([text])[0]
         except Exception as e:
-            print(f"Error in BERT encoding: {e}")
+            print(f"Error in {self.encoder.backend} encoding: {e}")
             return self._text_to_vector_fallback(text)
     
     def _text_to_vector_fallback(self, text: str) -> np.ndarray:
         """备用的文本向量化方法
         
-        当Word2Vec和BERT都不可用时使用
+        当Word2Vec和BERT都不可用时使用，按中文字符n-gram和英文单词做确定性的特征哈希，
+        不同进程对同一文本得到相同的向量
         
         Args:
             text: 输入文本
@@ -142,23 +157,7 @@ class ContentBasedRecommender:
         Returns:
             文本的向量表示
         """
-        # 简单的词频统计
-        # 在实际应用中，应该使用更复杂的方法
-        words = text.lower().split()
-        # 创建一个简单的向量，长度为100
-        vector = np.zeros(100)
-        
-        # 使用词的哈希值来填充向量
-        for i, word in enumerate(words):
-            hash_val = hash(word) % 100
-            vector[hash_val] += 1
-        
-        # 归一化
-        norm = np.linalg.norm(vector)
-        if norm > 0:
-            vector = vector / norm
-        
-        return vector
+        return self.hashing_embedder.transform_one(text)
     
     def _calculate_similarity(self, vec1: np.ndarray, vec2: np.ndarray) -> float:
         """计算两个向量的余弦相似度
@@ -193,10 +192,7 @@ class ContentBasedRecommender:
         text = f"{place.name} {place.description or ''} {' '.join(place.tags or [])}"
         
         # 使用选定的方法将文本转换为向量
-        if self.use_bert:
-            return self._text_to_vector_bert(text)
-        else:
-            return self._text_to_vector_word2vec(text)
+        return self._text_to_vector(text)
     
     def _get_food_vector(self, food: Food) -> np.ndarray:
         """获取美食的向量表示
@@ -211,10 +207,7 @@ class ContentBasedRecommender:
         text = f"{food.name} {food.description or ''} {' '.join(food.taste_tags or [])} {' '.join(food.signature_dishes or [])}"
         
         # 使用选定的方法将文本转换为向量
-        if self.use_bert:
-            return self._text_to_vector_bert(text)
-        else:
-            return self._text_to_vector_word2vec(text)
+        return self._text_to_vector(text)
     
     def _get_user_preference_vector(self, user: User) -> np.ndarray:
         """获取用户偏好的向量表示
@@ -235,10 +228,7 @@ class ContentBasedRecommender:
         text = " ".join(preferences)
         
         # 使用选定的方法将文本转换为向量
-        if self.use_bert:
-            return self._text_to_vector_bert(text)
-        else:
-            return self._text_to_vector_word2vec(text)
+        return self._text_to_vector(text)
     
     def recommend_places(self, user: User, places: List[Place], top_n: int = 10) -> List[Dict[str, Any]]:
         """为用户推荐景点
@@ -357,7 +347,7 @@ def get_content_based_recommendations(user_id: int, item_type: str = 'place', to
         推荐项目列表
     """
     # 初始化推荐器
-    recommender = ContentBasedRecommender(use_bert=BERT_AVAILABLE)
+    recommender = ContentBasedRecommender(use_bert=BERT_AVAILABLE, embedding_cache=get_embedding_cache())
     
     # 获取用户
     user = User.query.get(user_id)
@@ -394,7 +384,7 @@ def get_location_aware_recommendations(user_id: int, latitude: float, longitude:
         推荐项目列表
     """
     # 初始化推荐器
-    recommender = ContentBasedRecommender(use_bert=BERT_AVAILABLE)
+    recommender = ContentBasedRecommender(use_bert=BERT_AVAILABLE, embedding_cache=get_embedding_cache())
     
     # 获取用户
     user = User.query.get(user_id)
@@ -0,0 +1,247 @@
+import numpy as np
+from typing import List, Dict, Any, Optional, Tuple
+import os
+import time
+import sqlite3
+import hashlib
+import threading
+
+from ai_recommendation.search_metrics import metrics
+
+# 默认缓存文件路径，与backend/config.py中的EMBEDDING_CACHE_PATH一致
+DEFAULT_CACHE_PATH = os.environ.get(
+    'EMBEDDING_CACHE_PATH',
+    os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'backend', 'data', 'embedding_cache.sqlite3'))
+)
+
+# 默认最多缓存的向量数量
+DEFAULT_MAX_ENTRIES = int(os.environ.get('EMBEDDING_CACHE_MAX_ENTRIES', 200000))
+
+
+class EmbeddingCache:
+    """持久化的文本向量缓存
+    
+    以模型标识和文本内容的哈希为键，把向量保存在本地SQLite文件中，
+    文本没有变化时重新建索引或计算用户向量都可以跳过模型推理。
+    条目数超过上限时按最近使用时间淘汰最旧的条目。
+    """
+    
+    # 超出上限时一次淘汰到上限的这个比例，避免每次写入都触发淘汰
+    EVICT_TO_RATIO = 0.9
+    
+    def __init__(self, path: str = DEFAULT_CACHE_PATH, max_entries: int = DEFAULT_MAX_ENTRIES):
+        """初始化缓存
+        
+        Args:
+            path: SQLite文件路径，':memory:'表示只在进程内缓存
+            max_entries: 最多缓存的向量数量
+        """
+        self.path = path
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        
+        if path != ':memory:':
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        
+        self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        # WAL模式下多个工作进程可以同时读取
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings ("
+            "key TEXT PRIMARY KEY, model_id TEXT NOT NULL, dim INTEGER NOT NULL, "
+            "vector BLOB NOT NULL, last_used REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_embeddings_last_used ON embeddings (last_used)")
+        self._conn.commit()
+        
+        self._count = self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+    
+    @staticmethod
+    def make_key(model_id: str, text: str) -> str:
+        """根据模型标识和文本内容生成缓存键
+        
+        Args:
+            model_id: 模型标识
+            text: 文本
+        
+        Returns:
+            缓存键
+        """
+        return hashlib.sha1(f"{model_id}\0{text}".encode('utf-8')).hexdigest()
+    
+    def get_many(self, model_id: str, texts: List[str]) -> List[Optional[np.ndarray]]:
+        """批量读取文本向量
+        
+        Args:
+            model_id: 模型标识
+            texts: 文本列表
+        
+        Returns:
+            与texts一一对应的向量，未命中的位置为None
+        """
+        if not texts:
+            return []
+        
+        keys = [self.make_key(model_id, text) for text in texts]
+        found = {}
+        
+        with self._lock:
+            # SQLite对单条语句的参数数量有限制，分批查询
+            for start in range(0, len(keys), 500):
+                batch = list(set(keys[start:start + 500]))
+                placeholders = ','.join('?' * len(batch))
+                rows = self._conn.execute(
+                    f"SELECT key, dim, vector FROM embeddings WHERE key IN ({placeholders})", batch
+                ).fetchall()
+                for key, dim, blob in rows:
+                    found[key] = np.frombuffer(blob, dtype='float32', count=dim)
+            
+            # 更新最近使用时间
+            if found:
+                now = time.time()
+                self._conn.executemany("UPDATE embeddings SET last_used = ? WHERE key = ?",
+                                       [(now, key) for key in found])
+                self._conn.commit()
+        
+        result = [found.get(key) for key in keys]
+        hits = sum(1 for vector in result if vector is not None)
+        self.hits += hits
+        self.misses += len(result) - hits
+        return result
+    
+    def get(self, model_id: str, text: str) -> Optional[np.ndarray]:
+        """读取单个文本的向量
+        
+        Args:
+            model_id: 模型标识
+            text: 文本
+        
+        Returns:
+            向量，未命中时为None
+        """
+        return self.get_many(model_id, [text])[0]
+    
+    def put_many(self, model_id: str, texts: List[str], vectors: np.ndarray):
+        """批量写入文本向量
+        
+        Args:
+            model_id: 模型标识
+            texts: 文本列表
+            vectors: 与texts一一对应的向量
+        """
+        if not texts:
+            return
+        
+        now = time.time()
+        rows = []
+        for text, vector in zip(texts, vectors):
+            vector = np.ascontiguousarray(vector, dtype='float32')
+            rows.append((self.make_key(model_id, text), model_id, len(vector), vector.tobytes(), now))
+        
+        with self._lock:
+            before = self._conn.total_changes
+            self._conn.executemany(
+                "INSERT OR IGNORE INTO embeddings (key, model_id, dim, vector, last_used) VALUES (?, ?, ?, ?, ?)",
+                rows
+            )
+            self._count += self._conn.total_changes - before
+            self._conn.commit()
+            
+            if self._count > self.max_entries:
+                self._evict()
+    
+    def put(self, model_id: str, text: str, vector: np.ndarray):
+        """写入单个文本的向量
+        
+        Args:
+            model_id: 模型标识
+            text: 文本
+            vector: 向量
+        """
+        self.put_many(model_id, [text], [vector])
+    
+    def _evict(self):
+        """按最近使用时间淘汰最旧的条目，调用方需持有锁"""
+        # 其他进程也可能写入，以数据库中的实际数量为准
+        self._count = self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+        excess = self._count - int(self.max_entries * self.EVICT_TO_RATIO)
+        
+        if excess > 0 and self._count > self.max_entries:
+            self._conn.execute(
+                "DELETE FROM embeddings WHERE key IN "
+                "(SELECT key FROM embeddings ORDER BY last_used LIMIT ?)", (excess,)
+            )
+            self._conn.commit()
+            self._count -= excess
+    
+    def clear(self):
+        """清空缓存"""
+        with self._lock:
+            self._conn.execute("DELETE FROM embeddings")
+            self._conn.commit()
+            self._count = 0
+    
+    def stats(self) -> Dict[str, Any]:
+        """缓存统计信息
+        
+        Returns:
+            条目数、命中次数、未命中次数和命中率
+        """
+        total = self.hits + self.misses
+        return {
+            'entries': self._count,
+            'max_entries': self.max_entries,
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / total if total else 0.0
+        }
+    
+    def __len__(self) -> int:
+        return self._count
+
+
+# 每个进程按文件路径共享缓存实例
+_caches = {}
+_caches_lock = threading.Lock()
+
+
+def get_embedding_cache(path: str = DEFAULT_CACHE_PATH, max_entries: int = DEFAULT_MAX_ENTRIES) -> Optional[EmbeddingCache]:
+    """获取进程级的向量缓存
+    
+    Args:
+        path: SQLite文件路径，为None时不使用缓存
+        max_entries: 最多缓存的向量数量
+    
+    Returns:
+        向量缓存，path为None或无法打开缓存文件时返回None
+    """
+    if not path:
+        return None
+    
+    with _caches_lock:
+        if path not in _caches:
+            try:
+                _caches[path] = EmbeddingCache(path, max_entries)
+            except (sqlite3.Error, OSError) as e:
+                print(f"Error opening embedding cache: {e}")
+                return None
+        return _caches[path]
+
+
+def _collect_cache_metrics() -> List[Tuple[str, str, Dict[str, Any], float]]:
+    """导出进程中各向量缓存的条目数、命中次数和命中率"""
+    samples = []
+    for path, cache in list(_caches.items()):
+        stats = cache.stats()
+        labels = {'cache': os.path.basename(path)}
+        samples.append(('embedding_cache_entries', '向量缓存中的条目数', labels, stats['entries']))
+        samples.append(('embedding_cache_hits', '进程启动以来的缓存命中次数', labels, stats['hits']))
+        samples.append(('embedding_cache_misses', '进程启动以来的缓存未命中次数', labels, stats['misses']))
+        samples.append(('embedding_cache_hit_ratio', '缓存命中率', labels, stats['hit_rate']))
+    return samples
+
+
+metrics.register_collector(_collect_cache_metrics)
@@ -0,0 +1,531 @@
+import numpy as np
+from typing import List, Dict, Any, Optional, Tuple, Set
+import sys
+import os
+import json
+import time
+import itertools
+import argparse
+import platform
+from concurrent.futures import ProcessPoolExecutor
+
+# 添加项目根目录到系统路径，以便导入backend模块
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+# 导入后端模型
+from backend.models import db
+from backend.models.user import User
+from backend.models.place import Place
+from backend.models.food import Food
+from backend.models.interaction import Interaction
+from ai_recommendation.collaborative_filter import CollaborativeFilterRecommender, merge_interactions
+
+
+# 测试窗口中评分不低于该值的交互算作相关物品（浏览折算为3分）
+DEFAULT_MIN_RELEVANT_RATING = 3.0
+
+
+def load_interaction_records(item_type: str, batch_size: int = 10000) -> List[Tuple[int, int, int, str, Optional[float], float]]:
+    """从交互记录表按时间顺序读取某类物品的全部原始记录
+    
+    Args:
+        item_type: 物品类型，'place'或'food'
+        batch_size: 每次从数据库读取的行数
+    
+    Returns:
+        (记录ID, user_id, item_id, action, value, 时间戳)列表，按时间和记录ID升序
+    """
+    query = db.session.query(
+        Interaction.id, Interaction.user_id, Interaction.item_id, Interaction.action, Interaction.value,
+        Interaction.created_at
+    ).filter(
+        Interaction.item_type == item_type
+    ).order_by(Interaction.created_at, Interaction.id).yield_per(batch_size)
+    
+    return [(record_id, user_id, item_id, action, value, created_at.timestamp() if created_at else 0.0)
+            for record_id, user_id, item_id, action, value, created_at in query]
+
+
+def time_split_folds(records: List[Tuple[int, int, int, str, Optional[float], float]], n_folds: int = 3,
+                     test_fraction: float = 0.2,
+                     min_relevant_rating: float = DEFAULT_MIN_RELEVANT_RATING) -> List[Dict[str, Any]]:
+    """按时间把交互记录切分为滚动的训练/测试折
+    
+    把最后test_fraction的记录按时间均分为n_folds个测试窗口，第i折用第i个窗口之前的全部记录训练，
+    在该窗口上测试。测试用户是训练集中出现过、并且在窗口中有新的相关物品的用户，
+    相关物品是窗口中合并后评分不低于min_relevant_rating、且训练集中没有交互过的物品
+    
+    Args:
+        records: load_interaction_records返回的记录，按时间升序
+        n_folds: 折数
+        test_fraction: 用于测试的记录比例
+        min_relevant_rating: 相关物品的最低评分
+    
+    Returns:
+        折列表，每折包含fold、train（合并后的训练交互）、relevant（用户ID到相关物品ID集合）、
+        train_end和test_end（时间戳）
+    """
+    n_records = len(records)
+    n_test = int(n_records * test_fraction)
+    if n_folds < 1 or n_test < n_folds:
+        return []
+    
+    boundaries = [n_records - n_test + n_test * i // n_folds for i in range(n_folds + 1)]
+    
+    folds = []
+    for fold, (train_end, test_end) in enumerate(zip(boundaries[:-1], boundaries[1:])):
+        train = merge_interactions(record[1:5] for record in records[:train_end])
+        seen = {(interaction['user_id'], interaction['item_id']) for interaction in train}
+        train_users = {user_id for user_id, _ in seen}
+        
+        relevant = {}
+        for interaction in merge_interactions(record[1:5] for record in records[train_end:test_end]):
+            key = (interaction['user_id'], interaction['item_id'])
+            if key[0] in train_users and key not in seen and interaction['rating'] >= min_relevant_rating:
+                relevant.setdefault(key[0], set()).add(key[1])
+        
+        folds.append({
+            'fold': fold,
+            'train': train,
+            'relevant': relevant,
+            'train_end': records[train_end - 1][5] if train_end else None,
+            'test_end': records[test_end - 1][5]
+        })
+    
+    return folds
+
+
+def ranking_metrics(recommendations: Dict[int, List[int]], relevant: Dict[int, Set[int]], k: int,
+                    catalog_size: int) -> Dict[str, float]:
+    """计算Top-K推荐的排序指标
+    
+    Args:
+        recommendations: 用户ID到推荐物品ID列表（按排序）的映射
+        relevant: 用户ID到相关物品ID集合的映射，以其中的用户为准求平均
+        k: 截断位置
+        catalog_size: 物品总数，用于计算覆盖率
+    
+    Returns:
+        precision、recall、ndcg、hit_rate（前K个中至少命中一个的用户比例）和coverage（被推荐过的物品占比）
+    """
+    if not relevant:
+        return {'precision': 0.0, 'recall': 0.0, 'ndcg': 0.0, 'hit_rate': 0.0, 'coverage': 0.0}
+    
+    # 位置i的折扣为1/log2(i+2)
+    discounts = 1.0 / np.log2(np.arange(k) + 2)
+    
+    precision = recall = ndcg = hit_rate = 0.0
+    recommended_items = set()
+    for user_id, items in relevant.items():
+        ranked = recommendations.get(user_id, [])[:k]
+        recommended_items.update(ranked)
+        
+        hits = np.array([item_id in items for item_id in ranked], dtype=bool)
+        n_hits = int(hits.sum())
+        
+        precision += n_hits / k
+        recall += n_hits / len(items)
+        hit_rate += n_hits > 0
+        ideal = discounts[:min(len(items), k)].sum()
+        ndcg += discounts[:len(ranked)][hits].sum() / ideal
+    
+    n_users = len(relevant)
+    return {
+        'precision': precision / n_users,
+        'recall': recall / n_users,
+        'ndcg': float(ndcg / n_users),
+        'hit_rate': hit_rate / n_users,
+        'coverage': len(recommended_items) / catalog_size if catalog_size else 0.0
+    }
+
+
+class EvaluationModel:
+    """参与离线评估的推荐模型
+    
+    子类实现fit和recommend：fit用一折的训练交互训练，recommend为一个用户返回前k个物品ID，
+    不包含该用户在训练集中交互过的物品
+    """
+    
+    name = None
+    
+    def __init__(self, item_type: str = 'place', **params):
+        """初始化模型
+        
+        Args:
+            item_type: 物品类型，'place'或'food'
+            **params: 模型参数，网格搜索的每组取值分别创建一个实例
+        """
+        self.item_type = item_type
+        self.params = params
+        self.seen = {}
+    
+    def fit(self, train: List[Dict[str, Any]]):
+        """用训练交互训练模型
+        
+        Args:
+            train: 合并后的训练交互，每个记录包含user_id, item_id和rating
+        """
+        self.seen = {}
+        for interaction in train:
+            self.seen.setdefault(interaction['user_id'], set()).add(interaction['item_id'])
+    
+    def recommend(self, user_id: int, k: int) -> List[int]:
+        """为用户推荐前k个物品
+        
+        Args:
+            user_id: 用户ID
+            k: 推荐数量
+        
+        Returns:
+            物品ID列表
+        """
+        raise NotImplementedError
+    
+    def _unseen(self, user_id: int, item_ids: List[int], k: int) -> List[int]:
+        """从排好序的物品中去掉用户交互过的物品，取前k个"""
+        seen = self.seen.get(user_id, set())
+        return [item_id for item_id in item_ids if item_id not in seen][:k]
+
+
+class PopularityModel(EvaluationModel):
+    """按训练集中的交互次数推荐最热门的物品，作为基线"""
+    
+    name = 'popularity'
+    
+    def fit(self, train: List[Dict[str, Any]]):
+        super().fit(train)
+        counts = {}
+        for interaction in train:
+            counts[interaction['item_id']] = counts.get(interaction['item_id'], 0) + 1
+        self.ranking = sorted(counts, key=lambda item_id: (-counts[item_id], item_id))
+    
+    def recommend(self, user_id: int, k: int) -> List[int]:
+        return self._unseen(user_id, self.ranking[:k + len(self.seen.get(user_id, ()))], k)
+
+
+class CollaborativeFilterModel(EvaluationModel):
+    """协同过滤模型
+    
+    参数method为'user'、'item'或'mf'，use_svd、n_neighbors和factorization（默认与CF_FACTORIZATION一样为als）
+    传给CollaborativeFilterRecommender，其余参数（如n_factors、iterations、alpha）作为ImplicitALS的参数
+    """
+    
+    name = 'cf'
+    
+    RECOMMENDER_PARAMS = ('use_svd', 'n_neighbors', 'factorization')
+    
+    def fit(self, train: List[Dict[str, Any]]):
+        super().fit(train)
+        params = dict(self.params)
+        self.method = params.pop('method', 'item')
+        options = {name: params.pop(name) for name in self.RECOMMENDER_PARAMS if name in params}
+        options.setdefault('factorization', 'als')
+        self.recommender = CollaborativeFilterRecommender(als_options=params, **options)
+        self.recommender._build_user_item_matrix(train, item_type=self.item_type)
+    
+    def recommend(self, user_id: int, k: int) -> List[int]:
+        # 推荐结果已经去掉了用户评分过的物品
+        return [item_id for item_id, _ in self.recommender.recommend_item_ids(user_id, k, self.method)]
+
+
+class ContentBasedModel(EvaluationModel):
+    """基于内容的推荐，需要在应用上下文中从数据库读取用户和物品
+    
+    参数encoder为text_encoders中的编码器后端，默认使用哈希向量化
+    """
+    
+    name = 'content'
+    
+    def fit(self, train: List[Dict[str, Any]]):
+        from ai_recommendation.content_based import ContentBasedRecommender
+        from ai_recommendation.text_encoders import create_encoder
+        
+        super().fit(train)
+        encoder = self.params.get('encoder', 'hashing')
+        self.recommender = ContentBasedRecommender(use_bert=False, encoder=create_encoder(encoder))
+        model = Place if self.item_type == 'place' else Food
+        self.items = model.query.all()
+        self.users = {user.id: user for user in User.query.filter(User.id.in_(list(self.seen))).all()}
+        
+        # 物品向量在fit中计算，不计入推荐耗时
+        to_vector = self.recommender._get_place_vector if self.item_type == 'place' else self.recommender._get_food_vector
+        for item in self.items:
+            to_vector(item)
+    
+    def recommend(self, user_id: int, k: int) -> List[int]:
+        user = self.users.get(user_id)
+        if user is None:
+            return []
+        
+        recommend = self.recommender.recommend_places if self.item_type == 'place' else self.recommender.recommend_foods
+        ranked = recommend(user, self.items, top_n=k + len(self.seen.get(user_id, ())))
+        return self._unseen(user_id, [item['id'] for item in ranked], k)
+
+
+class VectorSearchModel(EvaluationModel):
+    """用户偏好向量在向量索引中的近邻搜索，需要在应用上下文中从数据库读取用户和物品
+    
+    参数encoder为text_encoders中的编码器后端（默认hashing），use_faiss和faiss_index_type传给VectorSearchEngine
+    """
+    
+    name = 'vector'
+    
+    def fit(self, train: List[Dict[str, Any]]):
+        from ai_recommendation.vector_search import VectorSearchEngine
+        from ai_recommendation.text_encoders import create_encoder
+        
+        super().fit(train)
+        self.engine = VectorSearchEngine(use_bert=False, use_faiss=self.params.get('use_faiss', True),
+                                         faiss_index_type=self.params.get('faiss_index_type', 'flat'),
+                                         encoder=create_encoder(self.params.get('encoder', 'hashing')))
+        model = Place if self.item_type == 'place' else Food
+        if self.item_type == 'place':
+            self.engine.build_place_index(model.query.all())
+        else:
+            self.engine.build_food_index(model.query.all())
+        self.users = {user.id: user for user in User.query.filter(User.id.in_(list(self.seen))).all()}
+    
+    def recommend(self, user_id: int, k: int) -> List[int]:
+        user = self.users.get(user_id)
+        if user is None:
+            return []
+        
+        top_n = k + len(self.seen.get(user_id, ()))
+        results = self.engine.recommend_batch([user], self.item_type, top_n, n_jobs=1).get(user_id, [])
+        return self._unseen(user_id, [item_id for item_id, _ in results], k)
+
+
+# 模型名称 -> 评估模型类
+MODELS = {model.name: model for model in (PopularityModel, CollaborativeFilterModel, ContentBasedModel, VectorSearchModel)}
+
+
+def expand_grid(grid: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """把参数网格展开为参数组合，列表值为候选取值，其余值固定
+    
+    Args:
+        grid: 参数名到取值（或取值列表）的映射
+    
+    Returns:
+        参数字典列表，空网格返回[{}]
+    """
+    names = sorted(grid)
+    values = [grid[name] if isinstance(grid[name], list) else [grid[name]] for name in names]
+    return [dict(zip(names, combination)) for combination in itertools.product(*values)]
+
+
+# 工作进程中的折数据和应用上下文，由_init_worker设置
+_worker_folds = None
+_worker_context = None
+
+
+def _init_worker(folds: List[Dict[str, Any]], env: Optional[str] = None):
+    """工作进程初始化：保存折数据，需要数据库时创建应用上下文"""
+    global _worker_folds, _worker_context
+    _worker_folds = folds
+    
+    if env is not None:
+        from backend.config import DevelopmentConfig, ProductionConfig
+        from ai_recommendation.vector_search import _create_cli_app
+        
+        _worker_context = _create_cli_app(DevelopmentConfig if env == 'dev' else ProductionConfig).app_context()
+        _worker_context.push()
+
+
+def _run_task(model_name: str, params: Dict[str, Any], fold_index: int, item_type: str, k: int,
+              catalog_size: int, random_state: int) -> Dict[str, Any]:
+    """在一折上训练和评估一组参数，返回指标和耗时"""
+    np.random.seed(random_state)
+    fold = _worker_folds[fold_index]
+    model = MODELS[model_name](item_type=item_type, **params)
+    
+    start_time = time.perf_counter()
+    model.fit(fold['train'])
+    fit_seconds = time.perf_counter() - start_time
+    
+    recommendations = {}
+    latencies = []
+    for user_id in sorted(fold['relevant']):
+        start_time = time.perf_counter()
+        recommendations[user_id] = model.recommend(user_id, k)
+        latencies.append(time.perf_counter() - start_time)
+    
+    result = ranking_metrics(recommendations, fold['relevant'], k, catalog_size)
+    result.update({
+        'fold': fold['fold'],
+        'test_users': len(fold['relevant']),
+        'fit_seconds': fit_seconds,
+        'inference_ms_mean': float(np.mean(latencies) * 1000) if latencies else 0.0,
+        'inference_ms_p95': float(np.percentile(latencies, 95) * 1000) if latencies else 0.0
+    })
+    return result
+
+
+def run_evaluation(folds: List[Dict[str, Any]], configurations: List[Tuple[str, Dict[str, Any]]],
+                   item_type: str = 'place', k: int = 10, catalog_size: int = None, workers: int = 1,
+                   env: Optional[str] = None, random_state: int = 42) -> Dict[str, Any]:
+    """在所有折上评估所有模型配置
+    
+    每个(配置, 折)是一个独立任务，workers大于1时在ProcessPoolExecutor中并行执行，
+    折数据在每个工作进程初始化时传入一次。推荐耗时按单个用户计时，因此并行度会影响耗时的绝对值
+    
+    Args:
+        folds: time_split_folds返回的折
+        configurations: (模型名称, 参数)列表，参数已经展开
+        item_type: 物品类型
+        k: 推荐数量
+        catalog_size: 物品总数，为None时为交互中出现过的物品数
+        workers: 并行的进程数
+        env: 'dev'或'prod'，content和vector模型需要在工作进程中访问数据库时传入
+        random_state: 每个任务开始时设置的随机种子
+    
+    Returns:
+        评估报告，results中每个配置包含各折的结果和平均值
+    """
+    if catalog_size is None:
+        items = set()
+        for fold in folds:
+            items.update(interaction['item_id'] for interaction in fold['train'])
+            for user_items in fold['relevant'].values():
+                items.update(user_items)
+        catalog_size = len(items)
+    
+    tasks = [(name, params, fold_index, item_type, k, catalog_size, random_state)
+             for name, params in configurations for fold_index in range(len(folds))]
+    
+    start_time = time.perf_counter()
+    if workers > 1:
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(folds, env)) as pool:
+            outputs = list(pool.map(_run_task, *zip(*tasks)))
+    else:
+        _init_worker(folds)
+        outputs = [_run_task(*task) for task in tasks]
+    total_seconds = time.perf_counter() - start_time
+    
+    results = []
+    for index, (name, params) in enumerate(configurations):
+        fold_results = outputs[index * len(folds):(index + 1) * len(folds)]
+        metric_names = [name for name in fold_results[0] if name not in ('fold', 'test_users')] if fold_results else []
+        results.append({
+            'model': name,
+            'params': params,
+            'folds': fold_results,
+            'mean': {metric: float(np.mean([result[metric] for result in fold_results])) for metric in metric_names}
+        })
+    
+    return {
+        'item_type': item_type,
+        'k': k,
+        'catalog_size': catalog_size,
+        'random_state': random_state,
+        'workers': workers,
+        'total_seconds': total_seconds,
+        'folds': [{
+            'fold': fold['fold'],
+            'train_interactions': len(fold['train']),
+            'test_users': len(fold['relevant']),
+            'train_end': fold['train_end'],
+            'test_end': fold['test_end']
+        } for fold in folds],
+        'results': results,
+        'environment': {
+            'python': platform.python_version(),
+            'numpy': np.__version__,
+            'platform': platform.platform(),
+            'cpu_count': os.cpu_count()
+        },
+        'generated_at': time.strftime('%Y-%m-%d %H:%M:%S')
+    }
+
+
+def format_report(report: Dict[str, Any]) -> str:
+    """把评估报告格式化为文本表格，按NDCG降序"""
+    k = report['k']
+    lines = [
+        f"{report['item_type']}: {len(report['folds'])} 折, 物品数 {report['catalog_size']}, "
+        f"耗时 {report['total_seconds']:.1f}s",
+        f"  {'模型':<40} {'P@' + str(k):>8} {'R@' + str(k):>8} {'NDCG':>8} {'命中率':>8} {'覆盖率':>8} "
+        f"{'训练(s)':>9} {'推荐(ms)':>9} {'P95(ms)':>9}"
+    ]
+    
+    for result in sorted(report['results'], key=lambda result: -result['mean'].get('ndcg', 0)):
+        name = result['model']
+        if result['params']:
+            name += ' ' + ','.join(f"{key}={value}" for key, value in sorted(result['params'].items()))
+        mean = result['mean']
+        lines.append(f"  {name:<40} {mean.get('precision', 0):>8.4f} {mean.get('recall', 0):>8.4f} "
+                     f"{mean.get('ndcg', 0):>8.4f} {mean.get('hit_rate', 0):>8.4f} {mean.get('coverage', 0):>8.4f} "
+                     f"{mean.get('fit_seconds', 0):>9.2f} {mean.get('inference_ms_mean', 0):>9.2f} "
+                     f"{mean.get('inference_ms_p95', 0):>9.2f}")
+    
+    return '\n'.join(lines)
+
+
+def parse_model_spec(spec: str) -> Tuple[str, Dict[str, Any]]:
+    """解析命令行的模型配置，格式为 名称 或 名称:JSON参数网格，如 cf:{"method": ["item", "mf"]}"""
+    name, _, grid = spec.partition(':')
+    if name not in MODELS:
+        raise ValueError(f"Unknown model: {name}")
+    return name, json.loads(grid) if grid else {}
+
+
+def main():
+    """命令行入口：从交互记录表按时间切分，评估各推荐模型并输出报告"""
+    parser = argparse.ArgumentParser(description='推荐模型离线评估工具')
+    parser.add_argument('--env', choices=['dev', 'prod'], default='dev',
+                        help='环境配置: dev (开发) 或 prod (生产)')
+    parser.add_argument('--type', dest='item_type', choices=['place', 'food'], default='place', help='物品类型')
+    parser.add_argument('--model', dest='models', action='append',
+                        help='模型配置，可重复，格式为 名称[:JSON参数网格]，名称为 ' + '、'.join(MODELS) +
+                             '，如 --model popularity --model \'cf:{"method": ["item", "user", "mf"]}\'')
+    parser.add_argument('--folds', type=int, default=3, help='按时间滚动切分的折数')
+    parser.add_argument('--test-fraction', type=float, default=0.2, help='用于测试的最后一部分记录的比例')
+    parser.add_argument('--k', type=int, default=10, help='推荐数量')
+    parser.add_argument('--min-rating', type=float, default=DEFAULT_MIN_RELEVANT_RATING, help='相关物品的最低评分')
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, help='并行的进程数')
+    parser.add_argument('--seed', type=int, default=42, help='随机种子')
+    parser.add_argument('--output', help='JSON报告的输出文件')
+    
+    args = parser.parse_args()
+    
+    from backend.config import DevelopmentConfig, ProductionConfig
+    from ai_recommendation.vector_search import _create_cli_app
+    config = DevelopmentConfig if args.env == 'dev' else ProductionConfig
+    
+    configurations = []
+    for spec in args.models or ['popularity', 'cf:{"method": ["item", "user", "mf"]}']:
+        name, grid = parse_model_spec(spec)
+        configurations.extend((name, params) for params in expand_grid(grid))
+    
+    with _create_cli_app(config).app_context():
+        records = load_interaction_records(args.item_type)
+        model = Place if args.item_type == 'place' else Food
+        catalog_size = model.query.count()
+    
+    folds = time_split_folds(records, n_folds=args.folds, test_fraction=args.test_fraction,
+                             min_relevant_rating=args.min_rating)
+    if not folds:
+        print(f"交互记录太少（{len(records)} 条），无法切分为 {args.folds} 折")
+        return
+    
+    # 只有需要访问数据库的模型才在工作进程中创建应用上下文
+    needs_db = any(name in ('content', 'vector') for name, _ in configurations)
+    workers = min(args.workers, len(configurations) * len(folds))
+    if needs_db and workers <= 1:
+        with _create_cli_app(config).app_context():
+            report = run_evaluation(folds, configurations, args.item_type, args.k, catalog_size, workers,
+                                    random_state=args.seed)
+    else:
+        report = run_evaluation(folds, configurations, args.item_type, args.k, catalog_size, workers,
+                                env=args.env if needs_db else None, random_state=args.seed)
+    report['records'] = len(records)
+    
+    print(format_report(report))
+    
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"报告已写入: {args.output}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,145 @@
+import numpy as np
+from typing import List, Tuple, Optional
+import re
+import zlib
+
+# 中文（含扩展A区）连续字符和英文/数字单词
+_TOKEN_PATTERN = re.compile(r'[㐀-䶿一-鿿]+|[a-z0-9]+')
+_CJK_PATTERN = re.compile(r'[㐀-䶿一-鿿]')
+
+
+class HashingEmbedder:
+    """确定性的特征哈希文本向量化
+    
+    没有Word2Vec和BERT时使用。中文按字切分后取n-gram，英文和数字按单词切分，
+    每个词项用zlib.crc32映射到固定维度的桶中。crc32与进程无关，不受PYTHONHASHSEED影响，
+    因此不同工作进程和重启前后得到相同的向量，保存的索引可以直接复用。
+    哈希值的最高位决定词项的正负号，使桶冲突在期望上相互抵消。
+    词频使用1+log(tf)平滑，可以再乘以在语料上统计的IDF权重。
+    """
+    
+    # 词项到(桶号, 符号)的缓存上限，超过后清空
+    MAX_CACHE_SIZE = 500000
+    
+    def __init__(self, dim: int = 100, ngram_range: Tuple[int, int] = (1, 2)):
+        """初始化向量化器
+        
+        Args:
+            dim: 向量维度（哈希桶数量）
+            ngram_range: 中文字符n-gram的最小和最大长度
+        """
+        self.dim = dim
+        self.ngram_range = ngram_range
+        self._token_cache = {}
+    
+    def tokenize(self, text: str) -> List[str]:
+        """把文本切分为词项
+        
+        Args:
+            text: 输入文本
+        
+        Returns:
+            词项列表，中文为字符n-gram，其他为小写单词
+        """
+        tokens = []
+        min_n, max_n = self.ngram_range
+        
+        for match in _TOKEN_PATTERN.finditer((text or '').lower()):
+            run = match.group()
+            if not _CJK_PATTERN.match(run):
+                tokens.append(run)
+                continue
+            
+            for n in range(min_n, max_n + 1):
+                tokens.extend(run[i:i + n] for i in range(len(run) - n + 1))
+        
+        return tokens
+    
+    def _hash_token(self, token: str) -> Tuple[int, float]:
+        """计算词项的桶号和符号"""
+        cached = self._token_cache.get(token)
+        if cached is None:
+            hash_value = zlib.crc32(token.encode('utf-8'))
+            cached = (hash_value % self.dim, -1.0 if hash_value & 0x80000000 else 1.0)
+            
+            if len(self._token_cache) >= self.MAX_CACHE_SIZE:
+                self._token_cache.clear()
+            self._token_cache[token] = cached
+        
+        return cached
+    
+    def term_frequencies(self, texts: List[str]) -> np.ndarray:
+        """批量计算带符号的哈希词频矩阵
+        
+        所有文档的(行, 桶, 符号)收集到数组后用一次bincount累加
+        
+        Args:
+            texts: 文本列表
+        
+        Returns:
+            形状为(文本数量, dim)的float32矩阵，已做1+log(tf)平滑，未归一化
+        """
+        rows, buckets, signs = [], [], []
+        for row, text in enumerate(texts):
+            for token in self.tokenize(text):
+                bucket, sign = self._hash_token(token)
+                rows.append(row)
+                buckets.append(bucket)
+                signs.append(sign)
+        
+        counts = np.bincount(np.asarray(rows, dtype='int64') * self.dim + np.asarray(buckets, dtype='int64'),
+                             weights=np.asarray(signs, dtype='float64'),
+                             minlength=len(texts) * self.dim).reshape(len(texts), self.dim)
+        
+        # 子线性词频，保留冲突后的符号
+        magnitude = np.abs(counts)
+        return np.where(magnitude > 0, np.sign(counts) * (1.0 + np.log(np.maximum(magnitude, 1.0))), 0.0).astype('float32')
+    
+    @staticmethod
+    def compute_idf(term_frequencies: np.ndarray, n_documents: int = None,
+                    document_frequencies: np.ndarray = None) -> np.ndarray:
+        """根据词频矩阵计算每个桶的平滑IDF权重
+        
+        Args:
+            term_frequencies: term_frequencies返回的矩阵，给出document_frequencies时可以为None
+            n_documents: 文档数量，默认为词频矩阵的行数
+            document_frequencies: 已累计的每个桶的文档频率，用于分块统计
+        
+        Returns:
+            形状为(dim,)的float32权重
+        """
+        if document_frequencies is None:
+            document_frequencies = np.count_nonzero(term_frequencies, axis=0)
+        if n_documents is None:
+            n_documents = len(term_frequencies)
+        
+        return (np.log((1.0 + n_documents) / (1.0 + np.asarray(document_frequencies))) + 1.0).astype('float32')
+    
+    def transform(self, texts: List[str], idf: Optional[np.ndarray] = None) -> np.ndarray:
+        """批量将文本转换为归一化的向量
+        
+        Args:
+            texts: 文本列表
+            idf: 每个桶的IDF权重，为None时只使用词频
+        
+        Returns:
+            形状为(文本数量, dim)的float32矩阵，每行为单位向量或零向量
+        """
+        vectors = self.term_frequencies(texts)
+        if idf is not None:
+            vectors *= idf
+        
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        return np.divide(vectors, norms, out=np.zeros_like(vectors), where=norms > 0)
+    
+    def transform_one(self, text: str, idf: Optional[np.ndarray] = None) -> np.ndarray:
+        """将单个文本转换为归一化的向量
+        
+        Args:
+            text: 输入文本
+            idf: 每个桶的IDF权重
+        
+        Returns:
+            形状为(dim,)的float32向量
+        """
+        return self.transform([text], idf)[0]
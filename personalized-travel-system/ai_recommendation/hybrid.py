@@ -0,0 +1,463 @@
+import numpy as np
+from typing import List, Dict, Any, Tuple
+import sys
+import os
+import time
+import threading
+from collections import OrderedDict
+
+# 添加项目根目录到系统路径，以便导入backend模块
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+# 导入后端模型
+from backend.models import db
+from backend.models.user import User
+from backend.models.place import Place
+from backend.models.food import Food
+from backend.utils.cache import TTLCache
+from ai_recommendation.vector_search import (VectorSearchRegistry, get_vector_search_registry, _fetch_items_by_ids,
+                                             _haversine_km)
+from ai_recommendation.collaborative_filter import CollaborativeFilterRegistry, get_collaborative_filter_registry
+from ai_recommendation.search_metrics import metrics, LATENCY_BUCKETS
+
+# 混合推荐的运行指标
+HYBRID_STAGE_SECONDS = metrics.histogram('hybrid_recommend_stage_seconds', '混合推荐各阶段的耗时（秒）',
+                                         ('item_type', 'stage'), LATENCY_BUCKETS)
+HYBRID_CANDIDATE_CACHE = metrics.counter('hybrid_candidate_cache_total', '候选集缓存的命中和未命中次数',
+                                         ('item_type', 'result'))
+HYBRID_SKIPPED_SOURCES = metrics.counter('hybrid_skipped_sources_total', '因超出延迟预算而跳过的候选来源和打分项次数',
+                                         ('item_type', 'source'))
+
+# 各打分项的默认权重
+DEFAULT_WEIGHTS = {
+    'content': 0.35,
+    'cf': 0.4,
+    'distance': 0.15,
+    'quality': 0.1
+}
+
+
+class HybridRecommender:
+    """两阶段混合推荐
+    
+    第一阶段从几个低成本的来源召回候选：用户偏好向量在向量索引中的近邻（ann）、
+    协同过滤模型的矩阵分解Top-N和用户评分过的物品的相似物品（cf）、当前位置附近的物品（nearby），
+    以及按评分排序的热门物品（popular，保证冷启动用户也有结果）。每个用户的候选集缓存cache_ttl秒。
+    第二阶段只对几百个候选从数据库取一次对象，计算内容相似度、协同过滤预测评分、距离和物品评分，
+    按权重加权后取前N个。
+    
+    每个请求有延迟预算：每个召回来源和耗时的打分项（content、cf）开始前检查剩余时间，预算用完时跳过
+    剩下的来源和打分项，热门物品总会加入，按距离和物品评分排序总会完成。已经开始的步骤不会被中断，
+    因此这是按步骤检查的软预算，超出的时间最多为一个步骤的耗时。用户偏好向量在一个请求中只计算一次，
+    并和候选集一起缓存。不会在请求中训练模型或构建索引，向量索引或协同过滤模型尚未就绪时只使用其他来源
+    """
+    
+    SOURCES = ('ann', 'cf', 'nearby', 'popular')
+    
+    def __init__(self, vector_registry: VectorSearchRegistry = None, cf_registry: CollaborativeFilterRegistry = None,
+                 weights: Dict[str, float] = None, max_candidates: int = 300, candidates_per_source: int = 100,
+                 cache_ttl: float = 300.0, cache_size: int = 10000, latency_budget_ms: float = 150.0):
+        """初始化混合推荐器
+        
+        Args:
+            vector_registry: 向量搜索注册表，为None时使用进程级注册表
+            cf_registry: 协同过滤模型注册表，为None时使用进程级注册表
+            weights: 打分项的权重，键为content、cf、distance和quality
+            max_candidates: 参与第二阶段打分的最多候选数
+            candidates_per_source: 每个来源最多召回的候选数
+            cache_ttl: 候选集缓存的有效期（秒）
+            cache_size: 候选集缓存最多保存的条目数
+            latency_budget_ms: 每个请求的延迟预算（毫秒）
+        """
+        self.vector_registry = vector_registry
+        self.cf_registry = cf_registry
+        self.weights = dict(DEFAULT_WEIGHTS, **(weights or {}))
+        self.max_candidates = max_candidates
+        self.candidates_per_source = candidates_per_source
+        self.latency_budget = latency_budget_ms / 1000.0
+        self.candidate_cache = TTLCache(cache_size, cache_ttl)
+        # 每个用户的缓存版本号，是按用户缓存的候选集和偏好向量的键的一部分
+        self._user_generations = {}
+        self._lock = threading.Lock()
+    
+    def invalidate_user(self, user_id: int):
+        """删除用户的候选集缓存，用户修改偏好或评分后调用
+        
+        Args:
+            user_id: 用户ID
+        """
+        # 版本号加一后，该用户的候选集（包括附近的候选）和偏好向量都不再被读取，之后按LRU淘汰
+        with self._lock:
+            self._user_generations[int(user_id)] = self._user_generations.get(int(user_id), 0) + 1
+    
+    def _user_key(self, kind: str, user: User, *parts) -> Tuple:
+        """按用户缓存的条目的键"""
+        return (kind, user.id, self._user_generations.get(user.id, 0)) + parts
+    
+    def _vector_registry(self) -> VectorSearchRegistry:
+        return self.vector_registry or get_vector_search_registry()
+    
+    def _cf_registry(self) -> CollaborativeFilterRegistry:
+        return self.cf_registry or get_collaborative_filter_registry()
+    
+    def _ready_engine(self, item_type: str):
+        """已经加载了指定类型索引的搜索引擎，索引不存在时返回None"""
+        registry = self._vector_registry()
+        registry.reload_if_changed()
+        return registry.engine if registry.engine.has_index(item_type) else None
+    
+    def _user_vector(self, user: User, engine) -> np.ndarray:
+        """用户偏好向量，计算后缓存，编码器（如BERT）只在缓存失效后重新计算"""
+        user_vector, _ = self.candidate_cache.get_or_set(self._user_key('vector', user),
+                                                          lambda: engine._get_user_preference_vector(user))
+        return user_vector
+    
+    def _ready_cf_model(self, item_type: str):
+        """已经加载或训练好的协同过滤模型，不存在时返回None"""
+        registry = self._cf_registry()
+        registry.reload_if_changed()
+        return registry.models.get(item_type)
+    
+    def recommend(self, user: User, item_type: str = 'place', top_n: int = 10, latitude: float = None,
+                  longitude: float = None, radius: float = 10.0, city: str = None) -> List[Dict[str, Any]]:
+        """为用户推荐景点或美食
+        
+        Args:
+            user: 用户对象
+            item_type: 'place'或'food'
+            top_n: 返回的推荐数量
+            latitude: 当前纬度，与longitude同时给出时召回附近的物品并按距离加分
+            longitude: 当前经度
+            radius: 附近物品的搜索半径（公里）
+            city: 只推荐该城市的物品
+        
+        Returns:
+            推荐列表，每项为物品字典，附加score（综合得分）、sources（召回来源）和distance（给出位置时）
+        """
+        start_time = time.perf_counter()
+        deadline = start_time + self.latency_budget
+        location = (latitude, longitude) if latitude is not None and longitude is not None else None
+        
+        candidates = self.generate_candidates(user, item_type, location, radius, city, deadline)
+        stage_one_end = time.perf_counter()
+        HYBRID_STAGE_SECONDS.observe(stage_one_end - start_time, item_type=item_type, stage='candidates')
+        
+        result = self.rerank(user, item_type, candidates, top_n, location, radius, city, deadline)
+        HYBRID_STAGE_SECONDS.observe(time.perf_counter() - stage_one_end, item_type=item_type, stage='rerank')
+        HYBRID_STAGE_SECONDS.observe(time.perf_counter() - start_time, item_type=item_type, stage='total')
+        
+        return result
+    
+    def generate_candidates(self, user: User, item_type: str, location: Tuple[float, float] = None,
+                            radius: float = 10.0, city: str = None, deadline: float = None) -> Dict[int, set]:
+        """第一阶段：从各来源召回候选
+        
+        与位置无关的来源（ann、cf）按(用户, 类型, 城市)缓存，附近的物品按(用户, 类型, 城市, 约1公里的网格, 半径)缓存，
+        热门物品按(类型, 城市)缓存。给出城市时向量索引只搜索该城市（按城市分片的索引只搜索对应的分片）。各来源的结果轮流合并，保证每个来源都有候选进入第二阶段
+        
+        Args:
+            user: 用户对象
+            item_type: 'place'或'food'
+            location: (纬度, 经度)
+            radius: 附近物品的搜索半径（公里）
+            city: 城市
+            deadline: time.perf_counter()的截止时间，超过后跳过剩下的来源
+        
+        Returns:
+            候选物品ID到召回来源集合的有序映射
+        """
+        ranked_lists = {}
+        
+        def within_budget(source: str) -> bool:
+            if deadline is None or time.perf_counter() < deadline:
+                return True
+            HYBRID_SKIPPED_SOURCES.inc(item_type=item_type, source=source)
+            return False
+        
+        personal_key = self._user_key('personal', user, item_type, city)
+        personal = self.candidate_cache.get(personal_key)
+        HYBRID_CANDIDATE_CACHE.inc(item_type=item_type, result='hit' if personal is not None else 'miss')
+        if personal is None:
+            personal = {}
+            if within_budget('cf'):
+                personal['cf'] = self._cf_candidates(user, item_type)
+            if within_budget('ann'):
+                personal['ann'] = self._ann_candidates(user, item_type, city)
+            # 被跳过的来源不缓存，下次请求重新召回
+            if len(personal) == 2:
+                self.candidate_cache.set(personal_key, personal)
+        ranked_lists.update(personal)
+        
+        if location is not None and within_budget('nearby'):
+            # 约1公里的网格
+            key = self._user_key('nearby', user, item_type, city, round(location[0], 2), round(location[1], 2), radius)
+            ranked_lists['nearby'], _ = self.candidate_cache.get_or_set(
+                key, lambda: self._nearby_candidates(user, item_type, location, radius, city))
+        
+        ranked_lists['popular'], _ = self.candidate_cache.get_or_set(
+            ('popular', item_type, city), lambda: self._popular_candidates(item_type, city))
+        
+        # 轮流从各来源取候选
+        candidates = OrderedDict()
+        lists = [(source, ranked_lists[source]) for source in self.SOURCES if ranked_lists.get(source)]
+        for position in range(max((len(ids) for _, ids in lists), default=0)):
+            for source, ids in lists:
+                if position < len(ids):
+                    if ids[position] not in candidates and len(candidates) >= self.max_candidates:
+                        continue
+                    candidates.setdefault(ids[position], set()).add(source)
+        
+        return candidates
+    
+    def _ann_candidates(self, user: User, item_type: str, city: str = None) -> List[int]:
+        """用户偏好向量在向量索引中的近邻"""
+        engine = self._ready_engine(item_type)
+        if engine is None:
+            return []
+        
+        user_vector = self._user_vector(user, engine)
+        hits = engine._search_index(item_type, user_vector, self.candidates_per_source,
+                                    filters={'city': city} if city else None)
+        return [item_id for item_id, _ in hits]
+    
+    def _cf_candidates(self, user: User, item_type: str) -> List[int]:
+        """协同过滤候选：矩阵分解的Top-N，以及用户评分最高的物品在邻居表中的相似物品"""
+        model = self._ready_cf_model(item_type)
+        user_idx = model.user_indices.get(user.id) if model is not None else None
+        if user_idx is None:
+            return []
+        
+        n = self.candidates_per_source
+        item_indices = []
+        if model.user_factors is not None:
+            item_indices.extend(model._top_items(user_idx, None, n // 2, 'mf')[0].tolist())
+        
+        rated_items, rated_values = model._user_ratings(user_idx)
+        table = model.item_neighbors
+        if table is not None and len(table) == len(model.items) and len(rated_items):
+            # 评分最高的20个物品的邻居，按(评分×相似度)累加排序
+            top_rated = np.argsort(-rated_values, kind='stable')[:20]
+            neighbors = table.neighbors[rated_items[top_rated]]
+            weights = table.similarities[rated_items[top_rated]] * rated_values[top_rated, None]
+            valid = (neighbors >= 0) & ~np.isin(neighbors, rated_items)
+            scores = np.bincount(neighbors[valid], weights=weights[valid], minlength=len(model.items))
+            ranked = np.flatnonzero(scores)
+            ranked = ranked[np.argsort(-scores[ranked], kind='stable')][:n - len(item_indices)]
+            item_indices.extend(ranked.tolist())
+        
+        seen = set()
+        return [model.items[item_idx] for item_idx in item_indices if not (item_idx in seen or seen.add(item_idx))]
+    
+    def _nearby_candidates(self, user: User, item_type: str, location: Tuple[float, float],
+                           radius: float, city: str = None) -> List[int]:
+        """附近的物品：索引有坐标时在半径内按偏好向量搜索，否则从数据库按距离查询"""
+        engine = self._ready_engine(item_type)
+        if engine is not None and engine.indices[item_type].has_coordinates():
+            user_vector = self._user_vector(user, engine)
+            hits = engine._search_index(item_type, user_vector, self.candidates_per_source, location, radius,
+                                        {'city': city} if city else None)
+            return [item_id for item_id, _ in hits]
+        
+        if item_type == 'place':
+            items = Place.get_nearby_places(location[0], location[1], radius, self.candidates_per_source)
+        else:
+            items = Food.get_nearby_foods(location[0], location[1], radius, self.candidates_per_source)
+        return [item.id for item in items]
+    
+    def _popular_candidates(self, item_type: str, city: str = None) -> List[int]:
+        """按评分和热度排序的物品"""
+        model = Place if item_type == 'place' else Food
+        query = db.session.query(model.id)
+        if city:
+            query = query.filter(model.city == city)
+        order = [model.rating.desc()]
+        if hasattr(model, 'popularity'):
+            order.append(model.popularity.desc())
+        return [item_id for item_id, in query.order_by(*order, model.id).limit(self.candidates_per_source)]
+    
+    def rerank(self, user: User, item_type: str, candidates: Dict[int, set], top_n: int = 10,
+               location: Tuple[float, float] = None, radius: float = 10.0, city: str = None,
+               deadline: float = None) -> List[Dict[str, Any]]:
+        """第二阶段：对候选加权打分并取前top_n个
+        
+        各打分项都缩放到[0, 1]：content为偏好向量与物品向量的余弦（负值记为0），cf为预测评分(1-5分)线性映射，
+        distance为exp(-距离/半径)，quality为物品评分/5。某一项对本次请求不可用时（如用户不在协同过滤模型中、
+        没有给出位置），其权重不参与归一化。用户已评分的物品不推荐
+        
+        Args:
+            user: 用户对象
+            item_type: 'place'或'food'
+            candidates: generate_candidates返回的候选
+            top_n: 返回的推荐数量
+            location: (纬度, 经度)
+            radius: 距离打分的尺度（公里）
+            city: 只保留该城市的物品
+            deadline: time.perf_counter()的截止时间，超过后不再计算content和cf打分项
+        
+        Returns:
+            推荐列表
+        """
+        model_class = Place if item_type == 'place' else Food
+        items_by_id = _fetch_items_by_ids(model_class, list(candidates))
+        
+        cf_model = self._ready_cf_model(item_type)
+        user_idx = cf_model.user_indices.get(user.id) if cf_model is not None else None
+        
+        # 去掉不存在的、其他城市的和用户评分过的物品
+        seen = set()
+        if user_idx is not None:
+            rated_items, rated_values = cf_model._user_ratings(user_idx)
+            seen = {cf_model.items[item_idx] for item_idx in rated_items[rated_values > 0]}
+        items = [items_by_id[item_id] for item_id in candidates
+                 if item_id in items_by_id and item_id not in seen and (not city or items_by_id[item_id].city == city)]
+        if not items:
+            return []
+        
+        ids = [item.id for item in items]
+        features = {}
+        
+        def within_budget(feature: str) -> bool:
+            if deadline is None or time.perf_counter() < deadline:
+                return True
+            HYBRID_SKIPPED_SOURCES.inc(item_type=item_type, source=feature)
+            return False
+        
+        engine = self._ready_engine(item_type)
+        if engine is not None and within_budget('content'):
+            vectors, found = engine.indices[item_type].lookup_vectors(ids)
+            if found.any():
+                user_vector = self._user_vector(user, engine)
+                norm = np.linalg.norm(user_vector)
+                if norm > 0:
+                    features['content'] = np.clip(vectors @ (user_vector / norm), 0.0, 1.0)
+        
+        if user_idx is not None and within_budget('cf'):
+            positions = [(i, cf_model.item_indices[item_id]) for i, item_id in enumerate(ids)
+                         if item_id in cf_model.item_indices]
+            if positions:
+                rows, item_indices = map(np.asarray, zip(*positions))
+                if cf_model.user_factors is not None:
+                    predictions = cf_model._predict_ratings_factors(user_idx, item_indices)
+                else:
+                    predictions = cf_model._predict_ratings_item_based(user_idx, item_indices)
+                cf_scores = np.zeros(len(ids))
+                cf_scores[rows] = (predictions - 1.0) / 4.0
+                features['cf'] = np.clip(cf_scores, 0.0, 1.0)
+        
+        distances = None
+        if location is not None:
+            distances = _haversine_km(location[0], location[1],
+                                      np.array([item.latitude or 0.0 for item in items]),
+                                      np.array([item.longitude or 0.0 for item in items]))
+            features['distance'] = np.exp(-distances / max(radius, 1e-6))
+        
+        features['quality'] = np.clip(np.array([(item.rating or 0.0) / 5.0 for item in items]), 0.0, 1.0)
+        
+        total_weight = sum(self.weights.get(name, 0.0) for name in features)
+        scores = sum(self.weights.get(name, 0.0) * values for name, values in features.items())
+        scores = scores / total_weight if total_weight > 0 else np.zeros(len(items))
+        
+        top = np.argsort(-scores, kind='stable')[:top_n]
+        
+        result = []
+        for i in top:
+            item_dict = items[i].to_dict()
+            item_dict.update({
+                'score': float(scores[i]),
+                'sources': sorted(candidates[items[i].id])
+            })
+            if distances is not None:
+                item_dict['distance'] = float(distances[i])
+            result.append(item_dict)
+        
+        return result
+
+
+_recommender = None
+_recommender_lock = threading.Lock()
+
+
+def init_hybrid_recommender(app=None) -> HybridRecommender:
+    """创建进程级混合推荐器
+    
+    应在create_app中init_vector_search和init_collaborative_filter之后调用
+    
+    Args:
+        app: Flask应用实例，从中读取HYBRID_*配置
+    
+    Returns:
+        混合推荐器
+    """
+    global _recommender
+    
+    vector_registry = None
+    cf_registry = None
+    weights = None
+    max_candidates = 300
+    candidates_per_source = 100
+    cache_ttl = 300.0
+    cache_size = 10000
+    latency_budget_ms = 150.0
+    if app is not None:
+        vector_registry = app.extensions.get('vector_search')
+        cf_registry = app.extensions.get('collaborative_filter')
+        weights = app.config.get('HYBRID_WEIGHTS', weights)
+        max_candidates = app.config.get('HYBRID_MAX_CANDIDATES', max_candidates)
+        candidates_per_source = app.config.get('HYBRID_CANDIDATES_PER_SOURCE', candidates_per_source)
+        cache_ttl = app.config.get('HYBRID_CANDIDATE_CACHE_TTL', cache_ttl)
+        cache_size = app.config.get('HYBRID_CANDIDATE_CACHE_SIZE', cache_size)
+        latency_budget_ms = app.config.get('HYBRID_LATENCY_BUDGET_MS', latency_budget_ms)
+    
+    recommender = HybridRecommender(vector_registry=vector_registry, cf_registry=cf_registry, weights=weights,
+                                    max_candidates=max_candidates, candidates_per_source=candidates_per_source,
+                                    cache_ttl=cache_ttl, cache_size=cache_size, latency_budget_ms=latency_budget_ms)
+    
+    if app is not None:
+        app.extensions['hybrid_recommender'] = recommender
+        # 用户的推荐结果缓存失效时，候选集缓存一起失效
+        if 'recommendation_cache' in app.extensions:
+            app.extensions['recommendation_cache'].add_listener(recommender.invalidate_user)
+    
+    with _recommender_lock:
+        _recommender = recommender
+    
+    return recommender
+
+
+def get_hybrid_recommender() -> HybridRecommender:
+    """获取进程级混合推荐器，在应用之外调用时按默认配置创建"""
+    global _recommender
+    
+    if _recommender is None:
+        with _recommender_lock:
+            if _recommender is None:
+                _recommender = HybridRecommender()
+    
+    return _recommender
+
+
+# 提供一个简单的函数接口，方便后端调用
+def get_hybrid_recommendations(user_id: int, item_type: str = 'place', top_n: int = 10, latitude: float = None,
+                               longitude: float = None, radius: float = 10.0, city: str = None) -> List[Dict[str, Any]]:
+    """获取混合推荐
+    
+    Args:
+        user_id: 用户ID
+        item_type: 推荐项目类型，'place'或'food'
+        top_n: 返回的推荐数量
+        latitude: 当前纬度
+        longitude: 当前经度
+        radius: 附近物品的搜索半径（公里）
+        city: 只推荐该城市的项目
+    
+    Returns:
+        推荐项目列表
+    """
+    if item_type not in ('place', 'food'):
+        return []
+    
+    user = User.query.get(user_id)
+    if not user:
+        return []
+    
+    return get_hybrid_recommender().recommend(user, item_type, top_n, latitude, longitude, radius, city)
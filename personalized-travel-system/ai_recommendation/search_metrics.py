@@ -0,0 +1,231 @@
+from typing import List, Dict, Any, Tuple, Callable
+import bisect
+import math
+import threading
+
+# 查询耗时直方图的默认分桶上界（秒）
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+# 构建和加载耗时直方图的默认分桶上界（秒）
+DURATION_BUCKETS = (0.1, 0.5, 1.0, 5.0, 10.0, 30.0, 60.0, 300.0, 900.0, 3600.0)
+
+
+def _format_labels(label_names: Tuple[str, ...], label_values: Tuple[str, ...], extra: str = '') -> str:
+    """生成Prometheus文本格式的标签部分，如{index="place",backend="faiss"}"""
+    parts = [f'{name}="{value}"' for name, value in zip(label_names, label_values)]
+    if extra:
+        parts.append(extra)
+    return '{' + ','.join(parts) + '}' if parts else ''
+
+
+def _format_value(value: float) -> str:
+    if math.isinf(value):
+        return '+Inf' if value > 0 else '-Inf'
+    return repr(float(value))
+
+
+class Counter:
+    """只增不减的计数器，按标签取值分别计数"""
+    
+    kind = 'counter'
+    
+    def __init__(self, name: str, documentation: str, label_names: Tuple[str, ...] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(label_names)
+        self._values = {}
+        self._lock = threading.Lock()
+    
+    def _key(self, labels: Dict[str, Any]) -> Tuple[str, ...]:
+        return tuple(str(labels.get(name, '')) for name in self.label_names)
+    
+    def inc(self, amount: float = 1, **labels):
+        """增加计数
+        
+        Args:
+            amount: 增加的数量
+            **labels: 标签取值
+        """
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+    
+    def value(self, **labels) -> float:
+        """读取某组标签的当前计数"""
+        return self._values.get(self._key(labels), 0)
+    
+    def samples(self) -> List[Tuple[str, Dict[str, str], float]]:
+        """所有样本，格式为(样本名, 标签, 值)"""
+        with self._lock:
+            items = list(self._values.items())
+        return [(self.name, dict(zip(self.label_names, key)), value) for key, value in items]
+    
+    def render(self) -> List[str]:
+        with self._lock:
+            items = sorted(self._values.items())
+        return [f"{self.name}{_format_labels(self.label_names, key)} {_format_value(value)}" for key, value in items]
+
+
+class Histogram:
+    """分桶直方图，按标签取值分别统计各桶的累计次数、总和和次数"""
+    
+    kind = 'histogram'
+    
+    def __init__(self, name: str, documentation: str, label_names: Tuple[str, ...] = (),
+                 buckets: Tuple[float, ...] = LATENCY_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(label_names)
+        self.buckets = tuple(sorted(buckets))
+        # 标签取值 -> [各桶次数（最后一个为+Inf）, 总和, 次数]
+        self._values = {}
+        self._lock = threading.Lock()
+    
+    def observe(self, value: float, **labels):
+        """记录一次观测值
+        
+        Args:
+            value: 观测值，如耗时秒数
+            **labels: 标签取值
+        """
+        key = tuple(str(labels.get(name, '')) for name in self.label_names)
+        bucket = bisect.bisect_left(self.buckets, value)
+        
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None:
+                entry = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            entry[0][bucket] += 1
+            entry[1] += value
+            entry[2] += 1
+    
+    def snapshot(self) -> List[Dict[str, Any]]:
+        """各组标签的次数、总和、平均值和按分桶估计的P50/P95"""
+        with self._lock:
+            items = [(key, list(counts), total, count) for key, (counts, total, count) in self._values.items()]
+        
+        result = []
+        for key, counts, total, count in items:
+            entry = dict(zip(self.label_names, key))
+            entry.update({
+                'count': count,
+                'sum': total,
+                'avg': total / count if count else 0.0,
+                'p50': self._quantile(counts, count, 0.5),
+                'p95': self._quantile(counts, count, 0.95)
+            })
+            result.append(entry)
+        return result
+    
+    def _quantile(self, counts: List[int], count: int, q: float) -> float:
+        """按分桶上界估计分位数，落在+Inf桶时返回最大的有限上界"""
+        if count == 0:
+            return 0.0
+        
+        cumulative = 0
+        for bound, bucket_count in zip(self.buckets, counts):
+            cumulative += bucket_count
+            if cumulative >= q * count:
+                return bound
+        return self.buckets[-1] if self.buckets else 0.0
+    
+    def render(self) -> List[str]:
+        with self._lock:
+            items = sorted((key, list(counts), total, count) for key, (counts, total, count) in self._values.items())
+        
+        lines = []
+        for key, counts, total, count in items:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += bucket_count
+                labels = _format_labels(self.label_names, key, f'le="{_format_value(bound)}"')
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self.label_names, key)} {_format_value(total)}")
+            lines.append(f"{self.name}_count{_format_labels(self.label_names, key)} {count}")
+        return lines
+
+
+class MetricsRegistry:
+    """进程内的指标注册表
+    
+    计数器和直方图在代码中直接更新；索引大小、缓存命中率等状态类指标由注册的收集函数在导出时计算。
+    render_prometheus输出Prometheus文本格式，snapshot输出便于直接查看的字典。
+    多进程部署时每个工作进程各自统计，抓取到的是处理该请求的进程的指标
+    """
+    
+    def __init__(self):
+        self._metrics = {}
+        # 收集函数返回(指标名, 说明, 标签, 值)的列表，按gauge导出
+        self._collectors = []
+        self._lock = threading.Lock()
+    
+    def _register(self, metric):
+        with self._lock:
+            return self._metrics.setdefault(metric.name, metric)
+    
+    def counter(self, name: str, documentation: str, label_names: Tuple[str, ...] = ()) -> Counter:
+        """注册（或取出已注册的）计数器"""
+        return self._register(Counter(name, documentation, label_names))
+    
+    def histogram(self, name: str, documentation: str, label_names: Tuple[str, ...] = (),
+                  buckets: Tuple[float, ...] = LATENCY_BUCKETS) -> Histogram:
+        """注册（或取出已注册的）直方图"""
+        return self._register(Histogram(name, documentation, label_names, buckets))
+    
+    def register_collector(self, collector: Callable[[], List[Tuple[str, str, Dict[str, Any], float]]]):
+        """注册导出时调用的收集函数
+        
+        Args:
+            collector: 无参函数，返回(指标名, 说明, 标签字典, 值)的列表
+        """
+        with self._lock:
+            if collector not in self._collectors:
+                self._collectors.append(collector)
+    
+    def _collect_gauges(self) -> Dict[str, Tuple[str, List[Tuple[Dict[str, Any], float]]]]:
+        """调用所有收集函数，按指标名分组；单个收集函数出错不影响其他指标"""
+        gauges = {}
+        for collector in list(self._collectors):
+            try:
+                samples = collector()
+            except Exception as e:
+                print(f"Error collecting metrics: {e}")
+                continue
+            for name, documentation, labels, value in samples:
+                gauges.setdefault(name, (documentation, []))[1].append((labels, value))
+        return gauges
+    
+    def render_prometheus(self) -> str:
+        """按Prometheus文本格式导出所有指标"""
+        lines = []
+        for metric in list(self._metrics.values()):
+            lines.append(f"# HELP {metric.name} {metric.documentation}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(metric.render())
+        
+        for name, (documentation, samples) in self._collect_gauges().items():
+            lines.append(f"# HELP {name} {documentation}")
+            lines.append(f"# TYPE {name} gauge")
+            for labels, value in samples:
+                label_names = tuple(labels)
+                lines.append(f"{name}{_format_labels(label_names, tuple(str(labels[k]) for k in label_names))} "
+                             f"{_format_value(value)}")
+        
+        return '\n'.join(lines) + '\n'
+    
+    def snapshot(self) -> Dict[str, Any]:
+        """以字典形式导出所有指标，直方图给出次数、平均值和估计的分位数"""
+        result = {}
+        for metric in list(self._metrics.values()):
+            if isinstance(metric, Histogram):
+                result[metric.name] = metric.snapshot()
+            else:
+                result[metric.name] = [dict(labels, value=value) for _, labels, value in metric.samples()]
+        
+        for name, (_, samples) in self._collect_gauges().items():
+            result[name] = [dict(labels, value=value) for labels, value in samples]
+        
+        return result
+
+
+# 进程级注册表，/metrics端点导出其中的所有指标
+metrics = MetricsRegistry()
@@ -5,7 +5,16 @@ import sys
 import os
 import json
 import pickle
+import math
+import threading
+import time
+import heapq
+import hashlib
+import argparse
+import csv
+from concurrent.futures import ThreadPoolExecutor
 from collections import defaultdict
+from collections.abc import Mapping, MutableMapping
 
 # 添加项目根目录到系统路径，以便导入backend模块
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))  
@@ -15,6 +24,13 @@ from backend.models.user import User
 from backend.models.place import Place
 from backend.models.food import Food
 from backend.utils.helpers import calculate_distance
+from sqlalchemy.orm import load_only
+from ai_recommendation.embedding_cache import EmbeddingCache, get_embedding_cache
+from ai_recommendation.hashing_embedder import HashingEmbedder
+from ai_recommendation.search_metrics import metrics, DURATION_BUCKETS
+from ai_recommendation.versioned_store import VersionedStore
+from ai_recommendation.text_encoders import (TextEncoder, HashingEncoder, create_encoder, benchmark_text_encoders, export_onnx,
+                                             TRANSFORMERS_AVAILABLE)
 
 # 尝试导入向量搜索相关库
 try:
@@ -40,632 +56,2970 @@ except ImportError:
     WORD2VEC_AVAILABLE = False
     print("Warning: gensim not installed. Using fallback similarity methods.")
 
-try:
-    import torch
-    from transformers import BertModel, BertTokenizer
-    BERT_AVAILABLE = True
-except ImportError:
-    BERT_AVAILABLE = False
-    print("Warning: transformers not installed. Using fallback similarity methods.")
+# BERT等模型编码器见text_encoders，依赖库的检查也在其中
+BERT_AVAILABLE = TRANSFORMERS_AVAILABLE
 
 
-class VectorSearchEngine:
-    """向量搜索引擎
+# 向量搜索指标，由/metrics端点导出
+SEARCH_LATENCY = metrics.histogram('vector_search_query_seconds', '向量索引查询耗时（秒），批量查询按整批计时',
+                                   ('index', 'backend', 'kind'))
+SEARCH_QUERIES = metrics.counter('vector_search_queries_total', '向量索引查询次数，批量查询按查询向量数计',
+                                 ('index', 'backend'))
+BRUTE_FORCE_QUERIES = metrics.counter('vector_search_brute_force_total', '使用暴力搜索（精确打分）的查询次数',
+                                      ('index', 'reason'))
+INDEX_BUILD_SECONDS = metrics.histogram('vector_index_build_seconds', '索引构建和加载耗时（秒）',
+                                        ('index', 'operation'), DURATION_BUCKETS)
+
+
+def _normalize_rows(vectors: np.ndarray) -> np.ndarray:
+    """将矩阵的每一行归一化为单位向量，零向量保持不变
     
-    实现高效的向量搜索，用于景点和美食推荐
+    Args:
+        vectors: 形状为(n, dim)的矩阵
+        
+    Returns:
+        归一化后的float32矩阵
     """
+    vectors = np.asarray(vectors, dtype='float32')
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return np.divide(vectors, norms, out=np.zeros_like(vectors), where=norms > 0)
+
+
+def _top_n_rows(scores: np.ndarray, top_n: int) -> np.ndarray:
+    """取分数最高的top_n个位置，按分数从高到低排序
     
-    def __init__(self, vector_dim: int = 100, use_bert: bool = False, use_faiss: bool = True):
-        """初始化搜索引擎
-        
-        Args:
-            vector_dim: 向量维度
-            use_bert: 是否使用BERT进行特征提取
-            use_faiss: 是否使用FAISS进行向量搜索，如果为False则使用Annoy
-        """
-        self.vector_dim = vector_dim
-        self.use_bert = use_bert and BERT_AVAILABLE
-        self.use_faiss = use_faiss and FAISS_AVAILABLE
-        
-        # 初始化特征提取模型
-        self.word2vec_model = None
-        self.bert_model = None
-        self.bert_tokenizer = None
+    使用argpartition只做部分排序，复杂度为O(n + top_n log top_n)
+    
+    Args:
+        scores: 分数数组，被排除的位置应为-inf
+        top_n: 返回的数量
         
-        if self.use_bert:
-            self._init_bert()
-        elif WORD2VEC_AVAILABLE:
-            self._init_word2vec()
+    Returns:
+        位置数组
+    """
+    top_n = min(top_n, int(np.count_nonzero(scores > -np.inf)))
+    if top_n <= 0:
+        return np.zeros(0, dtype='int64')
+    
+    top = np.argpartition(-scores, top_n - 1)[:top_n]
+    return top[np.argsort(-scores[top], kind='stable')]
+
+
+def _haversine_km(latitude: float, longitude: float, latitudes: np.ndarray, longitudes: np.ndarray) -> np.ndarray:
+    """向量化计算一个点到多个点的球面距离
+    
+    Args:
+        latitude: 中心点纬度
+        longitude: 中心点经度
+        latitudes: 纬度数组
+        longitudes: 经度数组
         
-        # 初始化索引
-        self.place_index = None
-        self.food_index = None
-        self.place_ids = []
-        self.food_ids = []
-        self.place_vectors = []
-        self.food_vectors = []
-        self.place_id_to_index = {}
-        self.food_id_to_index = {}
+    Returns:
+        距离数组（公里）
+    """
+    lat1, lon1 = math.radians(latitude), math.radians(longitude)
+    lat2, lon2 = np.radians(latitudes), np.radians(longitudes)
+    a = np.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return 2 * 6371.0 * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
+
+
+def _parallel_map(func, items: List[Any], n_jobs: int = None) -> List[Any]:
+    """用线程池并行执行func，保持结果顺序
+    
+    numpy矩阵运算和Annoy搜索在计算时会释放GIL，多个线程可以同时使用多个CPU核
+    
+    Args:
+        func: 对单个元素执行的函数
+        items: 元素列表
+        n_jobs: 线程数，为None时使用CPU核数
         
-        # 缓存向量
-        self.place_vector_cache = {}
-        self.food_vector_cache = {}
+    Returns:
+        与items一一对应的结果列表
+    """
+    n_jobs = n_jobs or os.cpu_count() or 1
+    if n_jobs <= 1 or len(items) <= 1:
+        return [func(item) for item in items]
     
-    def _init_word2vec(self, vector_size: int = 100):
-        """初始化Word2Vec模型"""
-        self.vector_dim = vector_size
-        # 模拟模型初始化，实际应用中应加载预训练模型
-        self.word2vec_model = None
+    with ThreadPoolExecutor(max_workers=min(n_jobs, len(items))) as pool:
+        return list(pool.map(func, items))
+
+
+class IdRowMap(MutableMapping):
+    """项目ID到行号的映射
     
-    def _init_bert(self):
-        """初始化BERT模型"""
-        if BERT_AVAILABLE:
-            try:
-                self.bert_tokenizer = BertTokenizer.from_pretrained('bert-base-chinese')
-                self.bert_model = BertModel.from_pretrained('bert-base-chinese')
-                # 设置为评估模式
-                self.bert_model.eval()
-            except Exception as e:
-                print(f"Error loading BERT model: {e}")
-                self.use_bert = False
+    基础部分是按ID排序的ID数组和对应的行号数组，可以直接使用内存映射的文件，
+    多个工作进程通过操作系统页缓存共享，不需要在每个进程中重建字典；
+    之后的增删记录在一个小字典和删除集合中
+    """
     
-    def _text_to_vector(self, text: str) -> np.ndarray:
-        """将文本转换为向量
+    def __init__(self, sorted_ids: np.ndarray = None, sorted_rows: np.ndarray = None):
+        """初始化映射
         
         Args:
-            text: 输入文本
-            
-        Returns:
-            文本的向量表示
+            sorted_ids: 按升序排列的项目ID数组
+            sorted_rows: 与sorted_ids对应的行号数组
         """
-        if self.use_bert:
-            return self._text_to_vector_bert(text)
-        elif WORD2VEC_AVAILABLE and self.word2vec_model is not None:
-            return self._text_to_vector_word2vec(text)
-        else:
-            return self._text_to_vector_fallback(text)
+        self._sorted_ids = sorted_ids if sorted_ids is not None else np.zeros(0, dtype='int64')
+        self._sorted_rows = sorted_rows if sorted_rows is not None else np.zeros(0, dtype='int64')
+        self._overlay = {}
+        self._removed = set()
+        self._len = len(self._sorted_ids)
     
-    def _text_to_vector_word2vec(self, text: str) -> np.ndarray:
-        """使用Word2Vec将文本转换为向量
+    @classmethod
+    def from_ids(cls, ids: np.ndarray) -> 'IdRowMap':
+        """从行号到项目ID的数组构建映射
         
         Args:
-            text: 输入文本
+            ids: 行号到项目ID的数组
             
         Returns:
-            文本的向量表示
+            项目ID到行号的映射
         """
-        if not WORD2VEC_AVAILABLE or self.word2vec_model is None:
-            return self._text_to_vector_fallback(text)
-        
-        # 分词
-        words = text.lower().split()
-        
-        # 获取每个词的向量并计算平均值
-        word_vectors = []
-        for word in words:
-            if word in self.word2vec_model.wv:
-                word_vectors.append(self.word2vec_model.wv[word])
-        
-        if word_vectors:
-            return np.mean(word_vectors, axis=0)
-        else:
-            return np.zeros(self.vector_dim)
+        ids = np.asarray(ids, dtype='int64')
+        order = np.argsort(ids, kind='stable')
+        return cls(ids[order], order.astype('int64'))
+    
+    def _base_lookup(self, item_id) -> Optional[int]:
+        """在基础数组中二分查找项目ID"""
+        if item_id in self._removed or len(self._sorted_ids) == 0:
+            return None
+        
+        pos = int(np.searchsorted(self._sorted_ids, item_id))
+        if pos < len(self._sorted_ids) and self._sorted_ids[pos] == item_id:
+            return int(self._sorted_rows[pos])
+        return None
+    
+    def __getitem__(self, item_id) -> int:
+        if item_id in self._overlay:
+            return self._overlay[item_id]
+        
+        row = self._base_lookup(item_id)
+        if row is None:
+            raise KeyError(item_id)
+        return row
+    
+    def __contains__(self, item_id) -> bool:
+        return item_id in self._overlay or self._base_lookup(item_id) is not None
+    
+    def __setitem__(self, item_id, row: int):
+        if item_id not in self:
+            self._len += 1
+        self._overlay[item_id] = row
+    
+    def __delitem__(self, item_id):
+        if item_id not in self:
+            raise KeyError(item_id)
+        
+        self._overlay.pop(item_id, None)
+        if self._base_lookup(item_id) is not None:
+            self._removed.add(item_id)
+        self._len -= 1
+    
+    def __iter__(self):
+        yield from self._overlay
+        for item_id in self._sorted_ids:
+            item_id = int(item_id)
+            if item_id not in self._removed and item_id not in self._overlay:
+                yield item_id
+    
+    def __len__(self) -> int:
+        return self._len
+
+
+class VectorIndex:
+    """单类项目（景点或美食）的向量索引
+    
+    维护行号到项目ID的列表、向量矩阵、项目ID到行号的映射以及底层的FAISS/Annoy索引。
+    行只追加不移动：删除通过墓碑标记，更新等价于删除旧行后追加新行，
+    因此单条增删改的开销只与变更的项目数有关。
+    向量在加入时即归一化为单位向量，暴力搜索只需一次矩阵向量乘法，
+    FAISS使用内积度量，与Annoy的角度距离一样等价于余弦相似度。
+    FAISS以行号为ID直接增删，不支持删除的索引类型（HNSW）与Annoy一样在搜索时过滤墓碑；
+    Annoy索引构建后不可修改，之后追加的行用暴力搜索补充。
+    每行可以附带经纬度，按经纬度网格单元（类似geohash前缀）建立行号表，支持按半径过滤的搜索。
+    """
+    
+    # 墓碑和未进入索引的行超过该比例（且超过最小行数）时自动重建索引
+    COMPACT_RATIO = 0.2
+    COMPACT_MIN_ROWS = 1000
     
-    def _text_to_vector_bert(self, text: str) -> np.ndarray:
-        """使用BERT将文本转换为向量
+    # 经纬度网格单元的边长（度），约11公里
+    GEO_CELL_DEGREES = 0.1
+    # 半径内的候选行不超过该数量时直接对候选行精确打分，否则用近似搜索多取结果后过滤
+    GEO_PREFILTER_MAX_ROWS = 20000
+    
+    # 支持的FAISS索引类型
+    FAISS_INDEX_TYPES = ('flat', 'ivf_flat', 'ivf_pq', 'hnsw')
+    
+    # FAISS索引的默认参数
+    DEFAULT_FAISS_PARAMS = {
+        # IVF聚类中心数量，为None时取4*sqrt(n)
+        'nlist': None,
+        # IVF搜索时访问的聚类数量，越大召回越高、越慢
+        'nprobe': 8,
+        # PQ子向量数量，必须整除向量维度
+        'pq_m': 16,
+        # HNSW每个节点的邻居数量
+        'hnsw_m': 32,
+        # HNSW搜索时的候选队列长度，越大召回越高、越慢
+        'ef_search': 64,
+        # 训练IVF/PQ时最多使用的样本数量
+        'train_sample_size': 100000
+    }
+    
+    def __init__(self, use_faiss: bool = True, n_trees: int = 10, faiss_index_type: str = 'flat',
+                 faiss_params: Dict[str, Any] = None, name: str = None):
+        """初始化索引
         
         Args:
-            text: 输入文本
-            
-        Returns:
-            文本的向量表示
+            use_faiss: 是否使用FAISS，如果为False则使用Annoy
+            n_trees: Annoy树的数量
+            faiss_index_type: FAISS索引类型，'flat'、'ivf_flat'、'ivf_pq'或'hnsw'
+            faiss_params: FAISS索引参数，覆盖DEFAULT_FAISS_PARAMS中的默认值
+            name: 索引名称，如'place'，用作指标的标签
         """
-        if not BERT_AVAILABLE or self.bert_model is None:
-            return self._text_to_vector_fallback(text)
+        if faiss_index_type not in self.FAISS_INDEX_TYPES:
+            raise ValueError(f"Unsupported FAISS index type: {faiss_index_type}")
         
-        try:
-            # 对文本进行编码
-            inputs = self.bert_tokenizer(text, return_tensors="pt", padding=True, truncation=True, max_length=512)
-            
-            # 不计算梯度
-            with torch.no_grad():
-                outputs = self.bert_model(**inputs)
-            
-            # 使用[CLS]标记的输出作为文本的向量表示
-            return outputs.last_hidden_state[:, 0, :].numpy()[0]
-        except Exception as e:
-            print(f"Error in BERT encoding: {e}")
-            return self._text_to_vector_fallback(text)
+        self.name = name or 'default'
+        self.use_faiss = use_faiss and FAISS_AVAILABLE
+        self.n_trees = n_trees
+        self.faiss_index_type = faiss_index_type
+        self.faiss_params = dict(self.DEFAULT_FAISS_PARAMS, **(faiss_params or {}))
+        self.index = None
+        # 已删除但仍留在FAISS索引中的行号（索引类型不支持删除时）
+        self._faiss_tombstones = set()
+        # 项目ID -> 行号，只包含未删除的项目
+        self.id_to_index = IdRowMap()
+        # 已删除的行号（墓碑）
+        self.deleted = set()
+        # Annoy索引覆盖的行数，之后追加的行尚未进入索引
+        self.indexed_count = 0
+        # 向量和行号->项目ID的缓冲区，按倍数扩容以便追加单行，加载时可以是只读的内存映射
+        self._buffer = np.zeros((0, 0), dtype='float32')
+        self._id_buffer = np.zeros(0, dtype='int64')
+        # 每行的(纬度, 经度)，没有位置信息的行为NaN
+        self._coord_buffer = np.zeros((0, 2), dtype='float64')
+        self._size = 0
+        # 以内存映射方式加载的只读FAISS索引文件，第一次修改前需要读入内存
+        self._mmap_index_path = None
+        # 按网格单元编号排序的单元编号和行号，只覆盖前_geo_indexed_count行，第一次按位置搜索时构建
+        self._geo_cell_keys = None
+        self._geo_cell_rows = None
+        self._geo_indexed_count = 0
+        # 构建索引时文本向量化使用的特征权重（哈希向量的IDF），加入索引的新向量也要使用同样的权重
+        self.feature_weights = None
     
-    def _text_to_vector_fallback(self, text: str) -> np.ndarray:
-        """备用的文本向量化方法
-        
-        当Word2Vec和BERT都不可用时使用
+    @property
+    def backend(self) -> str:
+        """当前使用的搜索后端"""
+        if self.use_faiss:
+            return 'faiss'
+        elif ANNOY_AVAILABLE:
+            return 'annoy'
+        else:
+            return 'brute_force'
+    
+    @property
+    def vectors(self) -> np.ndarray:
+        """所有行的归一化向量矩阵（包含已删除的行）"""
+        return self._buffer[:self._size]
+    
+    @property
+    def ids(self) -> np.ndarray:
+        """行号到项目ID的数组（已删除的行仍占位）"""
+        return self._id_buffer[:self._size]
+    
+    @property
+    def coords(self) -> np.ndarray:
+        """每行的(纬度, 经度)矩阵，没有位置信息的行为NaN"""
+        return self._coord_buffer[:self._size]
+    
+    def __len__(self) -> int:
+        return len(self.id_to_index)
+    
+    def build(self, ids: List[int], vectors: Union[List[np.ndarray], np.ndarray],
+              coords: Union[List[Tuple[float, float]], np.ndarray] = None):
+        """用完整的项目列表重建索引
         
         Args:
-            text: 输入文本
-            
-        Returns:
-            文本的向量表示
+            ids: 项目ID列表
+            vectors: 与ids一一对应的向量
+            coords: 与ids一一对应的(纬度, 经度)，为None时不支持按位置过滤
         """
-        # 简单的词频统计
-        words = text.lower().split()
-        vector = np.zeros(self.vector_dim)
-        
-        # 使用词的哈希值来填充向量
-        for word in words:
-            hash_val = hash(word) % self.vector_dim
-            vector[hash_val] += 1
+        vectors = np.asarray(vectors, dtype='float32')
+        if vectors.ndim != 2:
+            vectors = vectors.reshape(len(ids), -1)
+        
+        self._id_buffer = np.array(ids, dtype='int64').reshape(-1)
+        self.id_to_index = IdRowMap.from_ids(self._id_buffer)
+        self.deleted = set()
+        self._buffer = np.ascontiguousarray(_normalize_rows(vectors))
+        self._size = len(self._id_buffer)
+        self._coord_buffer = self._to_coord_array(coords, self._size)
+        self._mmap_index_path = None
+        self._geo_cell_keys = None
+        
+        self._build_backend()
+    
+    @staticmethod
+    def _to_coord_array(coords, n_rows: int) -> np.ndarray:
+        """把经纬度列表转换为(n, 2)的float64矩阵，缺失的位置为NaN"""
+        if coords is None:
+            return np.full((n_rows, 2), np.nan)
+        
+        return np.array([(np.nan, np.nan) if coord is None else
+                         tuple(np.nan if value is None else value for value in coord)
+                         for coord in coords], dtype='float64').reshape(n_rows, 2)
+    
+    def _build_backend(self):
+        """根据当前向量矩阵构建底层索引"""
+        self.index = None
+        self.indexed_count = 0
+        self._faiss_tombstones = set()
         
-        # 归一化
-        norm = np.linalg.norm(vector)
-        if norm > 0:
-            vector = vector / norm
+        if self._size == 0:
+            return
         
-        return vector
+        if self.backend == 'faiss':
+            self._build_faiss_index()
+        elif self.backend == 'annoy':
+            self._build_annoy_index()
+        else:
+            print("No vector search library available. Using brute force search.")
     
-    def _get_place_vector(self, place: Place) -> np.ndarray:
-        """获取景点的向量表示
+    def _new_faiss_index(self, dim: int):
+        """创建未经训练即可按ID增删的精确FAISS索引"""
+        return faiss.index_factory(dim, "IDMap,Flat", faiss.METRIC_INNER_PRODUCT)
+    
+    def _faiss_factory_string(self, n_rows: int, dim: int) -> str:
+        """根据配置和数据量生成FAISS index_factory描述串
+        
+        数据量不足以训练所选索引类型时退化为更简单的类型
         
         Args:
-            place: 景点对象
+            n_rows: 参与构建的行数
+            dim: 向量维度
             
         Returns:
-            景点的向量表示
+            index_factory描述串
         """
-        # 检查缓存
-        if place.id in self.place_vector_cache:
-            return self.place_vector_cache[place.id]
+        index_type = self.faiss_index_type
         
-        # 组合景点的名称、描述和标签
-        text = f"{place.name} {place.description or ''} {' '.join(place.tags or [])}"
+        if index_type == 'hnsw':
+            return f"IDMap,HNSW{self.faiss_params['hnsw_m']}"
         
-        # 将文本转换为向量
-        vector = self._text_to_vector(text)
-        
-        # 缓存向量
-        self.place_vector_cache[place.id] = vector
+        if index_type in ('ivf_flat', 'ivf_pq'):
+            # 每个聚类中心至少需要39个训练样本
+            nlist = self.faiss_params['nlist'] or max(1, int(4 * math.sqrt(n_rows)))
+            nlist = min(nlist, n_rows // 39)
+            
+            # PQ的每个子量化器有256个中心，同样需要足够的训练样本
+            if index_type == 'ivf_pq' and n_rows < 256 * 39:
+                index_type = 'ivf_flat'
+            
+            if nlist >= 1:
+                if index_type == 'ivf_pq':
+                    # 选择不超过pq_m且能整除维度的子向量数量
+                    pq_m = max(m for m in range(1, self.faiss_params['pq_m'] + 1) if dim % m == 0)
+                    return f"IVF{nlist},PQ{pq_m}"
+                return f"IVF{nlist},Flat"
+        
+        return "IDMap,Flat"
+    
+    def _apply_faiss_search_params(self):
+        """设置nprobe/efSearch等搜索参数"""
+        if self.index is None:
+            return
         
-        return vector
+        parameter_space = faiss.ParameterSpace()
+        description = faiss.downcast_index(self.index.index) if isinstance(self.index, faiss.IndexIDMap) else self.index
+        if isinstance(description, faiss.IndexIVF):
+            parameter_space.set_index_parameter(self.index, 'nprobe', self.faiss_params['nprobe'])
+        elif isinstance(description, faiss.IndexHNSW):
+            parameter_space.set_index_parameter(self.index, 'efSearch', self.faiss_params['ef_search'])
     
-    def _get_food_vector(self, food: Food) -> np.ndarray:
-        """获取美食的向量表示
+    def _build_faiss_index(self):
+        """使用FAISS构建索引，以行号作为ID
         
-        Args:
-            food: 美食对象
-            
-        Returns:
-            美食的向量表示
+        IVF和PQ索引先在随机抽取的样本上训练
         """
-        # 检查缓存
-        if food.id in self.food_vector_cache:
-            return self.food_vector_cache[food.id]
+        rows = np.array([row for row in range(self._size) if row not in self.deleted], dtype='int64')
+        dim = self.vectors.shape[1]
         
-        # 组合美食的名称、描述和标签
-        text = f"{food.name} {food.description or ''} {' '.join(food.taste_tags or [])} {' '.join(food.signature_dishes or [])}"
+        self.index = faiss.index_factory(dim, self._faiss_factory_string(len(rows), dim), faiss.METRIC_INNER_PRODUCT)
         
-        # 将文本转换为向量
-        vector = self._text_to_vector(text)
+        if not self.index.is_trained:
+            sample_size = min(len(rows), self.faiss_params['train_sample_size'])
+            sample_rows = np.random.default_rng(0).choice(rows, size=sample_size, replace=False)
+            self.index.train(self.vectors[np.sort(sample_rows)])
         
-        # 缓存向量
-        self.food_vector_cache[food.id] = vector
+        if len(rows) > 0:
+            self.index.add_with_ids(self.vectors[rows], rows)
         
-        return vector
+        self._apply_faiss_search_params()
     
-    def _get_user_preference_vector(self, user: User) -> np.ndarray:
-        """获取用户偏好的向量表示
+    def _build_annoy_index(self):
+        """使用Annoy构建索引，以行号作为项目编号
         
-        Args:
-            user: 用户对象
-            
-        Returns:
-            用户偏好的向量表示
+        增加树的数量可以提高准确性，但会增加构建时间
         """
-        # 组合用户的旅游偏好和美食偏好
-        preferences = []
-        if user.travel_preferences:
-            preferences.extend(user.travel_preferences)
-        if user.food_preferences:
-            preferences.extend(user.food_preferences)
+        index = AnnoyIndex(self.vectors.shape[1], 'angular')
         
-        text = " ".join(preferences)
-        
-        # 将文本转换为向量
-        return self._text_to_vector(text)
-    
-    def build_place_index(self, places: List[Place]):
-        """构建景点索引
-        
-        Args:
-            places: 景点列表
-        """
-        self.place_ids = [place.id for place in places]
-        self.place_id_to_index = {place_id: i for i, place_id in enumerate(self.place_ids)}
+        for row in range(self._size):
+            if row not in self.deleted:
+                index.add_item(row, self.vectors[row])
         
-        # 计算所有景点的向量表示
-        self.place_vectors = []
-        for place in places:
-            vector = self._get_place_vector(place)
-            self.place_vectors.append(vector)
+        index.build(self.n_trees)
         
-        # 构建索引
-        if self.use_faiss and FAISS_AVAILABLE:
-            self._build_faiss_index(self.place_vectors, 'place')
-        elif ANNOY_AVAILABLE:
-            self._build_annoy_index(self.place_vectors, 'place')
-        else:
-            print("No vector search library available. Using brute force search.")
+        self.index = index
+        self.indexed_count = self._size
     
-    def build_food_index(self, foods: List[Food]):
-        """构建美食索引
+    def _append_row(self, item_id: int, vector: np.ndarray, coord: Tuple[float, float] = None) -> int:
+        """追加一行（向量归一化后），返回行号"""
+        vector = _normalize_rows(np.asarray(vector, dtype='float32').reshape(1, -1))[0]
+        
+        if self._size == 0 and self._buffer.shape[1] != len(vector):
+            self._buffer = np.zeros((16, len(vector)), dtype='float32')
+            self._id_buffer = np.zeros(16, dtype='int64')
+            self._coord_buffer = np.full((16, 2), np.nan)
+        elif self._size == len(self._buffer) or not self._buffer.flags.writeable \
+                or not self._coord_buffer.flags.writeable:
+            # 容量不足时按倍数扩容，均摊每次追加的拷贝开销；内存映射的只读缓冲区也在这里复制到内存
+            capacity = max(16, 2 * self._size)
+            new_buffer = np.zeros((capacity, self._buffer.shape[1]), dtype='float32')
+            new_buffer[:self._size] = self._buffer[:self._size]
+            self._buffer = new_buffer
+            new_id_buffer = np.zeros(capacity, dtype='int64')
+            new_id_buffer[:self._size] = self._id_buffer[:self._size]
+            self._id_buffer = new_id_buffer
+            new_coord_buffer = np.full((capacity, 2), np.nan)
+            new_coord_buffer[:self._size] = self._coord_buffer[:self._size]
+            self._coord_buffer = new_coord_buffer
+        
+        row = self._size
+        self._buffer[row] = vector
+        self._id_buffer[row] = item_id
+        self._coord_buffer[row] = self._to_coord_array([coord], 1)[0]
+        self._size += 1
+        return row
+    
+    def _ensure_writable_index(self):
+        """以内存映射方式加载的FAISS索引是只读的，修改前读入内存"""
+        if self._mmap_index_path is not None:
+            self.index = faiss.read_index(self._mmap_index_path)
+            self._apply_faiss_search_params()
+            self._mmap_index_path = None
+    
+    def add(self, item_id: int, vector: np.ndarray, coord: Tuple[float, float] = None):
+        """添加或替换单个项目的向量
         
         Args:
-            foods: 美食列表
+            item_id: 项目ID
+            vector: 项目向量
+            coord: 项目的(纬度, 经度)
         """
-        self.food_ids = [food.id for food in foods]
-        self.food_id_to_index = {food_id: i for i, food_id in enumerate(self.food_ids)}
+        if item_id in self.id_to_index:
+            self._remove_row(item_id)
         
-        # 计算所有美食的向量表示
-        self.food_vectors = []
-        for food in foods:
-            vector = self._get_food_vector(food)
-            self.food_vectors.append(vector)
+        row = self._append_row(item_id, vector, coord)
+        self.id_to_index[item_id] = row
         
-        # 构建索引
-        if self.use_faiss and FAISS_AVAILABLE:
-            self._build_faiss_index(self.food_vectors, 'food')
-        elif ANNOY_AVAILABLE:
-            self._build_annoy_index(self.food_vectors, 'food')
-        else:
-            print("No vector search library available. Using brute force search.")
+        if self.backend == 'faiss':
+            self._ensure_writable_index()
+            if self.index is None:
+                self.index = self._new_faiss_index(self.vectors.shape[1])
+            self.index.add_with_ids(self.vectors[row:row + 1], np.array([row], dtype='int64'))
+        
+        self._maybe_compact()
     
-    def _build_faiss_index(self, vectors: List[np.ndarray], index_type: str):
-        """使用FAISS构建索引
+    def remove(self, item_id: int) -> bool:
+        """删除单个项目
         
         Args:
-            vectors: 向量列表
-            index_type: 索引类型，'place'或'food'
+            item_id: 项目ID
+            
+        Returns:
+            项目是否存在于索引中
         """
-        if not FAISS_AVAILABLE:
-            return
+        if not self._remove_row(item_id):
+            return False
         
-        # 将向量转换为numpy数组
-        vectors_array = np.array(vectors).astype('float32')
-        
-        # 创建索引
-        index = faiss.IndexFlatL2(vectors_array.shape[1])
-        index.add(vectors_array)
+        self._maybe_compact()
+        return True
+    
+    def _remove_row(self, item_id: int) -> bool:
+        """给项目所在行打上墓碑标记"""
+        row = self.id_to_index.pop(item_id, None)
+        if row is None:
+            return False
+        
+        self.deleted.add(row)
+        if self.backend == 'faiss' and self.index is not None:
+            self._ensure_writable_index()
+            try:
+                self.index.remove_ids(np.array([row], dtype='int64'))
+            except RuntimeError:
+                # HNSW等索引不支持删除，搜索时过滤
+                self._faiss_tombstones.add(row)
         
-        # 保存索引
-        if index_type == 'place':
-            self.place_index = index
+        return True
+    
+    def _stale_count(self) -> int:
+        """已删除或尚未进入索引的行数"""
+        stale = len(self.deleted)
+        if self.backend == 'annoy':
+            stale += self._size - self.indexed_count
+        return stale
+    
+    def _maybe_compact(self):
+        """过期行过多时重建索引"""
+        if self._stale_count() > max(self.COMPACT_MIN_ROWS, self.COMPACT_RATIO * self._size):
+            self.compact()
+    
+    def compact(self):
+        """丢弃已删除的行并重建底层索引，重建后行号会重新编号"""
+        if self.deleted:
+            live_rows = [row for row in range(self._size) if row not in self.deleted]
+            self.build(self.ids[live_rows], self.vectors[live_rows], self.coords[live_rows])
         else:
-            self.food_index = index
+            self._build_backend()
     
-    def _build_annoy_index(self, vectors: List[np.ndarray], index_type: str, n_trees: int = 10):
-        """使用Annoy构建索引
+    def search(self, query_vector: np.ndarray, top_n: int, center: Tuple[float, float] = None,
+               radius: float = None) -> List[Tuple[int, float]]:
+        """搜索最相似的项目
         
         Args:
-            vectors: 向量列表
-            index_type: 索引类型，'place'或'food'
-            n_trees: 树的数量，增加树的数量可以提高准确性，但会增加构建时间
+            query_vector: 查询向量
+            top_n: 返回的结果数量
+            center: 搜索中心的(纬度, 经度)，与radius一起给出时只返回半径内的项目
+            radius: 搜索半径（公里）
+            
+        Returns:
+            项目ID和相似度分数的列表
         """
-        if not ANNOY_AVAILABLE or not vectors:
-            return
-        
-        # 创建索引
-        index = AnnoyIndex(len(vectors[0]), 'angular')
+        if not self.id_to_index:
+            return []
         
-        # 添加向量
-        for i, vector in enumerate(vectors):
-            index.add_item(i, vector)
+        start_time = time.perf_counter()
+        if center is not None and radius is not None:
+            rows = self._search_within(query_vector, top_n, center, radius)
+        else:
+            rows = self._search_rows(query_vector, top_n)
         
-        # 构建索引
-        index.build(n_trees)
+        SEARCH_QUERIES.inc(index=self.name, backend=self.backend)
+        SEARCH_LATENCY.observe(time.perf_counter() - start_time, index=self.name, backend=self.backend,
+                               kind='single' if center is None or radius is None else 'geo')
         
-        # 保存索引
-        if index_type == 'place':
-            self.place_index = index
+        return [(int(self.ids[row]), similarity) for row, similarity in rows]
+    
+    def _search_rows(self, query_vector: np.ndarray, top_n: int) -> List[Tuple[int, float]]:
+        """使用当前后端搜索，返回行号和相似度分数的列表"""
+        if self.backend == 'faiss' and self.index is not None:
+            return self._search_faiss(query_vector, top_n)
+        elif self.backend == 'annoy' and self.index is not None:
+            return self._search_annoy(query_vector, top_n)
         else:
-            self.food_index = index
+            BRUTE_FORCE_QUERIES.inc(index=self.name, reason='no_ann_index')
+            return self._search_brute_force(query_vector, top_n)
     
-    def search_places(self, query_vector: np.ndarray, top_n: int = 10) -> List[Tuple[int, float]]:
-        """搜索最相似的景点
+    def _geo_cell_key(self, lat_cells: np.ndarray, lon_cells: np.ndarray) -> np.ndarray:
+        """网格单元的行列号编码为单元编号，同一纬度行内的单元编号连续"""
+        n_lon_cells = int(math.ceil(360.0 / self.GEO_CELL_DEGREES)) + 1
+        return lat_cells.astype('int64') * n_lon_cells + lon_cells.astype('int64')
+    
+    def _build_geo_cells(self):
+        """按网格单元编号对有位置信息的行排序，建立单元到行号的查找表"""
+        coords = self.coords
+        rows = np.nonzero(~np.isnan(coords).any(axis=1))[0]
+        lat_cells = np.floor((coords[rows, 0] + 90.0) / self.GEO_CELL_DEGREES)
+        lon_cells = np.floor((coords[rows, 1] + 180.0) / self.GEO_CELL_DEGREES)
+        keys = self._geo_cell_key(lat_cells, lon_cells)
+        
+        order = np.argsort(keys, kind='stable')
+        self._geo_cell_keys = keys[order]
+        self._geo_cell_rows = rows[order].astype('int64')
+        self._geo_indexed_count = self._size
+    
+    def has_coordinates(self) -> bool:
+        """索引中是否有带位置信息的行"""
+        return self._size > 0 and not np.isnan(self.coords).all()
+    
+    def rows_within(self, center: Tuple[float, float], radius: float) -> np.ndarray:
+        """查找半径内未删除的行
+        
+        先取出覆盖搜索范围的网格单元中的行，再精确计算距离过滤；
+        查找表构建后追加的行直接计算距离，追加的行过多时重建查找表
         
         Args:
-            query_vector: 查询向量
-            top_n: 返回的结果数量
+            center: 中心点的(纬度, 经度)
+            radius: 半径（公里）
             
         Returns:
-            景点ID和相似度分数的列表
+            行号数组
         """
-        if self.use_faiss and FAISS_AVAILABLE and self.place_index is not None:
-            return self._search_faiss(query_vector, self.place_index, self.place_ids, top_n)
-        elif ANNOY_AVAILABLE and self.place_index is not None:
-            return self._search_annoy(query_vector, self.place_index, self.place_ids, top_n)
+        pending = self._size - self._geo_indexed_count
+        if self._geo_cell_keys is None or pending > max(self.COMPACT_MIN_ROWS, self.COMPACT_RATIO * self._size):
+            self._build_geo_cells()
+        
+        latitude, longitude = center
+        lat_delta = radius / 111.0
+        lat_lo = max(-90.0, latitude - lat_delta)
+        lat_hi = min(90.0, latitude + lat_delta)
+        
+        # 经度方向的范围随纬度变化，靠近极点时覆盖所有经度
+        cos_lat = min(math.cos(math.radians(lat_lo)), math.cos(math.radians(lat_hi)))
+        lon_delta = radius / (111.0 * cos_lat) if cos_lat > 1e-6 else 360.0
+        if lon_delta >= 180.0:
+            lon_ranges = [(-180.0, 180.0)]
         else:
-            return self._search_brute_force(query_vector, self.place_vectors, self.place_ids, top_n)
+            lon_lo, lon_hi = longitude - lon_delta, longitude + lon_delta
+            # 跨越180度经线时拆成两段
+            lon_ranges = [(max(lon_lo, -180.0), min(lon_hi, 180.0))]
+            if lon_lo < -180.0:
+                lon_ranges.append((lon_lo + 360.0, 180.0))
+            if lon_hi > 180.0:
+                lon_ranges.append((-180.0, lon_hi - 360.0))
+        
+        cell = self.GEO_CELL_DEGREES
+        lat_cells = np.arange(math.floor((lat_lo + 90.0) / cell), math.floor((lat_hi + 90.0) / cell) + 1)
+        
+        # 每个纬度行内的单元编号连续，用二分查找取出一段
+        parts = []
+        for lon_lo, lon_hi in lon_ranges:
+            lo_keys = self._geo_cell_key(lat_cells, np.full(len(lat_cells), math.floor((lon_lo + 180.0) / cell)))
+            hi_keys = self._geo_cell_key(lat_cells, np.full(len(lat_cells), math.floor((lon_hi + 180.0) / cell)))
+            starts = np.searchsorted(self._geo_cell_keys, lo_keys, side='left')
+            ends = np.searchsorted(self._geo_cell_keys, hi_keys, side='right')
+            parts.extend(self._geo_cell_rows[start:end] for start, end in zip(starts, ends) if end > start)
+        
+        parts.append(np.arange(self._geo_indexed_count, self._size, dtype='int64'))
+        rows = np.concatenate(parts) if parts else np.zeros(0, dtype='int64')
+        
+        if self.deleted and len(rows) > 0:
+            deleted_rows = np.fromiter(self.deleted, dtype='int64', count=len(self.deleted))
+            rows = rows[~np.isin(rows, deleted_rows)]
+        
+        coords = self.coords[rows]
+        with np.errstate(invalid='ignore'):
+            within = _haversine_km(latitude, longitude, coords[:, 0], coords[:, 1]) <= radius
+        return np.sort(rows[within])
     
-    def search_foods(self, query_vector: np.ndarray, top_n: int = 10) -> List[Tuple[int, float]]:
-        """搜索最相似的美食
+    def _search_within(self, query_vector: np.ndarray, top_n: int, center: Tuple[float, float],
+                       radius: float) -> List[Tuple[int, float]]:
+        """在半径内搜索最相似的行
+        
+        半径内的候选行较少时直接对这些行精确打分；较多时用近似搜索多取结果再按位置过滤，
+        多取的数量按候选行占比估计，不够时按倍数增加
         
         Args:
             query_vector: 查询向量
             top_n: 返回的结果数量
+            center: 中心点的(纬度, 经度)
+            radius: 半径（公里）
             
         Returns:
-            美食ID和相似度分数的列表
+            行号和相似度分数的列表
         """
-        if self.use_faiss and FAISS_AVAILABLE and self.food_index is not None:
-            return self._search_faiss(query_vector, self.food_index, self.food_ids, top_n)
-        elif ANNOY_AVAILABLE and self.food_index is not None:
-            return self._search_annoy(query_vector, self.food_index, self.food_ids, top_n)
-        else:
-            return self._search_brute_force(query_vector, self.food_vectors, self.food_ids, top_n)
+        rows = self.rows_within(center, radius)
+        if len(rows) == 0:
+            return []
+        
+        n_live = len(self.id_to_index)
+        if self.index is not None and self.backend != 'brute_force' and len(rows) > self.GEO_PREFILTER_MAX_ROWS:
+            in_range = np.zeros(self._size, dtype=bool)
+            in_range[rows] = True
+            
+            k = min(n_live, max(top_n, int(math.ceil(2 * top_n * n_live / len(rows)))))
+            while True:
+                results = [(row, similarity) for row, similarity in self._search_rows(query_vector, k)
+                           if in_range[row]]
+                if len(results) >= top_n or k >= n_live:
+                    break
+                k = min(n_live, k * 4)
+            
+            if len(results) >= min(top_n, len(rows)):
+                return results[:top_n]
+        
+        # 对候选行精确打分
+        BRUTE_FORCE_QUERIES.inc(index=self.name, reason='geo_prefilter')
+        query = _normalize_rows(np.asarray(query_vector, dtype='float32').reshape(1, -1))[0]
+        scores = self.vectors[rows] @ query
+        return [(int(rows[i]), float(scores[i])) for i in _top_n_rows(scores, top_n)]
     
-    def _search_faiss(self, query_vector: np.ndarray, index, ids: List[int], top_n: int) -> List[Tuple[int, float]]:
+    def _search_faiss(self, query_vector: np.ndarray, top_n: int) -> List[Tuple[int, float]]:
         """使用FAISS搜索
         
         Args:
             query_vector: 查询向量
-            index: FAISS索引
-            ids: ID列表
             top_n: 返回的结果数量
             
         Returns:
-            ID和相似度分数的列表
+            行号和相似度分数的列表
         """
-        # 将查询向量转换为numpy数组
-        query_array = np.array([query_vector]).astype('float32')
+        # 将查询向量转换为归一化的numpy数组
+        query_array = _normalize_rows(np.array([query_vector]))
         
-        # 搜索
-        distances, indices = index.search(query_array, top_n)
+        # 搜索，多取出仍留在索引中的已删除行
+        k = min(top_n + len(self._faiss_tombstones), self.index.ntotal)
+        similarities, indices = self.index.search(query_array, k)
         
-        # 转换结果
+        # 转换结果，内积即余弦相似度
         results = []
-        for i, idx in enumerate(indices[0]):
-            if idx < len(ids):
-                # FAISS返回的是距离，转换为相似度
-                similarity = 1.0 / (1.0 + distances[0][i])
-                results.append((ids[idx], similarity))
+        for i, row in enumerate(indices[0]):
+            if row >= 0 and row not in self._faiss_tombstones:
+                results.append((int(row), float(similarities[0][i])))
         
-        return results
+        return results[:top_n]
     
-    def _search_annoy(self, query_vector: np.ndarray, index, ids: List[int], top_n: int) -> List[Tuple[int, float]]:
-        """使用Annoy搜索
+    def _search_faiss_batch(self, query_matrix: np.ndarray, top_n: int) -> List[List[Tuple[int, float]]]:
+        """使用FAISS一次搜索整批查询
         
         Args:
-            query_vector: 查询向量
-            index: Annoy索引
-            ids: ID列表
-            top_n: 返回的结果数量
+            query_matrix: 形状为(m, dim)的查询矩阵
+            top_n: 每个查询返回的结果数量
             
         Returns:
-            ID和相似度分数的列表
+            每个查询的行号和相似度分数列表
         """
-        # 搜索
-        indices, distances = index.get_nns_by_vector(query_vector, top_n, include_distances=True)
+        k = min(top_n + len(self._faiss_tombstones), self.index.ntotal)
+        if k <= 0:
+            return [[] for _ in range(len(query_matrix))]
         
-        # 转换结果
-        results = []
-        for i, idx in enumerate(indices):
-            if idx < len(ids):
-                # Annoy返回的是角度距离，转换为相似度
-                similarity = 1.0 - distances[i] / 2.0
-                results.append((ids[idx], similarity))
+        similarities, indices = self.index.search(_normalize_rows(query_matrix), k)
         
+        results = []
+        for rows, row_similarities in zip(indices, similarities):
+            results.append([(int(row), float(similarity)) for row, similarity in zip(rows, row_similarities)
+                            if row >= 0 and row not in self._faiss_tombstones][:top_n])
         return results
     
-    def _search_brute_force(self, query_vector: np.ndarray, vectors: List[np.ndarray], ids: List[int], top_n: int) -> List[Tuple[int, float]]:
-        """暴力搜索
+    def _search_annoy(self, query_vector: np.ndarray, top_n: int) -> List[Tuple[int, float]]:
+        """使用Annoy搜索
         
-        当没有可用的向量搜索库时使用
+        索引中已删除的行会被多取出再过滤掉，索引构建之后追加的行用暴力搜索补充
         
         Args:
             query_vector: 查询向量
-            vectors: 向量列表
-            ids: ID列表
             top_n: 返回的结果数量
             
         Returns:
-            ID和相似度分数的列表
+            行号和相似度分数的列表
         """
-        # 计算所有向量与查询向量的相似度
-        similarities = []
-        for i, vector in enumerate(vectors):
-            # 计算余弦相似度
-            dot_product = np.dot(query_vector, vector)
-            norm_a = np.linalg.norm(query_vector)
-            norm_b = np.linalg.norm(vector)
-            
-            if norm_a == 0 or norm_b == 0:
-                similarity = 0
-            else:
-                similarity = dot_product / (norm_a * norm_b)
-            
-            similarities.append((i, similarity))
+        # 多取出已删除的行数，保证过滤后仍有top_n个结果
+        n_deleted = sum(1 for row in self.deleted if row < self.indexed_count)
         
-        # 排序并返回前N个结果
-        similarities.sort(key=lambda x: x[1], reverse=True)
+        # 搜索
+        indices, distances = self.index.get_nns_by_vector(query_vector, top_n + n_deleted, include_distances=True)
         
+        # 转换结果
         results = []
-        for i, similarity in similarities[:top_n]:
-            if i < len(ids):
-                results.append((ids[i], similarity))
-        
-        return results
+        for i, row in enumerate(indices):
+            if row not in self.deleted:
+                # Annoy返回的是角度距离sqrt(2(1-cos))，转换为余弦相似度
+                similarity = 1.0 - distances[i] ** 2 / 2.0
+                results.append((row, similarity))
+        
+        # 补充尚未进入索引的行
+        if self.indexed_count < self._size:
+            BRUTE_FORCE_QUERIES.inc(index=self.name, reason='unindexed_rows')
+            results.extend(self._search_brute_force(query_vector, top_n, start=self.indexed_count))
+            results.sort(key=lambda x: x[1], reverse=True)
+        
+        return results[:top_n]
     
-    def recommend_places(self, user: User, places: List[Place], top_n: int = 10) -> List[Dict[str, Any]]:
-        """为用户推荐景点
+    def _brute_force_scores(self, query_matrix: np.ndarray, start: int = 0) -> np.ndarray:
+        """计算查询向量与start之后所有行的余弦相似度
         
         Args:
-            user: 用户对象
-            places: 候选景点列表
-            top_n: 返回的推荐数量
+            query_matrix: 形状为(m, dim)的查询矩阵
+            start: 起始行号
             
         Returns:
-            推荐景点列表，包含相似度分数
+            形状为(m, 行数)的相似度矩阵，已删除的行为-inf
         """
-        # 获取用户偏好向量
-        user_vector = self._get_user_preference_vector(user)
+        scores = _normalize_rows(query_matrix) @ self.vectors[start:].T
         
-        # 构建景点索引
-        if not self.place_index:
-            self.build_place_index(places)
+        if self.deleted:
+            deleted_rows = np.fromiter(self.deleted, dtype='int64', count=len(self.deleted))
+            scores[:, deleted_rows[deleted_rows >= start] - start] = -np.inf
         
-        # 搜索最相似的景点
+        return scores
+    
+    def _search_brute_force(self, query_vector: np.ndarray, top_n: int, start: int = 0) -> List[Tuple[int, float]]:
+        """暴力搜索
+        
+        当没有可用的向量搜索库时使用，对归一化的向量矩阵做一次矩阵向量乘法，再用argpartition取前N个
+        
+        Args:
+            query_vector: 查询向量
+            top_n: 返回的结果数量
+            start: 参与搜索的起始行号，默认为所有行
+            
+        Returns:
+            行号和相似度分数的列表
+        """
+        scores = self._brute_force_scores(np.asarray(query_vector, dtype='float32').reshape(1, -1), start)[0]
+        
+        return [(start + int(i), float(scores[i])) for i in _top_n_rows(scores, top_n)]
+    
+    def _search_brute_force_batch(self, query_matrix: np.ndarray, top_n: int, chunk_size: int = 256,
+                                  n_jobs: int = 1) -> List[List[Tuple[int, float]]]:
+        """批量暴力搜索
+        
+        按块计算查询矩阵与向量矩阵的乘积，控制相似度矩阵占用的内存，多个块可以在多个线程中并行计算
+        
+        Args:
+            query_matrix: 形状为(m, dim)的查询矩阵
+            top_n: 每个查询返回的结果数量
+            chunk_size: 每块的查询数量
+            n_jobs: 并行的线程数，为None时使用CPU核数
+            
+        Returns:
+            每个查询的行号和相似度分数列表
+        """
+        def search_chunk(chunk_start: int) -> List[List[Tuple[int, float]]]:
+            scores = self._brute_force_scores(query_matrix[chunk_start:chunk_start + chunk_size])
+            
+            k = min(top_n, len(self.id_to_index))
+            if k <= 0:
+                return [[] for _ in range(len(scores))]
+            
+            top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+            top_scores = np.take_along_axis(scores, top, axis=1)
+            order = np.argsort(-top_scores, axis=1, kind='stable')
+            top = np.take_along_axis(top, order, axis=1)
+            top_scores = np.take_along_axis(top_scores, order, axis=1)
+            
+            return [[(int(row), float(score)) for row, score in zip(rows, row_scores)]
+                    for rows, row_scores in zip(top, top_scores)]
+        
+        chunks = _parallel_map(search_chunk, list(range(0, len(query_matrix), chunk_size)), n_jobs)
+        return [rows for chunk in chunks for rows in chunk]
+    
+    def lookup_vectors(self, item_ids: List[int]) -> Tuple[np.ndarray, np.ndarray]:
+        """按项目ID取出索引中的归一化向量
+        
+        Args:
+            item_ids: 项目ID列表
+            
+        Returns:
+            (向量矩阵, 是否在索引中的布尔数组)，不在索引中的项目对应零向量
+        """
+        dim = self.vectors.shape[1] if self._size > 0 else 0
+        rows = [self.id_to_index.get(item_id) for item_id in item_ids]
+        found = np.array([row is not None for row in rows], dtype=bool)
+        
+        vectors = np.zeros((len(item_ids), dim), dtype='float32')
+        if found.any():
+            vectors[found] = self.vectors[[row for row in rows if row is not None]]
+        return vectors, found
+    
+    def search_batch(self, query_matrix: np.ndarray, top_n: int, n_jobs: int = None) -> List[List[Tuple[int, float]]]:
+        """批量搜索多个查询向量
+        
+        FAISS对整个查询矩阵只调用一次search；Annoy和暴力搜索把查询分给多个线程并行处理
+        
+        Args:
+            query_matrix: 形状为(m, dim)的查询矩阵
+            top_n: 每个查询返回的结果数量
+            n_jobs: Annoy和暴力搜索使用的线程数，为None时使用CPU核数
+            
+        Returns:
+            每个查询的项目ID和相似度分数列表
+        """
+        query_matrix = np.asarray(query_matrix, dtype='float32')
+        
+        if not self.id_to_index:
+            return [[] for _ in range(len(query_matrix))]
+        
+        start_time = time.perf_counter()
+        if self.backend == 'faiss' and self.index is not None:
+            batch_rows = self._search_faiss_batch(query_matrix, top_n)
+        elif self.backend == 'annoy' and self.index is not None:
+            batch_rows = _parallel_map(lambda query_vector: self._search_annoy(query_vector, top_n),
+                                       list(query_matrix), n_jobs)
+        else:
+            BRUTE_FORCE_QUERIES.inc(len(query_matrix), index=self.name, reason='no_ann_index')
+            batch_rows = self._search_brute_force_batch(query_matrix, top_n, n_jobs=n_jobs)
+        
+        SEARCH_QUERIES.inc(len(query_matrix), index=self.name, backend=self.backend)
+        SEARCH_LATENCY.observe(time.perf_counter() - start_time, index=self.name, backend=self.backend, kind='batch')
+        
+        ids = self.ids
+        return [[(int(ids[row]), similarity) for row, similarity in rows] for rows in batch_rows]
+    
+    def stats(self) -> Dict[str, Any]:
+        """索引的规模和内存占用
+        
+        Returns:
+            后端、项目数、行数、已删除行数、向量维度，以及向量、ID、位置和FAISS索引占用的字节数（FAISS按编码大小估计）；
+            memory_mapped表示向量是否以内存映射方式加载，这部分由多个工作进程共享页缓存
+        """
+        ann_bytes = 0
+        if self.index is not None and self.backend == 'faiss':
+            try:
+                inner = faiss.downcast_index(self.index.index) if isinstance(self.index, faiss.IndexIDMap) else self.index
+                ann_bytes = int(self.index.ntotal * (inner.sa_code_size() + 8))
+            except RuntimeError:
+                ann_bytes = 0
+        
+        return {
+            'backend': self.backend,
+            'items': len(self),
+            'rows': int(self._size),
+            'deleted': len(self.deleted),
+            'dim': int(self.vectors.shape[1]) if self._size > 0 else 0,
+            'vector_bytes': int(self.vectors.nbytes),
+            # 行号到ID的数组，以及ID映射中按ID排序的ID和行号两个数组
+            'id_bytes': int(self.ids.nbytes) * 3,
+            'coord_bytes': int(self.coords.nbytes),
+            'ann_bytes': ann_bytes,
+            'memory_mapped': isinstance(self._buffer, np.memmap)
+        }
+    
+    def save(self, index_path: str):
+        """保存索引、ID映射和向量矩阵
+        
+        保存前先丢弃已删除的行，保证文件中的行号连续。文件格式便于以内存映射方式加载：
+        ID映射保存为int64的.npy文件，向量保存为原始float32文件，形状等信息保存在.meta.json中
+        
+        Args:
+            index_path: 索引保存路径
+        """
+        if self._stale_count() > 0:
+            self.compact()
+        
+        if self.index is not None:
+            if self.backend == 'faiss':
+                faiss.write_index(self.index, index_path)
+            elif self.backend == 'annoy':
+                self.index.save(index_path)
+        
+        # 保存ID映射，包括按ID排序的查找表
+        order = np.argsort(self.ids, kind='stable')
+        np.save(f"{index_path}.ids.npy", np.ascontiguousarray(self.ids, dtype='int64'))
+        np.save(f"{index_path}.sorted_ids.npy", np.ascontiguousarray(self.ids[order], dtype='int64'))
+        np.save(f"{index_path}.sorted_rows.npy", order.astype('int64'))
+        
+        # 保存向量和位置
+        np.ascontiguousarray(self.vectors, dtype='float32').tofile(f"{index_path}.vectors.f32")
+        np.save(f"{index_path}.coords.npy", np.ascontiguousarray(self.coords, dtype='float64'))
+        if self.feature_weights is not None:
+            np.save(f"{index_path}.weights.npy", np.asarray(self.feature_weights, dtype='float32'))
+        
+        with open(f"{index_path}.meta.json", 'w') as f:
+            json.dump({
+                'count': int(self._size),
+                'dim': int(self.vectors.shape[1]) if self._size > 0 else 0,
+                'backend': self.backend if self.index is not None else 'brute_force',
+                'faiss_index_type': self.faiss_index_type
+            }, f)
+    
+    def load(self, index_path: str, dim: int = None, mmap: bool = True):
+        """加载save保存的索引
+        
+        默认以只读内存映射方式打开ID映射、向量和索引文件，多个工作进程共享操作系统页缓存，
+        启动时不需要把整个索引读入每个进程的私有内存
+        
+        Args:
+            index_path: 索引路径
+            dim: 没有向量文件时Annoy使用的向量维度
+            mmap: 是否以内存映射方式加载
+        """
+        mmap_mode = 'r' if mmap else None
+        
+        if os.path.exists(f"{index_path}.meta.json"):
+            with open(f"{index_path}.meta.json") as f:
+                meta = json.load(f)
+            
+            self._size = meta['count']
+            self._id_buffer = np.load(f"{index_path}.ids.npy", mmap_mode=mmap_mode)
+            self.id_to_index = IdRowMap(np.load(f"{index_path}.sorted_ids.npy", mmap_mode=mmap_mode),
+                                        np.load(f"{index_path}.sorted_rows.npy", mmap_mode=mmap_mode))
+            
+            if self._size > 0:
+                if mmap:
+                    self._buffer = np.memmap(f"{index_path}.vectors.f32", dtype='float32', mode='r',
+                                             shape=(self._size, meta['dim']))
+                else:
+                    self._buffer = np.fromfile(f"{index_path}.vectors.f32", dtype='float32').reshape(self._size, meta['dim'])
+            else:
+                self._buffer = np.zeros((0, meta['dim']), dtype='float32')
+        else:
+            # 兼容旧格式：pickle保存的ID列表和np.save保存的向量
+            if os.path.exists(f"{index_path}.ids"):
+                with open(f"{index_path}.ids", 'rb') as f:
+                    self._id_buffer = np.array(pickle.load(f), dtype='int64')
+                self.id_to_index = IdRowMap.from_ids(self._id_buffer)
+                self._size = len(self._id_buffer)
+            
+            if os.path.exists(f"{index_path}.vectors"):
+                self._buffer = np.ascontiguousarray(_normalize_rows(np.load(f"{index_path}.vectors")))
+        
+        # 没有位置文件（旧格式）时不支持按位置过滤
+        if os.path.exists(f"{index_path}.coords.npy"):
+            self._coord_buffer = np.load(f"{index_path}.coords.npy", mmap_mode=mmap_mode)
+        else:
+            self._coord_buffer = np.full((self._size, 2), np.nan)
+        
+        if os.path.exists(f"{index_path}.weights.npy"):
+            self.feature_weights = np.load(f"{index_path}.weights.npy")
+        else:
+            self.feature_weights = None
+        
+        self.deleted = set()
+        self._mmap_index_path = None
+        self._geo_cell_keys = None
+        
+        if os.path.exists(index_path):
+            if self.backend == 'faiss':
+                io_flags = faiss.IO_FLAG_MMAP if mmap else 0
+                self.index = faiss.read_index(index_path, io_flags)
+                # 旧版本保存的是L2距离、不支持按ID增删的索引，用向量重建
+                if (self.index.metric_type != faiss.METRIC_INNER_PRODUCT or isinstance(self.index, faiss.IndexFlat)) \
+                        and self._size > 0:
+                    self._build_faiss_index()
+                else:
+                    self._apply_faiss_search_params()
+                    if mmap:
+                        self._mmap_index_path = index_path
+            elif self.backend == 'annoy':
+                # 需要知道向量维度
+                if self._size > 0:
+                    dim = self.vectors.shape[1]
+                self.index = AnnoyIndex(dim, 'angular')
+                # Annoy本身以内存映射方式加载索引文件
+                self.index.load(index_path, prefault=not mmap)
+                self.indexed_count = self._size
+
+
+class ShardedIdMap(Mapping):
+    """分片索引中项目ID到(分片键, 分片内行号)的映射
+    
+    先按ShardedVectorIndex.id_to_shard找到分片，再查该分片自己的id_to_index，
+    每次查找都是O(1)的，单条增删、分片重建和分片内的压缩都会立即反映出来，不需要另外维护
+    """
+    
+    def __init__(self, index: 'ShardedVectorIndex'):
+        """初始化映射
+        
+        Args:
+            index: 分片索引
+        """
+        self.index = index
+    
+    def __getitem__(self, item_id) -> Tuple[Tuple[str, ...], int]:
+        key = self.index.id_to_shard[item_id]
+        return key, self.index.shards[key].id_to_index[item_id]
+    
+    def __contains__(self, item_id) -> bool:
+        return item_id in self.index.id_to_shard
+    
+    def __iter__(self):
+        return iter(self.index.id_to_shard)
+    
+    def __len__(self) -> int:
+        return len(self.index.id_to_shard)
+
+
+class ShardedVectorIndex:
+    """按城市等字段分片的向量索引
+    
+    每个分片是一个独立的VectorIndex，项目按分片字段（如city、place_type）的取值路由到分片。
+    带过滤条件的查询只搜索匹配的分片，跨分片的查询分别搜索各分片后按相似度合并。
+    分片可以单独重建和保存，不影响其他分片。
+    """
+    
+    def __init__(self, shard_fields: Tuple[str, ...], use_faiss: bool = True, faiss_index_type: str = 'flat',
+                 faiss_params: Dict[str, Any] = None, name: str = None):
+        """初始化分片索引
+        
+        Args:
+            shard_fields: 分片字段，如('city',)或('city', 'place_type')
+            use_faiss: 是否使用FAISS
+            faiss_index_type: 每个分片的FAISS索引类型
+            faiss_params: FAISS索引参数
+            name: 索引名称，所有分片共用，用作指标的标签
+        """
+        self.name = name or 'default'
+        self.shard_fields = tuple(shard_fields)
+        self.use_faiss = use_faiss
+        self.faiss_index_type = faiss_index_type
+        self.faiss_params = faiss_params
+        # 分片键 -> 分片索引
+        self.shards = {}
+        # 项目ID -> 分片键
+        self.id_to_shard = {}
+        # 项目ID -> (分片键, 分片内行号)
+        self.id_to_index = ShardedIdMap(self)
+        # 所有分片共用的文本特征权重，见VectorIndex.feature_weights
+        self.feature_weights = None
+    
+    def _new_shard(self) -> VectorIndex:
+        """创建一个空的分片"""
+        return VectorIndex(use_faiss=self.use_faiss, faiss_index_type=self.faiss_index_type,
+                           faiss_params=self.faiss_params, name=self.name)
+    
+    def shard_key(self, item: Union[Place, Food]) -> Tuple[str, ...]:
+        """根据项目的分片字段计算分片键，字段为空的项目归入空字符串分片
+        
+        Args:
+            item: 景点或美食对象
+            
+        Returns:
+            分片键
+        """
+        return tuple(str(getattr(item, field, None) or '') for field in self.shard_fields)
+    
+    def route(self, filters: Dict[str, Any] = None) -> List[Tuple[str, ...]]:
+        """找出与过滤条件匹配的分片
+        
+        Args:
+            filters: 分片字段到取值的映射，如{'city': '杭州'}，不是分片字段的条件会被忽略
+            
+        Returns:
+            分片键列表，没有过滤条件时为所有分片
+        """
+        conditions = [(i, str(filters[field])) for i, field in enumerate(self.shard_fields)
+                      if filters and filters.get(field) is not None]
+        if not conditions:
+            return list(self.shards)
+        
+        return [key for key in self.shards if all(key[i] == value for i, value in conditions)]
+    
+    def __len__(self) -> int:
+        return len(self.id_to_shard)
+    
+    @property
+    def ids(self) -> np.ndarray:
+        """所有分片的行号到项目ID数组依次拼接（副本）"""
+        return np.concatenate([shard.ids for shard in self.shards.values()]) if self.shards \
+            else np.zeros(0, dtype='int64')
+    
+    @property
+    def vectors(self) -> np.ndarray:
+        """所有分片的向量矩阵依次拼接（副本），行与ids对应"""
+        return np.concatenate([shard.vectors for shard in self.shards.values()]) if self.shards \
+            else np.zeros((0, 0), dtype='float32')
+    
+    def build(self, ids: List[int], vectors: Union[List[np.ndarray], np.ndarray],
+              coords: Union[List[Tuple[float, float]], np.ndarray] = None, shard_keys: List[Tuple[str, ...]] = None):
+        """用完整的项目列表重建所有分片
+        
+        Args:
+            ids: 项目ID列表
+            vectors: 与ids一一对应的向量
+            coords: 与ids一一对应的(纬度, 经度)
+            shard_keys: 与ids一一对应的分片键
+        """
+        vectors = np.asarray(vectors, dtype='float32')
+        if vectors.ndim != 2:
+            vectors = vectors.reshape(len(ids), -1)
+        
+        groups = defaultdict(list)
+        for i, key in enumerate(shard_keys or [('',) * len(self.shard_fields)] * len(ids)):
+            groups[tuple(key)].append(i)
+        
+        self.shards = {}
+        self.id_to_shard = {}
+        for key, positions in groups.items():
+            shard = self._new_shard()
+            shard.build([ids[i] for i in positions], vectors[positions],
+                        [coords[i] for i in positions] if coords is not None else None)
+            self.shards[key] = shard
+            self.id_to_shard.update((int(ids[i]), key) for i in positions)
+    
+    def build_shard(self, key: Tuple[str, ...], ids: List[int], vectors: Union[List[np.ndarray], np.ndarray],
+                    coords: Union[List[Tuple[float, float]], np.ndarray] = None):
+        """只重建一个分片，其他分片不受影响
+        
+        Args:
+            key: 分片键
+            ids: 该分片的全部项目ID
+            vectors: 与ids一一对应的向量
+            coords: 与ids一一对应的(纬度, 经度)
+        """
+        key = tuple(key)
+        shard = self._new_shard()
+        if len(ids) > 0:
+            shard.build(ids, vectors, coords)
+        
+        # 旧分片中的项目先移出映射
+        old_shard = self.shards.get(key)
+        if old_shard is not None:
+            for item_id in old_shard.id_to_index:
+                if self.id_to_shard.get(item_id) == key:
+                    del self.id_to_shard[item_id]
+        
+        # 从其他分片移过来的项目（如城市发生变化）从原分片删除
+        for item_id in ids:
+            item_id = int(item_id)
+            previous = self.id_to_shard.get(item_id)
+            if previous is not None and previous != key:
+                self.shards[previous].remove(item_id)
+            self.id_to_shard[item_id] = key
+        
+        if len(shard) > 0:
+            self.shards[key] = shard
+        else:
+            self.shards.pop(key, None)
+    
+    def add(self, item_id: int, vector: np.ndarray, coord: Tuple[float, float] = None,
+            shard_key: Tuple[str, ...] = None):
+        """添加或替换单个项目，分片键变化时从原分片移到新分片
+        
+        Args:
+            item_id: 项目ID
+            vector: 项目向量
+            coord: 项目的(纬度, 经度)
+            shard_key: 项目的分片键
+        """
+        key = tuple(shard_key) if shard_key is not None else ('',) * len(self.shard_fields)
+        previous = self.id_to_shard.get(item_id)
+        if previous is not None and previous != key:
+            self.shards[previous].remove(item_id)
+        
+        if key not in self.shards:
+            self.shards[key] = self._new_shard()
+        self.shards[key].add(item_id, vector, coord)
+        self.id_to_shard[item_id] = key
+    
+    def remove(self, item_id: int) -> bool:
+        """删除单个项目
+        
+        Args:
+            item_id: 项目ID
+            
+        Returns:
+            项目是否存在于索引中
+        """
+        key = self.id_to_shard.pop(item_id, None)
+        if key is None:
+            return False
+        return self.shards[key].remove(item_id)
+    
+    def search(self, query_vector: np.ndarray, top_n: int, center: Tuple[float, float] = None,
+               radius: float = None, filters: Dict[str, Any] = None) -> List[Tuple[int, float]]:
+        """在匹配过滤条件的分片中搜索，合并各分片的前top_n个结果
+        
+        Args:
+            query_vector: 查询向量
+            top_n: 返回的结果数量
+            center: 搜索中心的(纬度, 经度)
+            radius: 搜索半径（公里）
+            filters: 分片字段的过滤条件，如{'city': '杭州'}
+            
+        Returns:
+            项目ID和相似度分数的列表
+        """
+        results = []
+        for key in self.route(filters):
+            results.extend(self.shards[key].search(query_vector, top_n, center, radius))
+        
+        return heapq.nlargest(top_n, results, key=lambda x: x[1])
+    
+    def search_batch(self, query_matrix: np.ndarray, top_n: int, filters: Dict[str, Any] = None,
+                     n_jobs: int = None) -> List[List[Tuple[int, float]]]:
+        """批量搜索，每个分片处理整批查询后按查询合并
+        
+        Args:
+            query_matrix: 形状为(m, dim)的查询矩阵
+            top_n: 每个查询返回的结果数量
+            filters: 分片字段的过滤条件
+            n_jobs: Annoy和暴力搜索使用的线程数
+            
+        Returns:
+            每个查询的项目ID和相似度分数列表
+        """
+        merged = [[] for _ in range(len(query_matrix))]
+        for key in self.route(filters):
+            for results, shard_results in zip(merged, self.shards[key].search_batch(query_matrix, top_n, n_jobs=n_jobs)):
+                results.extend(shard_results)
+        
+        return [heapq.nlargest(top_n, results, key=lambda x: x[1]) for results in merged]
+    
+    def has_coordinates(self) -> bool:
+        """是否有分片包含带位置信息的行"""
+        return any(shard.has_coordinates() for shard in self.shards.values())
+    
+    def lookup_vectors(self, item_ids: List[int]) -> Tuple[np.ndarray, np.ndarray]:
+        """按项目ID取出索引中的归一化向量
+        
+        Args:
+            item_ids: 项目ID列表
+            
+        Returns:
+            (向量矩阵, 是否在索引中的布尔数组)，不在索引中的项目对应零向量
+        """
+        dim = next((shard.vectors.shape[1] for shard in self.shards.values() if len(shard) > 0), 0)
+        vectors = np.zeros((len(item_ids), dim), dtype='float32')
+        found = np.zeros(len(item_ids), dtype=bool)
+        
+        positions = defaultdict(list)
+        for i, item_id in enumerate(item_ids):
+            key = self.id_to_shard.get(item_id)
+            if key is not None:
+                positions[key].append(i)
+        
+        for key, shard_positions in positions.items():
+            shard_vectors, shard_found = self.shards[key].lookup_vectors([item_ids[i] for i in shard_positions])
+            vectors[shard_positions] = shard_vectors
+            found[shard_positions] = shard_found
+        
+        return vectors, found
+    
+    def stats(self) -> Dict[str, Any]:
+        """所有分片合计的规模和内存占用，字段与VectorIndex.stats相同，另外给出分片数量"""
+        shard_stats = [shard.stats() for shard in self.shards.values()]
+        result = {
+            'backend': shard_stats[0]['backend'] if shard_stats else self._new_shard().backend,
+            'shards': len(shard_stats),
+            'dim': next((entry['dim'] for entry in shard_stats if entry['dim']), 0),
+            'memory_mapped': any(entry['memory_mapped'] for entry in shard_stats)
+        }
+        for field in ('items', 'rows', 'deleted', 'vector_bytes', 'id_bytes', 'coord_bytes', 'ann_bytes'):
+            result[field] = sum(entry[field] for entry in shard_stats)
+        return result
+    
+    @staticmethod
+    def _shard_file(key: Tuple[str, ...]) -> str:
+        """分片的文件名，城市名等可能包含不适合做文件名的字符，使用哈希"""
+        return 'shard-' + hashlib.sha1('\0'.join(key).encode('utf-8')).hexdigest()[:16]
+    
+    def _read_manifest(self, index_path: str) -> Optional[Dict[str, Any]]:
+        """读取分片清单，不存在时返回None"""
+        if not os.path.exists(f"{index_path}.shards.json"):
+            return None
+        with open(f"{index_path}.shards.json") as f:
+            return json.load(f)
+    
+    def _write_manifest(self, index_path: str, shard_keys: List[Tuple[str, ...]]):
+        """写入分片清单，先写临时文件再替换，读取方不会看到写了一半的清单"""
+        manifest = {
+            'shard_fields': list(self.shard_fields),
+            'shards': [{'key': list(key), 'file': self._shard_file(key)} for key in shard_keys],
+            'feature_weights': None if self.feature_weights is None else [float(w) for w in self.feature_weights]
+        }
+        tmp_path = f"{index_path}.shards.json.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(manifest, f, ensure_ascii=False)
+        os.replace(tmp_path, f"{index_path}.shards.json")
+    
+    def save(self, index_path: str):
+        """保存所有分片
+        
+        每个分片用VectorIndex.save保存到{index_path}.shards/目录下，分片键和文件名记录在{index_path}.shards.json中
+        
+        Args:
+            index_path: 索引保存路径
+        """
+        os.makedirs(f"{index_path}.shards", exist_ok=True)
+        
+        saved_keys = []
+        for key, shard in self.shards.items():
+            if len(shard) > 0:
+                shard.save(os.path.join(f"{index_path}.shards", self._shard_file(key)))
+                saved_keys.append(key)
+        
+        self._write_manifest(index_path, saved_keys)
+    
+    def save_shard(self, index_path: str, key: Tuple[str, ...]):
+        """只保存一个分片并更新分片清单
+        
+        Args:
+            index_path: 索引保存路径
+            key: 分片键
+        """
+        key = tuple(key)
+        manifest = self._read_manifest(index_path)
+        keys = [tuple(entry['key']) for entry in manifest['shards']] if manifest else []
+        
+        shard = self.shards.get(key)
+        if shard is not None and len(shard) > 0:
+            os.makedirs(f"{index_path}.shards", exist_ok=True)
+            shard.save(os.path.join(f"{index_path}.shards", self._shard_file(key)))
+            if key not in keys:
+                keys.append(key)
+        elif key in keys:
+            keys.remove(key)
+        
+        self._write_manifest(index_path, keys)
+    
+    def load(self, index_path: str, dim: int = None, mmap: bool = True):
+        """加载save保存的分片
+        
+        分片字段与保存时不同时不加载，由调用方重新构建
+        
+        Args:
+            index_path: 索引路径
+            dim: 没有向量文件时Annoy使用的向量维度
+            mmap: 是否以内存映射方式加载
+        """
+        manifest = self._read_manifest(index_path)
+        if manifest is None:
+            return
+        
+        if tuple(manifest['shard_fields']) != self.shard_fields:
+            print(f"Warning: shard fields of {index_path} do not match {self.shard_fields}, ignoring saved shards.")
+            return
+        
+        self.shards = {}
+        self.id_to_shard = {}
+        weights = manifest.get('feature_weights')
+        self.feature_weights = None if weights is None else np.asarray(weights, dtype='float32')
+        for entry in manifest['shards']:
+            key = tuple(entry['key'])
+            shard = self._new_shard()
+            shard.load(os.path.join(f"{index_path}.shards", entry['file']), dim=dim, mmap=mmap)
+            self.shards[key] = shard
+            self.id_to_shard.update((int(item_id), key) for item_id in shard.ids)
+
+
+class VectorSearchEngine:
+    """向量搜索引擎
+    
+    实现高效的向量搜索，用于景点和美食推荐
+    """
+    
+    def __init__(self, vector_dim: int = 100, use_bert: bool = False, use_faiss: bool = True,
+                 batch_size: int = 32, num_threads: int = None, max_length: int = 512,
+                 faiss_index_type: str = 'flat', faiss_params: Dict[str, Any] = None,
+                 embedding_cache: EmbeddingCache = None, shard_fields: Dict[str, Tuple[str, ...]] = None,
+                 encoder: TextEncoder = None):
+        """初始化搜索引擎
+        
+        Args:
+            vector_dim: 向量维度
+            use_bert: 没有传入encoder时是否使用BERT进行特征提取
+            use_faiss: 是否使用FAISS进行向量搜索，如果为False则使用Annoy
+            batch_size: 批量计算向量时每批的文本数量
+            num_threads: 模型推理使用的CPU线程数，为None时使用默认值
+            max_length: BERT输入的最大token数
+            faiss_index_type: FAISS索引类型，'flat'、'ivf_flat'、'ivf_pq'或'hnsw'
+            faiss_params: FAISS索引参数，如nlist、nprobe、ef_search等
+            embedding_cache: 持久化的文本向量缓存，为None时不使用
+            shard_fields: 索引类型到分片字段的映射，如{'place': ('city',)}，未配置的类型不分片
+            encoder: 文本编码器，如句向量模型或ONNX模型，见text_encoders.create_encoder
+        """
+        self.vector_dim = vector_dim
+        self.embedding_cache = embedding_cache
+        self.use_bert = use_bert and BERT_AVAILABLE
+        self.use_faiss = use_faiss and FAISS_AVAILABLE
+        self.batch_size = max(1, batch_size)
+        self.num_threads = num_threads
+        self.max_length = max_length
+        
+        # 初始化特征提取模型
+        self.word2vec_model = None
+        self.encoder = encoder
+        
+        if self.encoder is None and self.use_bert:
+            self.encoder = create_encoder('bert', batch_size=self.batch_size, max_length=max_length,
+                                          num_threads=num_threads)
+        
+        if self.encoder is not None:
+            self.vector_dim = self.encoder.dim
+        elif WORD2VEC_AVAILABLE:
+            self._init_word2vec()
+        
+        # 没有可用模型时使用的确定性哈希向量化，维度与模型一致
+        self.hashing_embedder = HashingEmbedder(dim=self.vector_dim)
+        
+        # 初始化索引
+        self.faiss_index_type = faiss_index_type
+        self.faiss_params = faiss_params
+        self.shard_fields = {item_type: tuple(fields) for item_type, fields in (shard_fields or {}).items() if fields}
+        self.indices = {
+            'place': self._new_index('place'),
+            'food': self._new_index('food')
+        }
+        
+        # 缓存向量
+        self.place_vector_cache = {}
+        self.food_vector_cache = {}
+    
+    def _new_index(self, index_type: str) -> Union[VectorIndex, ShardedVectorIndex]:
+        """按引擎配置创建一个空的向量索引，配置了分片字段的类型创建分片索引"""
+        if index_type in self.shard_fields:
+            return ShardedVectorIndex(self.shard_fields[index_type], use_faiss=self.use_faiss,
+                                      faiss_index_type=self.faiss_index_type, faiss_params=self.faiss_params,
+                                      name=index_type)
+        return VectorIndex(use_faiss=self.use_faiss, faiss_index_type=self.faiss_index_type,
+                           faiss_params=self.faiss_params, name=index_type)
+    
+    def _build_index(self, index_type: str, items: List[Union[Place, Food]], vectors: np.ndarray):
+        """用项目列表和对应的向量重建索引"""
+        index = self.indices[index_type]
+        ids = [item.id for item in items]
+        coords = [(item.latitude, item.longitude) for item in items]
+        
+        if isinstance(index, ShardedVectorIndex):
+            index.build(ids, vectors, coords, [index.shard_key(item) for item in items])
+        else:
+            index.build(ids, vectors, coords)
+    
+    def _add_to_index(self, index_type: str, item: Union[Place, Food], vector: np.ndarray):
+        """向索引中添加或替换单个项目"""
+        index = self.indices[index_type]
+        coord = (item.latitude, item.longitude)
+        
+        if isinstance(index, ShardedVectorIndex):
+            index.add(item.id, vector, coord, index.shard_key(item))
+        else:
+            index.add(item.id, vector, coord)
+    
+    def _search_index(self, index_type: str, query_vector: np.ndarray, top_n: int,
+                      center: Tuple[float, float] = None, radius: float = None,
+                      filters: Dict[str, Any] = None) -> List[Tuple[int, float]]:
+        """在索引中搜索，分片索引按过滤条件只搜索匹配的分片"""
+        index = self.indices[index_type]
+        if isinstance(index, ShardedVectorIndex):
+            return index.search(query_vector, top_n, center, radius, filters)
+        return index.search(query_vector, top_n, center, radius)
+    
+    def rebuild_shard(self, index_type: str, items: List[Union[Place, Food]],
+                      filters: Dict[str, Any]) -> Tuple[str, ...]:
+        """只重建一个分片
+        
+        Args:
+            index_type: 索引类型，'place'或'food'
+            items: 该分片的全部项目
+            filters: 确定分片的字段取值，必须包含所有分片字段，如{'city': '杭州'}
+            
+        Returns:
+            分片键
+        """
+        index = self.indices[index_type]
+        if not isinstance(index, ShardedVectorIndex):
+            raise ValueError(f"{index_type} index is not sharded")
+        
+        start_time = time.perf_counter()
+        key = tuple(str(filters.get(field) or '') for field in index.shard_fields)
+        get_vectors = self._get_place_vectors if index_type == 'place' else self._get_food_vectors
+        vectors = get_vectors(items)
+        index.build_shard(key, [item.id for item in items], vectors,
+                          [(item.latitude, item.longitude) for item in items])
+        INDEX_BUILD_SECONDS.observe(time.perf_counter() - start_time, index=index_type, operation='rebuild_shard')
+        return key
+    
+    def _backend_index(self, index_type: str):
+        """底层的FAISS/Annoy索引，分片索引为分片键到各分片底层索引的映射"""
+        index = self.indices[index_type]
+        if isinstance(index, ShardedVectorIndex):
+            return {key: shard.index for key, shard in index.shards.items()}
+        return index.index
+    
+    @property
+    def place_index(self):
+        """景点的底层FAISS/Annoy索引，按城市等字段分片时为分片键到各分片底层索引的映射"""
+        return self._backend_index('place')
+    
+    @property
+    def food_index(self):
+        """美食的底层FAISS/Annoy索引，按城市等字段分片时为分片键到各分片底层索引的映射"""
+        return self._backend_index('food')
+    
+    @property
+    def place_ids(self) -> np.ndarray:
+        """行号到景点ID的数组"""
+        return self.indices['place'].ids
+    
+    @property
+    def food_ids(self) -> np.ndarray:
+        """行号到美食ID的数组"""
+        return self.indices['food'].ids
+    
+    @property
+    def place_vectors(self) -> np.ndarray:
+        """景点向量矩阵"""
+        return self.indices['place'].vectors
+    
+    @property
+    def food_vectors(self) -> np.ndarray:
+        """美食向量矩阵"""
+        return self.indices['food'].vectors
+    
+    @property
+    def place_id_to_index(self) -> Union[IdRowMap, ShardedIdMap]:
+        """景点ID到行号的映射，分片索引为景点ID到(分片键, 分片内行号)的映射"""
+        return self.indices['place'].id_to_index
+    
+    @property
+    def food_id_to_index(self) -> Union[IdRowMap, ShardedIdMap]:
+        """美食ID到行号的映射，分片索引为美食ID到(分片键, 分片内行号)的映射"""
+        return self.indices['food'].id_to_index
+    
+    def _init_word2vec(self, vector_size: int = 100):
+        """初始化Word2Vec模型"""
+        self.vector_dim = vector_size
+        # 模拟模型初始化，实际应用中应加载预训练模型
+        self.word2vec_model = None
+    
+    def _embedding_model_id(self) -> Optional[str]:
+        """当前文本向量化模型的标识，用作向量缓存键的一部分
+        
+        备用的哈希方法计算很快，不需要缓存，返回None
+        """
+        if self.encoder is not None:
+            return self.encoder.model_id
+        elif WORD2VEC_AVAILABLE and self.word2vec_model is not None:
+            return f"word2vec:{self.vector_dim}"
+        return None
+    
+    def _uses_hashing_embedder(self) -> bool:
+        """是否使用备用的哈希向量化（没有可用的BERT和Word2Vec模型）"""
+        return self.encoder is None and not (WORD2VEC_AVAILABLE and self.word2vec_model is not None)
+    
+    def _texts_to_vectors(self, texts: List[str], feature_weights: np.ndarray = None) -> np.ndarray:
+        """批量将文本转换为向量
+        
+        所有构建索引和计算用户向量的操作都通过该方法计算向量，
+        先查询持久化缓存，只对未命中的文本进行模型推理
+        
+        Args:
+            texts: 输入文本列表
+            feature_weights: 哈希向量化使用的IDF权重，项目向量传入索引的权重，用户向量不加权
+            
+        Returns:
+            形状为(文本数量, 向量维度)的连续float32矩阵
+        """
+        if not texts:
+            return np.zeros((0, self.vector_dim), dtype='float32')
+        
+        model_id = self._embedding_model_id()
+        if self.embedding_cache is None or model_id is None:
+            return self._compute_vectors(texts, feature_weights)
+        
+        cached = self.embedding_cache.get_many(model_id, texts)
+        missing = [i for i, vector in enumerate(cached) if vector is None]
+        
+        if missing:
+            missing_texts = [texts[i] for i in missing]
+            computed = self._compute_vectors(missing_texts)
+            self.embedding_cache.put_many(model_id, missing_texts, computed)
+            for i, vector in zip(missing, computed):
+                cached[i] = vector
+        
+        return np.ascontiguousarray(cached, dtype='float32')
+    
+    def _compute_vectors(self, texts: List[str], feature_weights: np.ndarray = None) -> np.ndarray:
+        """使用模型批量计算文本向量，不经过缓存
+        
+        Args:
+            texts: 输入文本列表
+            feature_weights: 哈希向量化使用的IDF权重
+            
+        Returns:
+            形状为(文本数量, 向量维度)的连续float32矩阵
+        """
+        if self.encoder is not None:
+            vectors = self._texts_to_vectors_encoder(texts)
+        elif self._uses_hashing_embedder():
+            vectors = self.hashing_embedder.transform(texts, feature_weights)
+        else:
+            vectors = [self._text_to_vector(text) for text in texts]
+        
+        return np.ascontiguousarray(vectors, dtype='float32')
+    
+    def _text_to_vector(self, text: str) -> np.ndarray:
+        """将文本转换为向量
+        
+        Args:
+            text: 输入文本
+            
+        Returns:
+            文本的向量表示
+        """
+        if self.encoder is not None:
+            return self._texts_to_vectors_encoder([text])[0]
+        elif WORD2VEC_AVAILABLE and self.word2vec_model is not None:
+            return self._text_to_vector_word2vec(text)
+        else:
+            return self._text_to_vector_fallback(text)
+    
+    def _text_to_vector_word2vec(self, text: str) -> np.ndarray:
+        """使用Word2Vec将文本转换为向量
+        
+        Args:
+            text: 输入文本
+            
+        Returns:
+            文本的向量表示
+        """
+        if not WORD2VEC_AVAILABLE or self.word2vec_model is None:
+            return self._text_to_vector_fallback(text)
+        
+        # 分词
+        words = text.lower().split()
+        
+        # 获取每个词的向量并计算平均值
+        word_vectors = []
+        for word in words:
+            if word in self.word2vec_model.wv:
+                word_vectors.append(self.word2vec_model.wv[word])
+        
+        if word_vectors:
+            return np.mean(word_vectors, axis=0)
+        else:
+            return np.zeros(self.vector_dim)
+    
+    def _texts_to_vectors_encoder(self, texts: List[str]) -> np.ndarray:
+        """使用文本编码器批量将文本转换为向量，推理出错时使用备用方法
+        
+        Args:
+            texts: 输入文本列表
+            
+        Returns:
+            形状为(文本数量, 向量维度)的float32矩阵，行顺序与texts一致
+        """
+        try:
+            return self.encoder.encode(texts)
+        except Exception as e:
+            print(f"Error in {self.encoder.backend} encoding: {e}")
+            return self.hashing_embedder.transform(texts)
+    
+    def _text_to_vector_fallback(self, text: str) -> np.ndarray:
+        """备用的文本向量化方法
+        
+        当Word2Vec和BERT都不可用时使用，按中文字符n-gram和英文单词做确定性的特征哈希，
+        不同工作进程对同一文本得到相同的向量
+        
+        Args:
+            text: 输入文本
+            
+        Returns:
+            文本的向量表示
+        """
+        return self.hashing_embedder.transform_one(text)
+    
+    def _place_text(self, place: Place) -> str:
+        """组合景点的名称、描述和标签"""
+        return f"{place.name} {place.description or ''} {' '.join(place.tags or [])}"
+    
+    def _food_text(self, food: Food) -> str:
+        """组合美食的名称、描述和标签"""
+        return f"{food.name} {food.description or ''} {' '.join(food.taste_tags or [])} {' '.join(food.signature_dishes or [])}"
+    
+    def _get_place_vector(self, place: Place) -> np.ndarray:
+        """获取景点的向量表示
+        
+        Args:
+            place: 景点对象
+            
+        Returns:
+            景点的向量表示
+        """
+        return self._get_place_vectors([place])[0]
+    
+    def _get_food_vector(self, food: Food) -> np.ndarray:
+        """获取美食的向量表示
+        
+        Args:
+            food: 美食对象
+            
+        Returns:
+            美食的向量表示
+        """
+        return self._get_food_vectors([food])[0]
+    
+    def _get_place_vectors(self, places: List[Place]) -> np.ndarray:
+        """批量获取景点的向量表示
+        
+        已缓存的景点直接复用，其余景点一次性批量计算
+        
+        Args:
+            places: 景点列表
+            
+        Returns:
+            形状为(景点数量, 向量维度)的float32矩阵
+        """
+        return self._get_item_vectors(places, self.place_vector_cache, self._place_text,
+                                      self.indices['place'].feature_weights)
+    
+    def _get_food_vectors(self, foods: List[Food]) -> np.ndarray:
+        """批量获取美食的向量表示
+        
+        已缓存的美食直接复用，其余美食一次性批量计算
+        
+        Args:
+            foods: 美食列表
+            
+        Returns:
+            形状为(美食数量, 向量维度)的float32矩阵
+        """
+        return self._get_item_vectors(foods, self.food_vector_cache, self._food_text,
+                                      self.indices['food'].feature_weights)
+    
+    def _get_item_vectors(self, items: List[Union[Place, Food]], cache: Dict[int, np.ndarray], to_text,
+                          feature_weights: np.ndarray = None) -> np.ndarray:
+        """批量获取项目向量，并写入缓存
+        
+        Args:
+            items: 景点或美食列表
+            cache: 项目ID到向量的缓存
+            to_text: 将项目转换为文本的函数
+            feature_weights: 哈希向量化使用的IDF权重
+            
+        Returns:
+            形状为(项目数量, 向量维度)的float32矩阵
+        """
+        missing = [item for item in items if item.id not in cache]
+        
+        # 批量计算未缓存的向量
+        if missing:
+            vectors = self._texts_to_vectors([to_text(item) for item in missing], feature_weights)
+            for item, vector in zip(missing, vectors):
+                cache[item.id] = vector
+        
+        if not items:
+            return np.zeros((0, self.vector_dim), dtype='float32')
+        
+        return np.ascontiguousarray([cache[item.id] for item in items], dtype='float32')
+    
+    def _user_text(self, user: User) -> str:
+        """组合用户的旅游偏好和美食偏好"""
+        preferences = []
+        if user.travel_preferences:
+            preferences.extend(user.travel_preferences)
+        if user.food_preferences:
+            preferences.extend(user.food_preferences)
+        
+        return " ".join(preferences)
+    
+    def _get_user_preference_vector(self, user: User) -> np.ndarray:
+        """获取用户偏好的向量表示
+        
+        Args:
+            user: 用户对象
+            
+        Returns:
+            用户偏好的向量表示
+        """
+        # 将文本转换为向量，偏好没有变化时命中缓存
+        return self._texts_to_vectors([self._user_text(user)])[0]
+    
+    def _get_user_preference_vectors(self, users: List[User]) -> np.ndarray:
+        """批量获取用户偏好的向量表示
+        
+        Args:
+            users: 用户列表
+            
+        Returns:
+            形状为(用户数量, 向量维度)的float32矩阵
+        """
+        return self._texts_to_vectors([self._user_text(user) for user in users])
+    
+    def build_index_from_chunks(self, index_type: str, chunks) -> int:
+        """从分块读取的项目构建索引，构建完成后替换当前索引
+        
+        Args:
+            index_type: 索引类型，'place'或'food'
+            chunks: 产生项目列表的迭代器
+            
+        Returns:
+            索引中的项目数量
+        """
+        index = self.create_index_from_chunks(index_type, chunks)
+        self.swap_indices({index_type: index})
+        return len(index)
+    
+    def create_index_from_chunks(self, index_type: str, chunks) -> Union[VectorIndex, ShardedVectorIndex]:
+        """从分块读取的项目构建一个新的索引对象，不替换当前索引
+        
+        每块项目批量计算向量后只保留ID、向量、位置和分片键，不在内存中同时持有所有ORM对象；
+        使用哈希向量化时先保留词频，全部读完后按统计的IDF加权
+        
+        Args:
+            index_type: 索引类型，'place'或'food'
+            chunks: 产生项目列表的迭代器
+            
+        Returns:
+            新的索引
+        """
+        start_time = time.perf_counter()
+        to_text = self._place_text if index_type == 'place' else self._food_text
+        index = self._new_index(index_type)
+        
+        use_hashing = self._uses_hashing_embedder()
+        document_frequencies = np.zeros(self.hashing_embedder.dim, dtype='int64')
+        
+        ids, vector_chunks, coords, shard_keys = [], [], [], []
+        for items in chunks:
+            texts = [to_text(item) for item in items]
+            if use_hashing:
+                term_frequencies = self.hashing_embedder.term_frequencies(texts)
+                document_frequencies += np.count_nonzero(term_frequencies, axis=0)
+                vector_chunks.append(term_frequencies)
+            else:
+                vector_chunks.append(self._texts_to_vectors(texts))
+            ids.extend(item.id for item in items)
+            coords.extend((item.latitude, item.longitude) for item in items)
+            if isinstance(index, ShardedVectorIndex):
+                shard_keys.extend(index.shard_key(item) for item in items)
+        
+        vectors = np.concatenate(vector_chunks) if vector_chunks else np.zeros((0, self.vector_dim), dtype='float32')
+        if use_hashing:
+            # 索引构建时会归一化，这里只需加权
+            index.feature_weights = HashingEmbedder.compute_idf(None, len(ids), document_frequencies)
+            vectors *= index.feature_weights
+        
+        if isinstance(index, ShardedVectorIndex):
+            index.build(ids, vectors, coords, shard_keys)
+        else:
+            index.build(ids, vectors, coords)
+        
+        INDEX_BUILD_SECONDS.observe(time.perf_counter() - start_time, index=index_type, operation='build')
+        return index
+    
+    def swap_indices(self, indices: Dict[str, Union[VectorIndex, ShardedVectorIndex]]):
+        """用新的索引对象替换当前索引，正在进行的搜索继续使用旧对象
+        
+        Args:
+            indices: 索引类型到新索引的映射
+        """
+        self.indices = dict(self.indices, **indices)
+        
+        # 新索引中的文本可能已经变化，丢弃按项目ID缓存的向量
+        if 'place' in indices:
+            self.place_vector_cache = {}
+        if 'food' in indices:
+            self.food_vector_cache = {}
+    
+    def _fit_feature_weights(self, index_type: str, texts: List[str]):
+        """在索引的全部文本上统计哈希向量化的IDF权重，并丢弃按旧权重缓存的向量
+        
+        Args:
+            index_type: 索引类型，'place'或'food'
+            texts: 索引中全部项目的文本
+        """
+        index = self.indices[index_type]
+        if self._uses_hashing_embedder() and texts:
+            index.feature_weights = HashingEmbedder.compute_idf(self.hashing_embedder.term_frequencies(texts))
+        else:
+            index.feature_weights = None
+        
+        if index_type == 'place':
+            self.place_vector_cache = {}
+        else:
+            self.food_vector_cache = {}
+    
+    def build_place_index(self, places: List[Place]):
+        """构建景点索引
+        
+        Args:
+            places: 景点列表
+        """
+        start_time = time.perf_counter()
+        
+        # 使用哈希向量化时先在全部景点上统计IDF
+        self._fit_feature_weights('place', [self._place_text(place) for place in places])
+        
+        # 批量计算所有景点的向量表示
+        place_vectors = self._get_place_vectors(places)
+        
+        # 构建索引
+        self._build_index('place', places, place_vectors)
+        INDEX_BUILD_SECONDS.observe(time.perf_counter() - start_time, index='place', operation='build')
+    
+    def build_food_index(self, foods: List[Food]):
+        """构建美食索引
+        
+        Args:
+            foods: 美食列表
+        """
+        start_time = time.perf_counter()
+        
+        # 使用哈希向量化时先在全部美食上统计IDF
+        self._fit_feature_weights('food', [self._food_text(food) for food in foods])
+        
+        # 批量计算所有美食的向量表示
+        food_vectors = self._get_food_vectors(foods)
+        
+        # 构建索引
+        self._build_index('food', foods, food_vectors)
+        INDEX_BUILD_SECONDS.observe(time.perf_counter() - start_time, index='food', operation='build')
+    
+    def add_place(self, place: Place):
+        """向景点索引中添加单个景点，已存在时替换其向量
+        
+        Args:
+            place: 景点对象
+        """
+        self._add_to_index('place', place, self._get_place_vector(place))
+    
+    def update_place(self, place: Place):
+        """景点的名称、描述或标签变化后更新其向量
+        
+        Args:
+            place: 景点对象
+        """
+        self.place_vector_cache.pop(place.id, None)
+        self.add_place(place)
+    
+    def remove_place(self, place_id: int) -> bool:
+        """从景点索引中删除单个景点
+        
+        Args:
+            place_id: 景点ID
+            
+        Returns:
+            景点是否存在于索引中
+        """
+        self.place_vector_cache.pop(place_id, None)
+        return self.indices['place'].remove(place_id)
+    
+    def add_food(self, food: Food):
+        """向美食索引中添加单个美食，已存在时替换其向量
+        
+        Args:
+            food: 美食对象
+        """
+        self._add_to_index('food', food, self._get_food_vector(food))
+    
+    def update_food(self, food: Food):
+        """美食的名称、描述或标签变化后更新其向量
+        
+        Args:
+            food: 美食对象
+        """
+        self.food_vector_cache.pop(food.id, None)
+        self.add_food(food)
+    
+    def remove_food(self, food_id: int) -> bool:
+        """从美食索引中删除单个美食
+        
+        Args:
+            food_id: 美食ID
+            
+        Returns:
+            美食是否存在于索引中
+        """
+        self.food_vector_cache.pop(food_id, None)
+        return self.indices['food'].remove(food_id)
+    
+    def search_places(self, query_vector: np.ndarray, top_n: int = 10, center: Tuple[float, float] = None,
+                      radius: float = None, filters: Dict[str, Any] = None) -> List[Tuple[int, float]]:
+        """搜索最相似的景点
+        
+        Args:
+            query_vector: 查询向量
+            top_n: 返回的结果数量
+            center: 搜索中心的(纬度, 经度)，与radius一起给出时只返回半径内的景点
+            radius: 搜索半径（公里）
+            filters: 分片字段的过滤条件，如{'city': '杭州'}，只在景点索引分片时生效
+            
+        Returns:
+            景点ID和相似度分数的列表
+        """
+        return self._search_index('place', query_vector, top_n, center, radius, filters)
+    
+    def search_foods(self, query_vector: np.ndarray, top_n: int = 10, center: Tuple[float, float] = None,
+                      radius: float = None, filters: Dict[str, Any] = None) -> List[Tuple[int, float]]:
+        """搜索最相似的美食
+        
+        Args:
+            query_vector: 查询向量
+            top_n: 返回的结果数量
+            center: 搜索中心的(纬度, 经度)，与radius一起给出时只返回半径内的美食
+            radius: 搜索半径（公里）
+            filters: 分片字段的过滤条件，如{'city': '杭州'}，只在美食索引分片时生效
+            
+        Returns:
+            美食ID和相似度分数的列表
+        """
+        return self._search_index('food', query_vector, top_n, center, radius, filters)
+    
+    def search_places_batch(self, query_vectors: np.ndarray, top_n: int = 10,
+                            n_jobs: int = None) -> List[List[Tuple[int, float]]]:
+        """批量搜索多个查询向量最相似的景点
+        
+        Args:
+            query_vectors: 形状为(查询数量, 向量维度)的矩阵
+            top_n: 每个查询返回的结果数量
+            n_jobs: Annoy和暴力搜索使用的线程数，为None时使用CPU核数
+            
+        Returns:
+            每个查询的景点ID和相似度分数列表
+        """
+        return self.indices['place'].search_batch(query_vectors, top_n, n_jobs=n_jobs)
+    
+    def search_foods_batch(self, query_vectors: np.ndarray, top_n: int = 10,
+                            n_jobs: int = None) -> List[List[Tuple[int, float]]]:
+        """批量搜索多个查询向量最相似的美食
+        
+        Args:
+            query_vectors: 形状为(查询数量, 向量维度)的矩阵
+            top_n: 每个查询返回的结果数量
+            n_jobs: Annoy和暴力搜索使用的线程数，为None时使用CPU核数
+            
+        Returns:
+            每个查询的美食ID和相似度分数列表
+        """
+        return self.indices['food'].search_batch(query_vectors, top_n, n_jobs=n_jobs)
+    
+    def recommend_batch(self, users: List[User], index_type: str = 'place', top_n: int = 10,
+                        n_jobs: int = None) -> Dict[int, List[Tuple[int, float]]]:
+        """为一批用户同时推荐
+        
+        把所有用户的偏好向量组成一个矩阵，批量计算向量后对整个矩阵做一次批量搜索
+        
+        Args:
+            users: 用户列表
+            index_type: 索引类型，'place'或'food'
+            top_n: 每个用户的推荐数量
+            n_jobs: Annoy和暴力搜索使用的线程数，为None时使用CPU核数
+            
+        Returns:
+            用户ID到(项目ID, 相似度)列表的映射
+        """
+        if not users:
+            return {}
+        
+        user_vectors = self._get_user_preference_vectors(users)
+        results = self.indices[index_type].search_batch(user_vectors, top_n, n_jobs=n_jobs)
+        return {user.id: user_results for user, user_results in zip(users, results)}
+    
+    def recommend_places(self, user: User, places: Optional[List[Place]] = None, top_n: int = 10) -> List[Dict[str, Any]]:
+        """为用户推荐景点
+        
+        Args:
+            user: 用户对象
+            places: 候选景点列表，为None时从数据库按搜索结果的ID批量查询
+            top_n: 返回的推荐数量
+            
+        Returns:
+            推荐景点列表，包含相似度分数
+        """
+        # 获取用户偏好向量
+        user_vector = self._get_user_preference_vector(user)
+        
+        # 构建景点索引
+        if not self.has_index('place'):
+            self.build_place_index(places if places is not None else Place.query.all())
+        
+        # 搜索最相似的景点
         similar_places = self.search_places(user_vector, top_n)
+        places_by_id = self._resolve_items(Place, similar_places, places)
+        
+        # 转换结果
+        result = []
+        for place_id, similarity in similar_places:
+            # 查找景点对象
+            place = places_by_id.get(place_id)
+            if place:
+                place_dict = place.to_dict() if hasattr(place, 'to_dict') else {}
+                place_dict.update({
+                    'similarity': float(similarity)
+                })
+                result.append(place_dict)
+        
+        return result
+    
+    def recommend_foods(self, user: User, foods: Optional[List[Food]] = None, top_n: int = 10) -> List[Dict[str, Any]]:
+        """为用户推荐美食
+        
+        Args:
+            user: 用户对象
+            foods: 候选美食列表，为None时从数据库按搜索结果的ID批量查询
+            top_n: 返回的推荐数量
+            
+        Returns:
+            推荐美食列表，包含相似度分数
+        """
+        # 获取用户偏好向量
+        user_vector = self._get_user_preference_vector(user)
+        
+        # 构建美食索引
+        if not self.has_index('food'):
+            self.build_food_index(foods if foods is not None else Food.query.all())
+        
+        # 搜索最相似的美食
+        similar_foods = self.search_foods(user_vector, top_n)
+        foods_by_id = self._resolve_items(Food, similar_foods, foods)
+        
+        # 转换结果
+        result = []
+        for food_id, similarity in similar_foods:
+            # 查找美食对象
+            food = foods_by_id.get(food_id)
+            if food:
+                food_dict = food.to_dict() if hasattr(food, 'to_dict') else {}
+                food_dict.update({
+                    'similarity': float(similarity)
+                })
+                result.append(food_dict)
+        
+        return result
+    
+    @staticmethod
+    def _resolve_items(model, hits: List[Tuple[int, float]], items: Optional[List[Any]] = None) -> Dict[int, Any]:
+        """把搜索结果中的ID映射为模型对象
+        
+        给定候选列表时只建一次ID映射，不在列表中的结果会被忽略；
+        否则用一条IN查询取回结果对应的行
+        
+        Args:
+            model: Place或Food模型类
+            hits: 搜索结果，(ID, 相似度)列表
+            items: 候选对象列表
+            
+        Returns:
+            ID到模型对象的映射
+        """
+        if items is None:
+            return _fetch_items_by_ids(model, [item_id for item_id, _ in hits])
+        
+        return {item.id: item for item in items}
+    
+    def save_indices(self, place_index_path: str = None, food_index_path: str = None):
+        """保存索引
+        
+        除索引本身外，还会保存ID映射和向量矩阵，以便暴力搜索模式和Annoy加载时也能恢复
+        
+        Args:
+            place_index_path: 景点索引保存路径
+            food_index_path: 美食索引保存路径
+        """
+        if place_index_path and len(self.indices['place']) > 0:
+            self.indices['place'].save(place_index_path)
+        
+        if food_index_path and len(self.indices['food']) > 0:
+            self.indices['food'].save(food_index_path)
+    
+    def load_indices(self, place_index_path: str = None, food_index_path: str = None, mmap: bool = True):
+        """加载索引
+        
+        Args:
+            place_index_path: 景点索引路径
+            food_index_path: 美食索引路径
+            mmap: 是否以只读内存映射方式加载，多个工作进程共享同一份页缓存
+        """
+        if place_index_path:
+            self.indices['place'].load(place_index_path, dim=self.vector_dim, mmap=mmap)
+        
+        if food_index_path:
+            self.indices['food'].load(food_index_path, dim=self.vector_dim, mmap=mmap)
+    
+    def has_index(self, index_type: str) -> bool:
+        """判断指定类型的索引是否已构建或加载
+        
+        Args:
+            index_type: 索引类型，'place'或'food'
+            
+        Returns:
+            索引是否可用于搜索
+        """
+        return len(self.indices[index_type]) > 0
+    
+    def rank_candidates(self, query_vector: np.ndarray, items: List[Union[Place, Food]], index_type: str, 
+                        top_n: int = 10) -> List[Tuple[Union[Place, Food], float]]:
+        """对给定的候选集合按与查询向量的相似度排序
+        
+        优先复用索引中已有的向量，不在索引中的项目才重新计算向量，不会改动已构建的索引
+        
+        Args:
+            query_vector: 查询向量
+            items: 候选景点或美食列表
+            index_type: 索引类型，'place'或'food'
+            top_n: 返回的结果数量
+            
+        Returns:
+            候选对象和相似度分数的列表
+        """
+        get_vectors = self._get_place_vectors if index_type == 'place' else self._get_food_vectors
+        
+        if not items:
+            return []
+        
+        indexed_vectors, found = self.indices[index_type].lookup_vectors([item.id for item in items])
+        
+        # 不在索引中的候选项一次性批量计算向量
+        missing = [i for i in range(len(items)) if not found[i]]
+        if missing:
+            missing_vectors = get_vectors([items[i] for i in missing])
+            if indexed_vectors.shape[1] != missing_vectors.shape[1]:
+                indexed_vectors = np.zeros((len(items), missing_vectors.shape[1]), dtype='float32')
+            indexed_vectors[missing] = missing_vectors
+        candidate_vectors = indexed_vectors
+        
+        # 计算余弦相似度
+        norms = np.linalg.norm(candidate_vectors, axis=1) * np.linalg.norm(query_vector)
+        similarities = np.divide(candidate_vectors @ np.asarray(query_vector, dtype='float32'), norms,
+                                 out=np.zeros(len(items), dtype='float32'), where=norms > 0)
+        
+        order = np.argsort(-similarities)[:top_n]
+        return [(items[i], float(similarities[i])) for i in order]
+
+
+class VectorIndexStore(VersionedStore):
+    """版本化的索引目录
+    
+    每次完整构建的索引文件写入index_dir/versions/<版本号>/，写完后原子地替换符号链接index_dir/current，
+    读取方要么看到旧版本、要么看到完整的新版本，不会读到写了一半的文件。
+    旧版本文件在被替换后仍可被已经内存映射它们的进程继续使用。
+    没有current链接时兼容直接保存在index_dir中的旧布局。
+    """
+    
+    ITEM_FILE_SUFFIX = 'index'
+    
+    @property
+    def index_dir(self) -> str:
+        """索引根目录"""
+        return self.root_dir
+    
+    def publish_engine(self, engine: 'VectorSearchEngine') -> str:
+        """把搜索引擎中的所有索引保存为一个新版本并发布
+        
+        引擎中尚未构建的索引类型沿用当前版本的文件，保证每个版本都是完整的
+        
+        Args:
+            engine: 向量搜索引擎
+            
+        Returns:
+            新版本的目录
+        """
+        return self.publish_indices(engine.indices)
+    
+    def publish_indices(self, indices: Dict[str, Union[VectorIndex, ShardedVectorIndex]]) -> str:
+        """把给定的索引保存为一个新版本并发布
+        
+        没有给出或为空的索引类型沿用当前版本的文件
+        
+        Args:
+            indices: 索引类型到索引的映射
+            
+        Returns:
+            新版本的目录
+        """
+        active = self.active_dir()
+        version_dir = self.new_version_dir()
+        
+        for item_type in VectorSearchRegistry.ITEM_TYPES:
+            index = indices.get(item_type)
+            if index is not None and len(index) > 0:
+                index.save(os.path.join(version_dir, f"{item_type}.index"))
+            else:
+                self.link_item_files(item_type, active, version_dir)
+        
+        self.publish(version_dir)
+        self.prune()
+        return version_dir
+
+
+class VectorSearchRegistry:
+    """进程级向量搜索引擎注册表
+    
+    在应用启动时创建一次，持有已构建的景点和美食索引，
+    启动时从索引目录的当前版本加载，避免每个请求都重新加载模型并全量查询数据库。
+    离线构建工具发布新版本后，各工作进程在下一次取搜索引擎时发现current的变化并换用新索引，不需要重启
+    """
+    
+    ITEM_TYPES = ('place', 'food')
+    
+    def __init__(self, index_dir: str = None, use_bert: bool = BERT_AVAILABLE, use_faiss: bool = FAISS_AVAILABLE,
+                 batch_size: int = 32, num_threads: int = None, faiss_index_type: str = 'flat',
+                 faiss_params: Dict[str, Any] = None, embedding_cache: EmbeddingCache = None,
+                 shard_fields: Dict[str, Tuple[str, ...]] = None, reload_interval: float = 30.0,
+                 keep_versions: int = 3, chunk_size: int = 1000, encoder: TextEncoder = None):
+        """初始化注册表
         
-        # 转换结果
-        result = []
-        for place_id, similarity in similar_places:
-            # 查找景点对象
-            place = next((p for p in places if p.id == place_id), None)
-            if place:
-                place_dict = place.to_dict() if hasattr(place, 'to_dict') else {}
-                place_dict.update({
-                    'similarity': float(similarity)
-                })
-                result.append(place_dict)
+        Args:
+            index_dir: 索引文件目录，为None时不读写索引文件
+            use_bert: 没有传入encoder时是否使用BERT进行特征提取
+            use_faiss: 是否使用FAISS进行向量搜索
+            batch_size: 批量计算向量时每批的文本数量
+            num_threads: 模型推理使用的CPU线程数
+            faiss_index_type: FAISS索引类型
+            faiss_params: FAISS索引参数
+            embedding_cache: 持久化的文本向量缓存
+            shard_fields: 索引类型到分片字段的映射
+            reload_interval: 检查索引目录是否发布了新版本的最小间隔（秒），为None时不检查
+            keep_versions: 索引目录中保留的版本数量
+            chunk_size: 从数据库构建索引时每次读取的行数
+            encoder: 文本编码器
+        """
+        self.index_dir = index_dir
+        self.store = VectorIndexStore(index_dir, keep_versions) if index_dir else None
+        self.reload_interval = reload_interval
+        self.chunk_size = chunk_size
+        # 已加载的版本目录和上次检查的时间
+        self.loaded_dir = None
+        self._last_reload_check = 0.0
+        self.engine = VectorSearchEngine(use_bert=use_bert, use_faiss=use_faiss,
+                                         batch_size=batch_size, num_threads=num_threads,
+                                         faiss_index_type=faiss_index_type, faiss_params=faiss_params,
+                                         embedding_cache=embedding_cache, shard_fields=shard_fields,
+                                         encoder=encoder)
+        self._lock = threading.Lock()
+        # 正在构建的索引类型 -> 构建期间增删过的项目ID，新索引替换旧索引后按数据库重新应用
+        self._pending_changes = {}
+    
+    def index_path(self, item_type: str) -> Optional[str]:
+        """获取当前版本中的索引文件路径
         
-        return result
+        Args:
+            item_type: 项目类型，'place'或'food'
+            
+        Returns:
+            索引文件路径，未配置索引目录时返回None
+        """
+        if not self.store:
+            return None
+        return os.path.join(self.store.active_dir(), f"{item_type}.index")
     
-    def recommend_foods(self, user: User, foods: List[Food], top_n: int = 10) -> List[Dict[str, Any]]:
-        """为用户推荐美食
+    def load(self):
+        """从索引目录的当前版本加载已保存的索引
+        
+        新索引加载完成后才替换引擎中的旧索引，加载期间的请求继续使用旧索引
+        """
+        if not self.store:
+            return
+        
+        active = self.store.active_dir()
+        indices = {}
+        for item_type in self.ITEM_TYPES:
+            start_time = time.perf_counter()
+            index = self.engine._new_index(item_type)
+            index.load(os.path.join(active, f"{item_type}.index"), dim=self.engine.vector_dim)
+            if len(index) > 0:
+                indices[item_type] = index
+                INDEX_BUILD_SECONDS.observe(time.perf_counter() - start_time, index=item_type, operation='load')
+        
+        self.engine.swap_indices(indices)
+        self.loaded_dir = active
+        self._last_reload_check = time.monotonic()
+    
+    def reload_if_changed(self, force: bool = False) -> bool:
+        """索引目录发布了新版本时重新加载
         
         Args:
-            user: 用户对象
-            foods: 候选美食列表
-            top_n: 返回的推荐数量
+            force: 是否忽略检查间隔立即检查
             
         Returns:
-            推荐美食列表，包含相似度分数
+            是否加载了新版本
         """
-        # 获取用户偏好向量
-        user_vector = self._get_user_preference_vector(user)
+        if not self.store or (self.reload_interval is None and not force):
+            return False
+        
+        now = time.monotonic()
+        if not force and now - self._last_reload_check < self.reload_interval:
+            return False
+        self._last_reload_check = now
+        
+        if self.store.active_dir() == self.loaded_dir:
+            return False
+        
+        with self._lock:
+            if self.store.active_dir() == self.loaded_dir:
+                return False
+            self.load()
+        return True
+    
+    def build(self, item_type: str, save: bool = True):
+        """从数据库分块读取数据构建指定类型的索引
         
-        # 构建美食索引
-        if not self.food_index:
-            self.build_food_index(foods)
+        Args:
+            item_type: 项目类型，'place'或'food'
+            save: 构建完成后是否保存为索引目录的新版本
+        """
+        self.build_many([item_type], save)
+    
+    def build_many(self, item_types: List[str], save: bool = True):
+        """从数据库构建多个类型的索引，构建和保存期间不持有锁
         
-        # 搜索最相似的美食
-        similar_foods = self.search_foods(user_vector, top_n)
+        新索引构建在独立的对象中并先保存为新版本，然后在锁内替换引擎中的旧索引，
+        再把构建期间通过upsert/remove改动过的项目按数据库的当前状态重新应用到新索引。
+        构建期间搜索和单条更新继续使用旧索引，不会等待构建完成。
+        保存的新版本不包含构建期间的单条改动，与其他工作进程中的单条改动一样在下一次完整构建时写入
         
-        # 转换结果
-        result = []
-        for food_id, similarity in similar_foods:
-            # 查找美食对象
-            food = next((f for f in foods if f.id == food_id), None)
-            if food:
-                food_dict = food.to_dict() if hasattr(food, 'to_dict') else {}
-                food_dict.update({
-                    'similarity': float(similarity)
-                })
-                result.append(food_dict)
+        Args:
+            item_types: 项目类型列表
+            save: 构建完成后是否保存为索引目录的新版本
+        """
+        with self._lock:
+            for item_type in item_types:
+                self._pending_changes.setdefault(item_type, set())
         
-        return result
+        try:
+            indices = {item_type: self.engine.create_index_from_chunks(
+                           item_type, _iter_item_chunks(Place if item_type == 'place' else Food, self.chunk_size))
+                       for item_type in item_types}
+            # 新索引还没有被其他线程引用，可以在锁外保存
+            version_dir = self.store.publish_indices(indices) if save and self.store else None
+            
+            with self._lock:
+                self.engine.swap_indices(indices)
+                if version_dir:
+                    self.loaded_dir = version_dir
+                for item_type in item_types:
+                    self._reapply_changes(item_type, self._pending_changes.pop(item_type, set()))
+        finally:
+            with self._lock:
+                for item_type in item_types:
+                    self._pending_changes.pop(item_type, None)
     
-    def save_indices(self, place_index_path: str = None, food_index_path: str = None):
-        """保存索引
+    def _reapply_changes(self, item_type: str, item_ids: set):
+        """按数据库的当前状态重新应用构建期间改动过的项目，调用方持有锁
         
         Args:
-            place_index_path: 景点索引保存路径
-            food_index_path: 美食索引保存路径
+            item_type: 项目类型，'place'或'food'
+            item_ids: 构建期间增删过的项目ID
+        """
+        if not item_ids:
+            return
+        
+        model = Place if item_type == 'place' else Food
+        items = model.query.filter(model.id.in_(list(item_ids))).all()
+        for item in items:
+            if item_type == 'place':
+                self.engine.update_place(item)
+            else:
+                self.engine.update_food(item)
+        
+        for item_id in item_ids - {item.id for item in items}:
+            if item_type == 'place':
+                self.engine.remove_place(item_id)
+            else:
+                self.engine.remove_food(item_id)
+    
+    def build_shard(self, item_type: str, filters: Dict[str, Any], save: bool = True):
+        """从数据库只重建一个分片，例如某个城市的数据更新后
+        
+        Args:
+            item_type: 项目类型，'place'或'food'
+            filters: 分片字段的取值，如{'city': '杭州'}
+            save: 构建完成后是否保存该分片
         """
-        if place_index_path and self.place_index:
-            if self.use_faiss and FAISS_AVAILABLE:
-                faiss.write_index(self.place_index, place_index_path)
-            elif ANNOY_AVAILABLE:
-                self.place_index.save(place_index_path)
+        model = Place if item_type == 'place' else Food
+        index = self.engine.indices[item_type]
+        if not isinstance(index, ShardedVectorIndex):
+            raise ValueError(f"{item_type} index is not sharded")
+        
+        # 空字符串分片对应字段为空的项目
+        query = model.query
+        for field in index.shard_fields:
+            value = filters.get(field)
+            column = getattr(model, field)
+            query = query.filter(column == value) if value else query.filter((column == None) | (column == ''))
+        
+        with self._lock:
+            self.engine.rebuild_shard(item_type, query.all(), filters)
+            if save:
+                self.save()
+    
+    def build_missing_in_background(self, app) -> Optional[threading.Thread]:
+        """在后台线程中构建还没有加载的索引，构建完成前搜索只使用已有的索引，不会等待构建
+        
+        Args:
+            app: Flask应用实例，线程在其应用上下文中读取数据库
             
-            # 保存ID映射
-            with open(f"{place_index_path}.ids", 'wb') as f:
-                pickle.dump(self.place_ids, f)
+        Returns:
+            构建线程，索引都已加载时返回None
+        """
+        if all(self.engine.has_index(item_type) for item_type in self.ITEM_TYPES):
+            return None
+        
+        def run():
+            try:
+                with app.app_context():
+                    self.build_many([item_type for item_type in self.ITEM_TYPES
+                                     if not self.engine.has_index(item_type)])
+            except Exception as e:
+                print(f"Error building vector indices: {e}")
+        
+        thread = threading.Thread(target=run, name='vector-index-builder', daemon=True)
+        thread.start()
+        return thread
+    
+    def save(self):
+        """把引擎中的索引保存为索引目录的新版本并发布，不会改写正在被读取的文件"""
+        if not self.store:
+            return
+        
+        self.loaded_dir = self.store.publish_engine(self.engine)
+    
+    def upsert(self, item_type: str, item: Union[Place, Food]):
+        """新增或更新单个景点/美食的索引向量
+        
+        Args:
+            item_type: 项目类型，'place'或'food'
+            item: 景点或美食对象
+        """
+        with self._lock:
+            if item_type == 'place':
+                self.engine.update_place(item)
+            else:
+                self.engine.update_food(item)
+            if item_type in self._pending_changes:
+                self._pending_changes[item_type].add(item.id)
+    
+    def remove(self, item_type: str, item_id: int) -> bool:
+        """从索引中删除单个景点/美食
         
-        if food_index_path and self.food_index:
-            if self.use_faiss and FAISS_AVAILABLE:
-                faiss.write_index(self.food_index, food_index_path)
-            elif ANNOY_AVAILABLE:
-                self.food_index.save(food_index_path)
+        Args:
+            item_type: 项目类型，'place'或'food'
+            item_id: 项目ID
             
-            # 保存ID映射
-            with open(f"{food_index_path}.ids", 'wb') as f:
-                pickle.dump(self.food_ids, f)
+        Returns:
+            项目是否存在于索引中
+        """
+        with self._lock:
+            if item_type in self._pending_changes:
+                self._pending_changes[item_type].add(item_id)
+            if item_type == 'place':
+                return self.engine.remove_place(item_id)
+            else:
+                return self.engine.remove_food(item_id)
     
-    def load_indices(self, place_index_path: str = None, food_index_path: str = None):
-        """加载索引
+    def get_engine(self, item_type: str, build_missing: bool = False) -> VectorSearchEngine:
+        """获取搜索引擎
+        
+        每隔reload_interval秒检查一次索引目录是否发布了新版本。
+        索引还没有加载或构建时默认直接返回引擎，搜索结果为空，由调用方使用备用方案
         
         Args:
-            place_index_path: 景点索引路径
-            food_index_path: 美食索引路径
+            item_type: 项目类型，'place'或'food'
+            build_missing: 索引不存在时是否立即构建，只用于离线脚本
+            
+        Returns:
+            向量搜索引擎
         """
-        if place_index_path and os.path.exists(place_index_path):
-            if self.use_faiss and FAISS_AVAILABLE:
-                self.place_index = faiss.read_index(place_index_path)
-            elif ANNOY_AVAILABLE:
-                # 需要知道向量维度
-                if self.place_vectors:
-                    dim = len(self.place_vectors[0])
-                else:
-                    dim = self.vector_dim
-                self.place_index = AnnoyIndex(dim, 'angular')
-                self.place_index.load(place_index_path)
-            
-            # 加载ID映射
-            if os.path.exists(f"{place_index_path}.ids"):
-                with open(f"{place_index_path}.ids", 'rb') as f:
-                    self.place_ids = pickle.load(f)
-                self.place_id_to_index = {place_id: i for i, place_id in enumerate(self.place_ids)}
-        
-        if food_index_path and os.path.exists(food_index_path):
-            if self.use_faiss and FAISS_AVAILABLE:
-                self.food_index = faiss.read_index(food_index_path)
-            elif ANNOY_AVAILABLE:
-                # 需要知道向量维度
-                if self.food_vectors:
-                    dim = len(self.food_vectors[0])
-                else:
-                    dim = self.vector_dim
-                self.food_index = AnnoyIndex(dim, 'angular')
-                self.food_index.load(food_index_path)
+        self.reload_if_changed()
+        
+        if build_missing and not self.engine.has_index(item_type):
+            self.build(item_type)
+        
+        return self.engine
+
+
+def benchmark_faiss_index_types(vectors: np.ndarray, queries: np.ndarray = None, top_n: int = 10,
+                                param_grid: Dict[str, List[Dict[str, Any]]] = None,
+                                n_queries: int = 200) -> List[Dict[str, Any]]:
+    """比较各FAISS索引类型相对精确搜索的召回率和延迟
+    
+    以归一化向量上的精确内积搜索结果为基准，对每种索引类型和每组搜索参数
+    统计recall@top_n、单次查询的平均和P95延迟以及构建耗时
+    
+    Args:
+        vectors: 形状为(n, dim)的向量矩阵
+        queries: 查询矩阵，默认从vectors中随机抽取n_queries行
+        top_n: 每次查询返回的结果数量
+        param_grid: 索引类型到参数组合列表的映射，默认比较四种索引类型的默认参数，
+            同一索引类型下只有nprobe/ef_search不同的参数组合共用一次构建
+        n_queries: 默认查询数量
+        
+    Returns:
+        每种索引类型和参数组合的报告列表
+    """
+    if not FAISS_AVAILABLE:
+        print("faiss not installed. Nothing to benchmark.")
+        return []
+    
+    vectors = np.asarray(vectors, dtype='float32')
+    if queries is None:
+        rng = np.random.default_rng(0)
+        queries = vectors[rng.choice(len(vectors), size=min(n_queries, len(vectors)), replace=False)]
+    queries = _normalize_rows(queries)
+    
+    if param_grid is None:
+        param_grid = {index_type: [{}] for index_type in VectorIndex.FAISS_INDEX_TYPES}
+    
+    # 精确搜索的结果作为基准
+    ids = list(range(len(vectors)))
+    exact = _normalize_rows(vectors) @ queries.T
+    ground_truth = [set(_top_n_rows(exact[:, i], top_n).tolist()) for i in range(len(queries))]
+    
+    report = []
+    for index_type, params_list in param_grid.items():
+        build_params = dict(params_list[0]) if params_list else {}
+        
+        index = VectorIndex(use_faiss=True, faiss_index_type=index_type, faiss_params=build_params)
+        start_time = time.perf_counter()
+        index.build(ids, vectors)
+        build_seconds = time.perf_counter() - start_time
+        factory = index._faiss_factory_string(len(ids), vectors.shape[1])
+        
+        for params in params_list or [{}]:
+            index.faiss_params.update(params)
+            index._apply_faiss_search_params()
+            
+            latencies = []
+            hits = 0
+            for query, truth in zip(queries, ground_truth):
+                start_time = time.perf_counter()
+                results = index.search(query, top_n)
+                latencies.append((time.perf_counter() - start_time) * 1000)
+                hits += len(truth & {item_id for item_id, _ in results})
             
-            # 加载ID映射
-            if os.path.exists(f"{food_index_path}.ids"):
-                with open(f"{food_index_path}.ids", 'rb') as f:
-                    self.food_ids = pickle.load(f)
-                self.food_id_to_index = {food_id: i for i, food_id in enumerate(self.food_ids)}
+            report.append({
+                'index_type': index_type,
+                'factory': factory,
+                'params': dict(params),
+                'build_seconds': build_seconds,
+                'recall': hits / max(1, sum(len(truth) for truth in ground_truth)),
+                'avg_latency_ms': float(np.mean(latencies)),
+                'p95_latency_ms': float(np.percentile(latencies, 95))
+            })
+    
+    return report
+
+
+# 进程级注册表，由init_vector_search在应用启动时创建
+_registry = None
+_registry_lock = threading.Lock()
+
+
+def _create_config_encoder(config, batch_size: int = 32, num_threads: int = None) -> Optional[TextEncoder]:
+    """按VECTOR_EMBED_*配置创建文本编码器
+    
+    Args:
+        config: Flask的app.config或配置类
+        batch_size: 每批的文本数量
+        num_threads: 推理使用的CPU线程数
+        
+    Returns:
+        文本编码器，配置为hashing或模型不可用时返回None
+    """
+    get = config.get if isinstance(config, dict) else lambda key, default=None: getattr(config, key, default)
+    return create_encoder(get('VECTOR_EMBED_BACKEND', 'bert'), model_name=get('VECTOR_EMBED_MODEL'),
+                          onnx_path=get('VECTOR_EMBED_ONNX_PATH'), quantize=get('VECTOR_EMBED_QUANTIZE', False),
+                          batch_size=batch_size, num_threads=num_threads)
+
+
+def init_vector_search(app=None) -> VectorSearchRegistry:
+    """创建进程级向量搜索注册表并加载索引
+    
+    应在create_app中调用，每个工作进程只执行一次
+    
+    Args:
+        app: Flask应用实例，从中读取VECTOR_INDEX_DIR等配置
+        
+    Returns:
+        向量搜索注册表
+    """
+    global _registry
+    
+    index_dir = None
+    build_on_startup = False
+    batch_size = 32
+    num_threads = None
+    faiss_index_type = 'flat'
+    faiss_params = None
+    shard_fields = None
+    reload_interval = 30.0
+    keep_versions = 3
+    embedding_cache = None
+    use_bert = BERT_AVAILABLE
+    encoder = None
+    if app is not None:
+        index_dir = app.config.get('VECTOR_INDEX_DIR')
+        build_on_startup = app.config.get('VECTOR_BUILD_ON_STARTUP', False)
+        batch_size = app.config.get('VECTOR_EMBED_BATCH_SIZE', batch_size)
+        num_threads = app.config.get('VECTOR_EMBED_THREADS', num_threads)
+        faiss_index_type = app.config.get('VECTOR_FAISS_INDEX_TYPE', faiss_index_type)
+        faiss_params = app.config.get('VECTOR_FAISS_PARAMS', faiss_params)
+        shard_fields = app.config.get('VECTOR_SHARD_FIELDS', shard_fields)
+        reload_interval = app.config.get('VECTOR_INDEX_RELOAD_INTERVAL', reload_interval)
+        keep_versions = app.config.get('VECTOR_INDEX_KEEP_VERSIONS', keep_versions)
+        embedding_cache = get_embedding_cache(app.config.get('EMBEDDING_CACHE_PATH'),
+                                              app.config.get('EMBEDDING_CACHE_MAX_ENTRIES', 200000))
+        # 编码器由配置决定，不可用时使用哈希向量化
+        use_bert = False
+        encoder = _create_config_encoder(app.config, batch_size, num_threads)
+    else:
+        embedding_cache = get_embedding_cache()
+    
+    registry = VectorSearchRegistry(index_dir=index_dir, use_bert=use_bert, batch_size=batch_size,
+                                    num_threads=num_threads, faiss_index_type=faiss_index_type,
+                                    faiss_params=faiss_params, embedding_cache=embedding_cache,
+                                    shard_fields=shard_fields, reload_interval=reload_interval,
+                                    keep_versions=keep_versions, encoder=encoder)
+    registry.load()
+    
+    if build_on_startup and app is not None:
+        with app.app_context():
+            for item_type in VectorSearchRegistry.ITEM_TYPES:
+                if not registry.engine.has_index(item_type):
+                    registry.build(item_type)
+    elif app is not None and not app.config.get('TESTING'):
+        # 没有索引文件时在后台构建，推荐请求中不会构建索引
+        registry.build_missing_in_background(app)
+    
+    if app is not None:
+        app.extensions['vector_search'] = registry
+    
+    with _registry_lock:
+        _registry = registry
+    
+    return registry
+
+
+def get_vector_search_registry() -> VectorSearchRegistry:
+    """获取进程级向量搜索注册表
+    
+    在应用之外（如脚本中）调用时，按默认配置懒加载创建
+    
+    Returns:
+        向量搜索注册表
+    """
+    global _registry
+    
+    if _registry is None:
+        with _registry_lock:
+            if _registry is None:
+                registry = VectorSearchRegistry(embedding_cache=get_embedding_cache())
+                registry.load()
+                _registry = registry
+    
+    return _registry
+
+
+def _collect_index_metrics() -> List[Tuple[str, str, Dict[str, Any], float]]:
+    """导出进程级注册表中索引的规模、内存占用、加载的版本和暴力搜索占比"""
+    samples = []
+    
+    # 暴力搜索占比按进程启动以来的累计次数计算
+    queries = defaultdict(float)
+    for _, labels, value in SEARCH_QUERIES.samples():
+        queries[labels['index']] += value
+    brute_force = defaultdict(float)
+    for _, labels, value in BRUTE_FORCE_QUERIES.samples():
+        brute_force[labels['index']] += value
+    for name, total in queries.items():
+        samples.append(('vector_search_brute_force_ratio', '使用暴力搜索的查询占比',
+                        {'index': name}, brute_force[name] / total if total else 0.0))
+    
+    registry = _registry
+    if registry is None:
+        return samples
+    
+    if registry.loaded_dir:
+        samples.append(('vector_index_version_info', '当前加载的索引版本',
+                        {'version': os.path.basename(os.path.realpath(registry.loaded_dir))}, 1))
+    
+    for item_type, index in registry.engine.indices.items():
+        stats = index.stats()
+        labels = {'index': item_type}
+        samples.append(('vector_index_items', '索引中的项目数量', dict(labels, backend=stats['backend']), stats['items']))
+        samples.append(('vector_index_rows', '索引的行数，包括已删除的行', labels, stats['rows']))
+        samples.append(('vector_index_deleted_rows', '已删除但尚未压缩的行数', labels, stats['deleted']))
+        samples.append(('vector_index_memory_mapped', '向量是否以内存映射方式加载', labels, int(stats['memory_mapped'])))
+        for component in ('vector', 'id', 'coord', 'ann'):
+            samples.append(('vector_index_memory_bytes', '索引各部分占用的字节数',
+                            dict(labels, component=component), stats[f'{component}_bytes']))
+        if 'shards' in stats:
+            samples.append(('vector_index_shards', '分片数量', labels, stats['shards']))
+    
+    return samples
+
+
+metrics.register_collector(_collect_index_metrics)
+
+
+def _iter_item_chunks(model, chunk_size: int = 1000, expunge: bool = False):
+    """按主键顺序分块读取所有景点或美食
+    
+    使用上一块最后的ID作为下一块的起点，不使用OFFSET，每块的查询开销不随表的大小增长
+    
+    Args:
+        model: Place或Food模型类
+        chunk_size: 每块的行数
+        expunge: 每块处理完后是否清空会话，避免整个表的对象同时留在内存中；
+            会使会话中的其他对象也被分离，只应在离线构建时使用
+        
+    Yields:
+        项目列表
+    """
+    last_id = None
+    while True:
+        query = model.query.order_by(model.id)
+        if last_id is not None:
+            query = query.filter(model.id > last_id)
+        
+        items = query.limit(chunk_size).all()
+        if not items:
+            return
+        
+        last_id = items[-1].id
+        yield items
+        if expunge:
+            model.query.session.expunge_all()
+
+
+def _fetch_items_by_ids(model, ids: List[int]) -> Dict[int, Any]:
+    """根据ID列表批量查询景点或美食
+    
+    只加载to_dict需要的列，时间戳等其他列在访问时才延迟加载
+    
+    Args:
+        model: Place或Food模型类
+        ids: ID列表
+        
+    Returns:
+        ID到模型对象的映射
+    """
+    if not ids:
+        return {}
+    
+    query = model.query.filter(model.id.in_(ids))
+    fields = getattr(model, 'DICT_FIELDS', None)
+    if fields:
+        query = query.options(load_only(*[getattr(model, field) for field in fields]))
+    
+    return {item.id: item for item in query.all()}
 
 
 # 提供一个简单的函数接口，方便后端调用
-def get_vector_search_recommendations(user_id: int, item_type: str = 'place', top_n: int = 10) -> List[Dict[str, Any]]:
+def get_vector_search_recommendations(user_id: int, item_type: str = 'place', top_n: int = 10,
+                                      city: str = None) -> List[Dict[str, Any]]:
     """获取基于向量搜索的推荐
     
     Args:
         user_id: 用户ID
         item_type: 推荐项目类型，'place'或'food'
         top_n: 返回的推荐数量
+        city: 只推荐该城市的项目；索引按城市分片时只搜索该城市的分片
         
     Returns:
         推荐项目列表
     """
-    # 初始化搜索引擎
-    search_engine = VectorSearchEngine(use_bert=BERT_AVAILABLE, use_faiss=FAISS_AVAILABLE)
+    if item_type not in VectorSearchRegistry.ITEM_TYPES:
+        return []
     
     # 获取用户
     user = User.query.get(user_id)
     if not user:
         return []
     
+    # 使用进程级搜索引擎，索引在启动时加载或在后台构建，还没有索引时结果为空
+    search_engine = get_vector_search_registry().get_engine(item_type)
+    user_vector = search_engine._get_user_preference_vector(user)
+    
+    filters = {'city': city} if city else None
+    # 未按城市分片时多取一些结果，查询后再按城市过滤
+    routed = 'city' in search_engine.shard_fields.get(item_type, ())
+    n_candidates = top_n if routed or not city else top_n * 5
+    
     if item_type == 'place':
-        # 获取所有景点
-        places = Place.query.all()
-        return search_engine.recommend_places(user, places, top_n)
-    elif item_type == 'food':
-        # 获取所有美食
-        foods = Food.query.all()
-        return search_engine.recommend_foods(user, foods, top_n)
+        similar_items = search_engine.search_places(user_vector, n_candidates, filters=filters)
+        items_by_id = _fetch_items_by_ids(Place, [item_id for item_id, _ in similar_items])
     else:
-        return []
+        similar_items = search_engine.search_foods(user_vector, n_candidates, filters=filters)
+        items_by_id = _fetch_items_by_ids(Food, [item_id for item_id, _ in similar_items])
+    
+    # 转换结果
+    result = []
+    for item_id, similarity in similar_items:
+        item = items_by_id.get(item_id)
+        if item and (not city or item.city == city) and len(result) < top_n:
+            item_dict = item.to_dict() if hasattr(item, 'to_dict') else {}
+            item_dict.update({
+                'similarity': float(similarity)
+            })
+            result.append(item_dict)
+    
+    return result
 
 
 # 提供一个考虑地理位置的推荐函数
@@ -685,43 +3039,298 @@ def get_location_aware_vector_recommendations(user_id: int, latitude: float, lon
     Returns:
         推荐项目列表
     """
-    # 初始化搜索引擎
-    search_engine = VectorSearchEngine(use_bert=BERT_AVAILABLE, use_faiss=FAISS_AVAILABLE)
+    if item_type not in VectorSearchRegistry.ITEM_TYPES:
+        return []
     
     # 获取用户
     user = User.query.get(user_id)
     if not user:
         return []
     
-    if item_type == 'place':
-        # 获取附近的景点
-        nearby_places = Place.get_nearby_places(latitude, longitude, radius)
-        
-        if nearby_places:
-            recommendations = search_engine.recommend_places(user, nearby_places, top_n)
-            
-            # 添加距离信息
-            for item in recommendations:
-                item['distance'] = calculate_distance(latitude, longitude, item['latitude'], item['longitude'])
-            
-            return recommendations
+    search_engine = get_vector_search_registry().get_engine(item_type)
+    user_vector = search_engine._get_user_preference_vector(user)
+    model = Place if item_type == 'place' else Food
+    
+    if search_engine.indices[item_type].has_coordinates():
+        # 在全局索引上按半径过滤搜索，开销与不限位置的搜索相当
+        similar_items = search_engine.indices[item_type].search(user_vector, top_n, (latitude, longitude), radius)
+        items_by_id = _fetch_items_by_ids(model, [item_id for item_id, _ in similar_items])
+        ranked_items = [(items_by_id[item_id], similarity) for item_id, similarity in similar_items
+                        if item_id in items_by_id]
+    else:
+        # 旧格式的索引没有位置信息，先查询附近的项目再排序
+        if item_type == 'place':
+            nearby_items = Place.get_nearby_places(latitude, longitude, radius)
         else:
+            nearby_items = Food.get_nearby_foods(latitude, longitude, radius)
+        
+        if not nearby_items:
             return []
-    
-    elif item_type == 'food':
-        # 获取附近的美食
-        nearby_foods = Food.get_nearby_foods(latitude, longitude, radius)
         
-        if nearby_foods:
-            recommendations = search_engine.recommend_foods(user, nearby_foods, top_n)
-            
+        ranked_items = search_engine.rank_candidates(user_vector, nearby_items, item_type, top_n)
+    
+    recommendations = []
+    for item, similarity in ranked_items:
+        item_dict = item.to_dict() if hasattr(item, 'to_dict') else {}
+        item_dict.update({
+            'similarity': float(similarity),
             # 添加距离信息
-            for item in recommendations:
-                item['distance'] = calculate_distance(latitude, longitude, item['latitude'], item['longitude'])
-            
-            return recommendations
+            'distance': calculate_distance(latitude, longitude, item.latitude, item.longitude)
+        })
+        recommendations.append(item_dict)
+    
+    return recommendations
+
+
+def iter_batch_recommendations(user_ids: List[int] = None, item_type: str = 'place', top_n: int = 10,
+                               chunk_size: int = 1000, n_jobs: int = None):
+    """分块为大量用户生成推荐
+    
+    每次从数据库读取chunk_size个用户，整块用户一次批量搜索，结果逐块产出，不需要在内存中保存所有用户的推荐
+    
+    Args:
+        user_ids: 用户ID列表，为None时为所有用户
+        item_type: 推荐项目类型，'place'或'food'
+        top_n: 每个用户的推荐数量
+        chunk_size: 每块的用户数量
+        n_jobs: Annoy和暴力搜索使用的线程数
+        
+    Yields:
+        (用户ID, [(项目ID, 相似度), ...])
+    """
+    if item_type not in VectorSearchRegistry.ITEM_TYPES:
+        return
+    
+    # 离线批量生成推荐时没有索引就先构建
+    search_engine = get_vector_search_registry().get_engine(item_type, build_missing=True)
+    
+    if user_ids is None:
+        chunks = _iter_item_chunks(User, chunk_size)
+    else:
+        chunks = (User.query.filter(User.id.in_(user_ids[start:start + chunk_size])).all()
+                  for start in range(0, len(user_ids), chunk_size))
+    
+    for users in chunks:
+        recommendations = search_engine.recommend_batch(users, item_type, top_n, n_jobs=n_jobs)
+        for user in users:
+            yield user.id, recommendations[user.id]
+
+
+def write_batch_recommendations(output_path: str, user_ids: List[int] = None, item_type: str = 'place',
+                                top_n: int = 10, chunk_size: int = 1000, n_jobs: int = None) -> int:
+    """为大量用户生成推荐并逐块写入文件
+    
+    .csv文件每行为(user_id, rank, item_id, similarity)，可以直接批量导入数据库表；
+    其他扩展名写为每行一个用户的JSON Lines
+    
+    Args:
+        output_path: 输出文件路径
+        user_ids: 用户ID列表，为None时为所有用户
+        item_type: 推荐项目类型，'place'或'food'
+        top_n: 每个用户的推荐数量
+        chunk_size: 每块的用户数量
+        n_jobs: Annoy和暴力搜索使用的线程数
+        
+    Returns:
+        写入的用户数量
+    """
+    count = 0
+    results = iter_batch_recommendations(user_ids, item_type, top_n, chunk_size, n_jobs)
+    
+    with open(output_path, 'w', newline='', encoding='utf-8') as f:
+        if output_path.endswith('.csv'):
+            writer = csv.writer(f)
+            writer.writerow(['user_id', 'rank', 'item_id', 'similarity'])
+            for user_id, recommendations in results:
+                writer.writerows((user_id, rank, item_id, f"{similarity:.6f}")
+                                 for rank, (item_id, similarity) in enumerate(recommendations, 1))
+                count += 1
         else:
-            return []
+            for user_id, recommendations in results:
+                f.write(json.dumps({
+                    'user_id': user_id,
+                    'item_type': item_type,
+                    'items': [{'id': item_id, 'similarity': round(similarity, 6)}
+                              for item_id, similarity in recommendations]
+                }) + '\n')
+                count += 1
+    
+    return count
+
+
+def build_versioned_indices(index_dir: str, item_types: List[str] = None, chunk_size: int = 1000,
+                            keep_versions: int = 3, **engine_kwargs) -> str:
+    """从数据库构建索引并发布为索引目录的新版本
+    
+    Args:
+        index_dir: 索引根目录
+        item_types: 需要构建的项目类型，默认为所有类型，未构建的类型沿用当前版本
+        chunk_size: 每次从数据库读取的行数
+        keep_versions: 保留的版本数量
+        **engine_kwargs: 传给VectorSearchEngine的参数
+        
+    Returns:
+        新版本的目录
+    """
+    engine = VectorSearchEngine(**engine_kwargs)
+    models = {'place': Place, 'food': Food}
+    
+    for item_type in item_types or VectorSearchRegistry.ITEM_TYPES:
+        start_time = time.perf_counter()
+        count = engine.build_index_from_chunks(item_type, _iter_item_chunks(models[item_type], chunk_size, expunge=True))
+        print(f"Built {item_type} index: {count} items in {time.perf_counter() - start_time:.1f}s")
+    
+    return VectorIndexStore(index_dir, keep_versions).publish_engine(engine)
+
+
+def _create_cli_app(config):
+    """创建只用于访问数据库的Flask应用"""
+    from flask import Flask
+    from backend.models import db
+    
+    # 与后端应用使用相同的根目录，SQLite等相对路径的数据库指向同一个文件
+    backend_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'backend'))
+    app = Flask(__name__, root_path=backend_dir, instance_path=os.path.join(backend_dir, 'instance'))
+    app.config.from_object(config)
+    db.init_app(app)
+    return app
+
+
+def main():
+    """命令行入口：离线构建索引、批量生成推荐、查看和切换索引版本"""
+    parser = argparse.ArgumentParser(description='向量索引构建工具')
+    parser.add_argument('--env', choices=['dev', 'prod'], default='dev',
+                        help='环境配置: dev (开发) 或 prod (生产)')
+    parser.add_argument('--index-dir', help='索引根目录，默认使用配置中的VECTOR_INDEX_DIR')
+    
+    subparsers = parser.add_subparsers(dest='command', help='命令')
+    
+    # build命令
+    build_parser = subparsers.add_parser('build', help='从数据库构建索引并发布为新版本')
+    build_parser.add_argument('--types', nargs='+', choices=VectorSearchRegistry.ITEM_TYPES,
+                              help='需要构建的索引类型，默认全部构建')
+    build_parser.add_argument('--chunk-size', type=int, default=1000, help='每次从数据库读取的行数')
+    build_parser.add_argument('--keep', type=int, default=3, help='保留的版本数量')
+    
+    # recommend命令
+    recommend_parser = subparsers.add_parser('recommend', help='为所有或指定用户批量生成推荐并写入文件')
+    recommend_parser.add_argument('output', help='输出文件，.csv为CSV格式，否则为JSON Lines')
+    recommend_parser.add_argument('--type', dest='item_type', choices=VectorSearchRegistry.ITEM_TYPES,
+                                  default='place', help='推荐项目类型')
+    recommend_parser.add_argument('--users', nargs='+', type=int, help='用户ID，默认为所有用户')
+    recommend_parser.add_argument('--top-n', type=int, default=10, help='每个用户的推荐数量')
+    recommend_parser.add_argument('--chunk-size', type=int, default=1000, help='每块的用户数量')
+    recommend_parser.add_argument('--jobs', type=int, help='并行线程数，默认为CPU核数')
+    
+    # versions命令
+    subparsers.add_parser('versions', help='列出所有索引版本')
+    
+    # activate命令
+    activate_parser = subparsers.add_parser('activate', help='切换到已有的索引版本（回滚）')
+    activate_parser.add_argument('version', help='版本号')
+    
+    # compare-encoders命令
+    compare_parser = subparsers.add_parser('compare-encoders', help='用数据库中的文本比较文本编码器的吞吐量和召回率')
+    compare_parser.add_argument('--encoders', nargs='+', default=['bert', 'sentence_transformers',
+                                                                  'sentence_transformers:int8', 'hashing'],
+                                help='编码器，格式为后端[:int8][@模型]，第一个作为召回率基准，'
+                                     '如 bert sentence_transformers:int8@./models/minilm onnx@./models/minilm-onnx/model.onnx')
+    compare_parser.add_argument('--type', dest='item_type', choices=VectorSearchRegistry.ITEM_TYPES,
+                                default='place', help='使用的项目文本')
+    compare_parser.add_argument('--limit', type=int, default=2000, help='最多使用的文本数量')
+    compare_parser.add_argument('--top-n', type=int, default=10, help='计算召回率的近邻数量')
+    compare_parser.add_argument('--queries', type=int, default=200, help='查询文本数量')
+    
+    # export-onnx命令
+    export_parser = subparsers.add_parser('export-onnx', help='把transformers或sentence-transformers模型导出为ONNX')
+    export_parser.add_argument('model', help='模型名称或本地目录')
+    export_parser.add_argument('output_dir', help='导出目录')
+    export_parser.add_argument('--pooling', choices=['mean', 'cls'], default='mean', help='句向量池化方式')
+    export_parser.add_argument('--quantize', action='store_true', help='另外导出int8动态量化的模型')
+    
+    args = parser.parse_args()
+    
+    from backend.config import DevelopmentConfig, ProductionConfig
+    config = DevelopmentConfig if args.env == 'dev' else ProductionConfig
+    index_dir = args.index_dir or config.VECTOR_INDEX_DIR
+    
+    if not index_dir:
+        print("未配置索引目录")
+        return
+    
+    store = VectorIndexStore(index_dir)
+    
+    if args.command == 'build':
+        with _create_cli_app(config).app_context():
+            version_dir = build_versioned_indices(
+                index_dir, args.types, chunk_size=args.chunk_size, keep_versions=args.keep,
+                batch_size=config.VECTOR_EMBED_BATCH_SIZE, num_threads=config.VECTOR_EMBED_THREADS,
+                faiss_index_type=config.VECTOR_FAISS_INDEX_TYPE, faiss_params=config.VECTOR_FAISS_PARAMS,
+                use_bert=False, use_faiss=FAISS_AVAILABLE, shard_fields=config.VECTOR_SHARD_FIELDS,
+                encoder=_create_config_encoder(config, config.VECTOR_EMBED_BATCH_SIZE, config.VECTOR_EMBED_THREADS),
+                embedding_cache=get_embedding_cache(config.EMBEDDING_CACHE_PATH, config.EMBEDDING_CACHE_MAX_ENTRIES)
+            )
+        print(f"已发布索引版本: {os.path.basename(version_dir)}")
+    
+    elif args.command == 'recommend':
+        app = _create_cli_app(config)
+        app.config['VECTOR_INDEX_DIR'] = index_dir
+        # 离线任务不需要检查新版本
+        app.config['VECTOR_INDEX_RELOAD_INTERVAL'] = None
+        
+        with app.app_context():
+            init_vector_search(app)
+            start_time = time.perf_counter()
+            count = write_batch_recommendations(args.output, args.users, args.item_type, args.top_n,
+                                                args.chunk_size, args.jobs)
+        print(f"已为 {count} 个用户生成推荐，用时 {time.perf_counter() - start_time:.1f}s: {args.output}")
+    
+    elif args.command == 'versions':
+        active = store.active_version()
+        for version in store.list_versions():
+            status = "[当前]" if version == active else ""
+            print(f"  {version} {status}")
+    
+    elif args.command == 'activate':
+        store.activate(args.version)
+        print(f"已切换到索引版本: {args.version}")
+    
+    elif args.command == 'compare-encoders':
+        encoders = {}
+        for spec in args.encoders:
+            backend, _, model_name = spec.partition('@')
+            backend, _, option = backend.partition(':')
+            encoder = HashingEncoder() if backend == 'hashing' else create_encoder(
+                backend, model_name=None if backend == 'onnx' else model_name or None,
+                onnx_path=(model_name or config.VECTOR_EMBED_ONNX_PATH) if backend == 'onnx' else None,
+                quantize=option == 'int8', batch_size=config.VECTOR_EMBED_BATCH_SIZE,
+                num_threads=config.VECTOR_EMBED_THREADS)
+            if encoder is not None:
+                encoders[spec] = encoder
+        
+        with _create_cli_app(config).app_context():
+            engine = VectorSearchEngine(use_bert=False, use_faiss=False)
+            to_text = engine._place_text if args.item_type == 'place' else engine._food_text
+            model = Place if args.item_type == 'place' else Food
+            texts = []
+            for items in _iter_item_chunks(model, min(args.limit, 1000), expunge=True):
+                texts.extend(to_text(item) for item in items)
+                if len(texts) >= args.limit:
+                    break
+        
+        report = benchmark_text_encoders(encoders, texts[:args.limit], top_n=args.top_n, n_queries=args.queries)
+        print(f"{len(texts[:args.limit])} 条文本，召回率以 {next(iter(encoders), '-')} 为基准")
+        for entry in report:
+            print(f"  {entry['name']:<40} dim={entry['dim']:<5} {entry['texts_per_second']:>9.1f} 条/秒  "
+                  f"recall@{args.top_n}={entry['recall']:.3f}")
+    
+    elif args.command == 'export-onnx':
+        model_path = export_onnx(args.model, args.output_dir, pooling=args.pooling, quantize=args.quantize)
+        print(f"已导出ONNX模型: {model_path}")
     
     else:
-        return []
\ No newline at end of file
+        parser.print_help()
+
+
+if __name__ == '__main__':
+    main()
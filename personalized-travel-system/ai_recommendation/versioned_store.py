@@ -0,0 +1,148 @@
+from typing import List, Optional
+import os
+import shutil
+import threading
+import time
+
+
+class VersionedStore:
+    """版本化的文件目录
+    
+    每次完整构建的文件写入root_dir/versions/<版本号>/，写完后原子地替换符号链接root_dir/current，
+    读取方要么看到旧版本、要么看到完整的新版本，不会读到写了一半的文件。
+    旧版本文件在被替换后仍可被已经内存映射它们的进程继续使用。
+    没有current链接时兼容直接保存在root_dir中的旧布局。
+    子类通过ITEM_FILE_SUFFIX指定每类文件的名称，如place.index、food.cf
+    """
+    
+    CURRENT = 'current'
+    VERSIONS = 'versions'
+    # 每类文件名为<类型>.<后缀>，同名前缀的文件和目录属于同一类
+    ITEM_FILE_SUFFIX = None
+    
+    def __init__(self, root_dir: str, keep_versions: int = 3):
+        """初始化目录
+        
+        Args:
+            root_dir: 根目录
+            keep_versions: 发布新版本后保留的版本数量
+        """
+        self.root_dir = root_dir
+        self.keep_versions = max(1, keep_versions)
+    
+    @property
+    def versions_dir(self) -> str:
+        """保存所有版本的目录"""
+        return os.path.join(self.root_dir, self.VERSIONS)
+    
+    def active_dir(self) -> str:
+        """当前版本的目录，没有发布过版本时为根目录"""
+        current = os.path.join(self.root_dir, self.CURRENT)
+        if os.path.islink(current) or os.path.isdir(current):
+            return os.path.realpath(current)
+        return self.root_dir
+    
+    def active_version(self) -> Optional[str]:
+        """当前版本号，没有发布过版本时返回None"""
+        active = self.active_dir()
+        if os.path.dirname(active) == os.path.realpath(self.versions_dir):
+            return os.path.basename(active)
+        return None
+    
+    def list_versions(self) -> List[str]:
+        """按时间顺序列出所有版本号"""
+        if not os.path.isdir(self.versions_dir):
+            return []
+        return sorted(name for name in os.listdir(self.versions_dir)
+                      if os.path.isdir(os.path.join(self.versions_dir, name)))
+    
+    def new_version_dir(self) -> str:
+        """创建一个新的空版本目录"""
+        os.makedirs(self.versions_dir, exist_ok=True)
+        version = time.strftime('%Y%m%d-%H%M%S') + f"-{os.getpid()}"
+        
+        version_dir = os.path.join(self.versions_dir, version)
+        suffix = 1
+        while os.path.exists(version_dir):
+            version_dir = os.path.join(self.versions_dir, f"{version}-{suffix}")
+            suffix += 1
+        
+        os.makedirs(version_dir)
+        return version_dir
+    
+    def publish(self, version_dir: str):
+        """原子地把current指向指定版本
+        
+        先在同一目录下创建临时符号链接，再用rename替换current，rename在POSIX上是原子操作
+        
+        Args:
+            version_dir: 版本目录
+        """
+        current = os.path.join(self.root_dir, self.CURRENT)
+        tmp_link = os.path.join(self.root_dir, f".{self.CURRENT}-{os.getpid()}-{threading.get_ident()}")
+        
+        if os.path.lexists(tmp_link):
+            os.remove(tmp_link)
+        os.symlink(os.path.relpath(version_dir, self.root_dir), tmp_link)
+        os.replace(tmp_link, current)
+    
+    def activate(self, version: str):
+        """把current切换到已有的版本，用于回滚
+        
+        Args:
+            version: 版本号
+        """
+        version_dir = os.path.join(self.versions_dir, version)
+        if not os.path.isdir(version_dir):
+            raise ValueError(f"Unknown version: {version}")
+        self.publish(version_dir)
+    
+    def prune(self):
+        """删除多余的旧版本，当前版本总是保留"""
+        active = self.active_version()
+        versions = [version for version in self.list_versions() if version != active]
+        
+        for version in versions[:max(0, len(versions) - (self.keep_versions - 1))]:
+            shutil.rmtree(os.path.join(self.versions_dir, version), ignore_errors=True)
+    
+    def item_path(self, version_dir: str, item_type: str) -> str:
+        """某类文件在版本目录中的路径前缀
+        
+        Args:
+            version_dir: 版本目录
+            item_type: 项目类型，'place'或'food'
+            
+        Returns:
+            文件路径前缀
+        """
+        return os.path.join(version_dir, f"{item_type}.{self.ITEM_FILE_SUFFIX}")
+    
+    def link_item_files(self, item_type: str, src_dir: str, dst_dir: str):
+        """把某类文件从一个版本带到另一个版本，优先使用硬链接避免复制
+        
+        Args:
+            item_type: 项目类型，'place'或'food'
+            src_dir: 源版本目录
+            dst_dir: 目标版本目录
+        """
+        if not os.path.isdir(src_dir):
+            return
+        
+        prefix = f"{item_type}.{self.ITEM_FILE_SUFFIX}"
+        for name in os.listdir(src_dir):
+            if name != prefix and not name.startswith(prefix + '.'):
+                continue
+            
+            src, dst = os.path.join(src_dir, name), os.path.join(dst_dir, name)
+            try:
+                if os.path.isdir(src):
+                    shutil.copytree(src, dst, copy_function=os.link)
+                else:
+                    os.link(src, dst)
+            except OSError:
+                # 跨文件系统等情况不能硬链接时复制
+                if os.path.isdir(src):
+                    shutil.rmtree(dst, ignore_errors=True)
+                    shutil.copytree(src, dst)
+                else:
+                    shutil.copy2(src, dst)
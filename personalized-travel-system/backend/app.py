@@ -1,14 +1,33 @@
 import os
-from flask import Flask, jsonify
+import sys
+from flask import Flask, Response, jsonify, request
 from flask_cors import CORS
 from flask_jwt_extended import JWTManager
 
 # 导入数据库实例
 from models import db
+from models.interaction import interaction_log
+
+# 导入推荐结果缓存
+from utils.cache import recommendation_cache
 
 # 导入蓝图注册函数
 from routes import register_blueprints
 
+# 添加项目根目录到系统路径，以便导入ai_recommendation模块
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+# ai_recommendation模块通过backend.models导入模型，这里让它指向已加载的models包，
+# 避免同一张表被第二个SQLAlchemy实例重复定义；utils包同理，保证推荐结果缓存只有一个实例
+for _name, _module in list(sys.modules.items()):
+    if _name.split('.')[0] in ('models', 'utils'):
+        sys.modules.setdefault(f'backend.{_name}', _module)
+
+from ai_recommendation.vector_search import init_vector_search
+from ai_recommendation.collaborative_filter import init_collaborative_filter
+from ai_recommendation.hybrid import init_hybrid_recommender
+from ai_recommendation.search_metrics import metrics
+
 def create_app(config_name=None):
     """创建Flask应用实例"""
     app = Flask(__name__)
@@ -26,12 +45,28 @@ def create_app(config_name=None):
     # 初始化数据库
     db.init_app(app)
     
+    # 交互记录批量写入器
+    interaction_log.init_app(app)
+    
+    # 推荐结果缓存，用户修改偏好或评分后失效
+    recommendation_cache.init_app(app)
+    metrics.register_collector(recommendation_cache.stats)
+    
     # 初始化JWT认证
     jwt = JWTManager(app)
     
     # 注册所有蓝图
     register_blueprints(app)
     
+    # 初始化进程级向量搜索引擎，启动时加载已保存的索引
+    init_vector_search(app)
+    
+    # 初始化进程级协同过滤模型，加载已训练的模型并启动后台增量更新
+    init_collaborative_filter(app)
+    
+    # 初始化混合推荐器，供/places/ai和/food/recommend使用
+    init_hybrid_recommender(app)
+    
     # 添加健康检查端点
     @app.route('/health')
     def health_check():
@@ -40,6 +75,14 @@ def create_app(config_name=None):
             'message': '个性化旅游推荐系统API服务正常运行'
         })
     
+    # 指标端点：默认为Prometheus文本格式，?format=json返回JSON
+    # 包括各后端的查询耗时直方图、索引规模和内存占用、构建耗时、向量缓存命中率和暴力搜索占比
+    @app.route('/metrics')
+    def metrics_endpoint():
+        if request.args.get('format') == 'json':
+            return jsonify(metrics.snapshot())
+        return Response(metrics.render_prometheus(), mimetype='text/plain; version=0.0.4')
+    
     return app
 
 # 创建应用实例
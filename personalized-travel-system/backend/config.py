@@ -18,6 +18,102 @@ class Config:
     UPLOAD_FOLDER = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'static/uploads')
     MAX_CONTENT_LENGTH = 16 * 1024 * 1024  # 最大上传文件大小：16MB
     ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif', 'webp'}
+    
+    # 向量搜索配置
+    # 索引文件目录，应用启动时从这里加载save_indices保存的索引
+    VECTOR_INDEX_DIR = os.environ.get('VECTOR_INDEX_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data/vector_indices'))
+    # 启动时若没有索引文件，是否在启动过程中从数据库构建（否则在后台线程中构建，构建完成前推荐不使用向量索引）
+    VECTOR_BUILD_ON_STARTUP = os.environ.get('VECTOR_BUILD_ON_STARTUP', 'False').lower() == 'true'
+    # 批量计算文本向量时每批的文本数量
+    VECTOR_EMBED_BATCH_SIZE = int(os.environ.get('VECTOR_EMBED_BATCH_SIZE', 32))
+    # 模型推理使用的CPU线程数，不设置时使用torch/onnxruntime的默认值
+    VECTOR_EMBED_THREADS = int(os.environ['VECTOR_EMBED_THREADS']) if os.environ.get('VECTOR_EMBED_THREADS') else None
+    # 文本编码器：bert、sentence_transformers、onnx或hashing（确定性哈希，不需要模型）；更换后需要重建索引
+    VECTOR_EMBED_BACKEND = os.environ.get('VECTOR_EMBED_BACKEND', 'bert')
+    # 编码器使用的模型名称或本地目录，为空时使用后端的默认模型
+    VECTOR_EMBED_MODEL = os.environ.get('VECTOR_EMBED_MODEL') or None
+    # 是否对bert和sentence_transformers模型做int8动态量化
+    VECTOR_EMBED_QUANTIZE = os.environ.get('VECTOR_EMBED_QUANTIZE', 'False').lower() == 'true'
+    # onnx编码器的模型文件，由 python -m ai_recommendation.vector_search export-onnx 导出
+    VECTOR_EMBED_ONNX_PATH = os.environ.get('VECTOR_EMBED_ONNX_PATH') or None
+    # FAISS索引类型：flat（精确）、ivf_flat、ivf_pq、hnsw（近似）
+    VECTOR_FAISS_INDEX_TYPE = os.environ.get('VECTOR_FAISS_INDEX_TYPE', 'flat')
+    # FAISS搜索参数，nprobe用于IVF索引，ef_search用于HNSW索引
+    VECTOR_FAISS_PARAMS = {
+        'nprobe': int(os.environ.get('VECTOR_FAISS_NPROBE', 8)),
+        'ef_search': int(os.environ.get('VECTOR_FAISS_EF_SEARCH', 64))
+    }
+    # 向量索引的分片字段，例如VECTOR_PLACE_SHARD_FIELDS=city,place_type；为空时不分片
+    VECTOR_SHARD_FIELDS = {
+        'place': [field for field in os.environ.get('VECTOR_PLACE_SHARD_FIELDS', '').split(',') if field],
+        'food': [field for field in os.environ.get('VECTOR_FOOD_SHARD_FIELDS', '').split(',') if field]
+    }
+    # 工作进程检查索引目录是否发布了新版本的间隔（秒）
+    VECTOR_INDEX_RELOAD_INTERVAL = float(os.environ.get('VECTOR_INDEX_RELOAD_INTERVAL', 30))
+    # 索引目录中保留的版本数量
+    VECTOR_INDEX_KEEP_VERSIONS = int(os.environ.get('VECTOR_INDEX_KEEP_VERSIONS', 3))
+    # 文本向量缓存文件，按模型和文本内容缓存BERT等模型计算的向量
+    EMBEDDING_CACHE_PATH = os.environ.get('EMBEDDING_CACHE_PATH', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data/embedding_cache.sqlite3'))
+    # 文本向量缓存最多保存的条目数，超出后淘汰最久未使用的条目
+    EMBEDDING_CACHE_MAX_ENTRIES = int(os.environ.get('EMBEDDING_CACHE_MAX_ENTRIES', 200000))
+    
+    # 交互记录配置
+    # 评分、点赞和浏览记录攒够多少条后批量写入interactions表
+    INTERACTION_LOG_BATCH_SIZE = int(os.environ.get('INTERACTION_LOG_BATCH_SIZE', 100))
+    # 缓冲区中的记录最多等待的秒数
+    INTERACTION_LOG_FLUSH_INTERVAL = float(os.environ.get('INTERACTION_LOG_FLUSH_INTERVAL', 5))
+    
+    # 推荐结果缓存配置
+    # 推荐接口的响应按(用户, 物品类型, 城市, 请求参数)缓存的秒数，为0时不缓存
+    RECOMMEND_CACHE_TTL = float(os.environ.get('RECOMMEND_CACHE_TTL', 60))
+    # 进程内缓存最多保存的条目数，超出后淘汰最久未使用的条目
+    RECOMMEND_CACHE_MAX_ENTRIES = int(os.environ.get('RECOMMEND_CACHE_MAX_ENTRIES', 10000))
+    # Redis连接地址，如redis://localhost:6379/0；设置后多个工作进程共享缓存，为空时使用进程内缓存
+    RECOMMEND_CACHE_REDIS_URL = os.environ.get('RECOMMEND_CACHE_REDIS_URL') or None
+    
+    # 协同过滤配置
+    # 训练好的模型目录，由 python -m ai_recommendation.collaborative_filter train 发布新版本
+    CF_MODEL_DIR = os.environ.get('CF_MODEL_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data/cf_models'))
+    # 每个物品保留的相似物品数量
+    CF_ITEM_NEIGHBORS = int(os.environ.get('CF_ITEM_NEIGHBORS', 50))
+    # 工作进程检查模型目录是否发布了新版本的间隔（秒）
+    CF_RELOAD_INTERVAL = float(os.environ.get('CF_RELOAD_INTERVAL', 30))
+    # 把新的交互记录增量加入已加载模型的间隔（秒），为0时不做增量更新
+    CF_REFRESH_INTERVAL = float(os.environ.get('CF_REFRESH_INTERVAL', 60))
+    # 在进程内完整重新训练并发布新版本的间隔（秒），为0时只通过命令行训练
+    CF_RETRAIN_INTERVAL = float(os.environ.get('CF_RETRAIN_INTERVAL', 0))
+    # 模型目录中保留的版本数量
+    CF_KEEP_VERSIONS = int(os.environ.get('CF_KEEP_VERSIONS', 3))
+    # 矩阵分解方法：als（隐式反馈的加权ALS，适合浏览和点赞）或svd（中心化评分的奇异值分解）
+    CF_FACTORIZATION = os.environ.get('CF_FACTORIZATION', 'als')
+    # ALS的潜在因子数量、正则系数、置信度系数（置信度为1+alpha×评分）和最多训练的轮数
+    CF_ALS_FACTORS = int(os.environ.get('CF_ALS_FACTORS', 32))
+    CF_ALS_REGULARIZATION = float(os.environ.get('CF_ALS_REGULARIZATION', 0.05))
+    CF_ALS_ALPHA = float(os.environ.get('CF_ALS_ALPHA', 2.0))
+    CF_ALS_ITERATIONS = int(os.environ.get('CF_ALS_ITERATIONS', 15))
+    # 低于该评分的显式评分（如1、2星）作为负反馈，浏览(3)和点赞(4)都是正反馈
+    CF_ALS_POSITIVE_RATING = float(os.environ.get('CF_ALS_POSITIVE_RATING', 3.0))
+    # ALS并行求解的线程数，为0时使用CPU核数
+    CF_ALS_THREADS = int(os.environ.get('CF_ALS_THREADS', 0))
+    # 留作验证集的交互比例，验证集上的Recall@10连续两轮没有提升时提前停止
+    CF_ALS_VALIDATION_FRACTION = float(os.environ.get('CF_ALS_VALIDATION_FRACTION', 0.1))
+    
+    # 混合推荐配置
+    # 每个推荐请求的延迟预算（毫秒），召回阶段超出预算时跳过剩下的候选来源
+    HYBRID_LATENCY_BUDGET_MS = float(os.environ.get('HYBRID_LATENCY_BUDGET_MS', 150))
+    # 参与重新排序的最多候选数，以及每个来源（向量索引、协同过滤、附近、热门）最多召回的数量
+    HYBRID_MAX_CANDIDATES = int(os.environ.get('HYBRID_MAX_CANDIDATES', 300))
+    HYBRID_CANDIDATES_PER_SOURCE = int(os.environ.get('HYBRID_CANDIDATES_PER_SOURCE', 100))
+    # 每个用户的候选集缓存的有效期（秒）和最多缓存的条目数
+    HYBRID_CANDIDATE_CACHE_TTL = float(os.environ.get('HYBRID_CANDIDATE_CACHE_TTL', 300))
+    HYBRID_CANDIDATE_CACHE_SIZE = int(os.environ.get('HYBRID_CANDIDATE_CACHE_SIZE', 10000))
+    # 重新排序时各打分项的权重：内容相似度、协同过滤预测评分、距离和物品评分
+    HYBRID_WEIGHTS = {
+        'content': float(os.environ.get('HYBRID_WEIGHT_CONTENT', 0.35)),
+        'cf': float(os.environ.get('HYBRID_WEIGHT_CF', 0.4)),
+        'distance': float(os.environ.get('HYBRID_WEIGHT_DISTANCE', 0.15)),
+        'quality': float(os.environ.get('HYBRID_WEIGHT_QUALITY', 0.1))
+    }
 
 class DevelopmentConfig(Config):
     """开发环境配置"""
@@ -36,6 +132,15 @@ class TestingConfig(Config):
     SQLALCHEMY_DATABASE_URI = 'sqlite:///:memory:'
     # 测试环境下禁用CSRF保护
     WTF_CSRF_ENABLED = False
+    # 测试环境不读写索引文件和向量缓存
+    VECTOR_INDEX_DIR = None
+    EMBEDDING_CACHE_PATH = None
+    # 测试环境中交互记录立即写入
+    INTERACTION_LOG_BATCH_SIZE = 1
+    # 测试环境不读写协同过滤模型文件
+    CF_MODEL_DIR = None
+    # 测试环境不缓存推荐结果
+    RECOMMEND_CACHE_TTL = 0
 
 class ProductionConfig(Config):
     """生产环境配置"""
@@ -7,6 +7,15 @@ class Food(db.Model):
     包含美食基本信息和餐厅信息
     """
     __tablename__ = 'foods'
+    
+    # to_dict输出的字段，批量查询推荐结果时只加载这些列
+    DICT_FIELDS = (
+        'id', 'name', 'description', 'price_level', 'cuisine_type',
+        'taste_tags', 'signature_dishes', 'restaurant_name', 'latitude',
+        'longitude', 'address', 'city', 'province', 'country',
+        'opening_hours', 'contact_phone', 'website', 'rating',
+        'review_count', 'average_cost', 'suitable_occasions', 'images'
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(100), nullable=False, index=True)
@@ -62,6 +71,10 @@ class Food(db.Model):
             if hasattr(self, key):
                 setattr(self, key, value)
     
+    def to_dict(self):
+        """将美食信息转换为字典，用于API响应"""
+        return {field: getattr(self, field) for field in self.DICT_FIELDS}
+    
     def __repr__(self):
         return f'<Food {self.name}> at ({self.latitude}, {self.longitude})'
     
@@ -0,0 +1,163 @@
+from datetime import datetime
+import atexit
+import threading
+import time
+from flask import has_app_context
+from . import db
+
+class Interaction(db.Model):
+    """用户交互记录模型类
+    只追加不修改的用户行为日志：评分、点赞、取消点赞和浏览，
+    协同过滤模型从这里读取训练数据，并按自增ID增量读取新记录
+    """
+    __tablename__ = 'interactions'
+    __table_args__ = (
+        # 按物品类型增量读取新记录
+        db.Index('idx_interactions_type_id', 'item_type', 'id'),
+        db.Index('idx_interactions_user', 'user_id', 'item_type'),
+    )
+    
+    # 物品类型
+    ITEM_TYPES = ('place', 'food')
+    # 行为类型，rate的value为评分（1-5）
+    ACTIONS = ('rate', 'like', 'unlike', 'view')
+    
+    # SQLite只有INTEGER主键才会自增
+    id = db.Column(db.BigInteger().with_variant(db.Integer, 'sqlite'), primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    item_type = db.Column(db.String(20), nullable=False)
+    item_id = db.Column(db.Integer, nullable=False)
+    action = db.Column(db.String(20), nullable=False)
+    # 评分等行为的数值，浏览和点赞为空
+    value = db.Column(db.Float)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)
+    
+    def to_dict(self):
+        """将交互记录转换为字典"""
+        return {
+            'id': self.id,
+            'user_id': self.user_id,
+            'item_type': self.item_type,
+            'item_id': self.item_id,
+            'action': self.action,
+            'value': self.value,
+            'created_at': self.created_at.isoformat() if self.created_at else None
+        }
+    
+    def __repr__(self):
+        return f'<Interaction user={self.user_id} {self.action} {self.item_type}:{self.item_id}>'
+
+
+class InteractionLog:
+    """交互记录的批量写入器
+    
+    请求中调用record只把记录放入内存缓冲区，缓冲区达到batch_size条或距上次写入超过flush_interval秒时，
+    用一条多行INSERT写入interactions表。后台线程按间隔写入空闲时留在缓冲区的记录，进程退出时写入剩余记录。
+    写入失败的记录放回缓冲区下次重试，缓冲区超过MAX_BUFFER_SIZE条时丢弃最早的记录
+    """
+    
+    # 缓冲区最多保存的记录数
+    MAX_BUFFER_SIZE = 100000
+    
+    def __init__(self, batch_size: int = 100, flush_interval: float = 5.0):
+        """初始化写入器
+        
+        Args:
+            batch_size: 每次写入的记录数，为1时每条记录立即写入
+            flush_interval: 缓冲区中的记录最多等待的秒数
+        """
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.app = None
+        self._buffer = []
+        self._lock = threading.Lock()
+        self._last_flush = time.time()
+        self._flusher = None
+    
+    def init_app(self, app):
+        """绑定应用，读取配置并启动后台写入线程
+        
+        Args:
+            app: Flask应用实例
+        """
+        self.app = app
+        self.batch_size = max(1, app.config.get('INTERACTION_LOG_BATCH_SIZE', self.batch_size))
+        self.flush_interval = app.config.get('INTERACTION_LOG_FLUSH_INTERVAL', self.flush_interval)
+        app.extensions['interaction_log'] = self
+        
+        if self._flusher is None:
+            atexit.register(self.flush)
+            if self.batch_size > 1 and self.flush_interval > 0:
+                self._flusher = threading.Thread(target=self._flush_periodically, name='interaction-log-flusher', daemon=True)
+                self._flusher.start()
+    
+    def record(self, user_id: int, item_type: str, item_id: int, action: str, value: float = None):
+        """记录一次用户交互
+        
+        Args:
+            user_id: 用户ID
+            item_type: 物品类型，'place'或'food'
+            item_id: 物品ID
+            action: 行为类型，'rate'、'like'、'unlike'或'view'
+            value: 行为的数值，如评分
+        """
+        row = {
+            'user_id': int(user_id),
+            'item_type': item_type,
+            'item_id': int(item_id),
+            'action': action,
+            'value': value,
+            'created_at': datetime.utcnow()
+        }
+        
+        with self._lock:
+            self._buffer.append(row)
+            due = len(self._buffer) >= self.batch_size or time.time() - self._last_flush >= self.flush_interval
+        
+        if due:
+            self.flush()
+    
+    def flush(self) -> int:
+        """把缓冲区中的记录写入数据库
+        
+        Returns:
+            写入的记录数
+        """
+        with self._lock:
+            rows, self._buffer = self._buffer, []
+            self._last_flush = time.time()
+        
+        if not rows:
+            return 0
+        
+        try:
+            if has_app_context():
+                self._insert(rows)
+            elif self.app is not None:
+                with self.app.app_context():
+                    self._insert(rows)
+            else:
+                raise RuntimeError('InteractionLog is not bound to an app')
+        except Exception as e:
+            print(f"Error writing interactions: {e}")
+            with self._lock:
+                self._buffer[:0] = rows
+                del self._buffer[:-self.MAX_BUFFER_SIZE]
+            return 0
+        
+        return len(rows)
+    
+    def _insert(self, rows):
+        # 使用独立连接和事务，不影响请求中的session
+        with db.engine.begin() as connection:
+            connection.execute(Interaction.__table__.insert(), rows)
+    
+    def _flush_periodically(self):
+        while True:
+            time.sleep(self.flush_interval)
+            if self._buffer and time.time() - self._last_flush >= self.flush_interval:
+                self.flush()
+
+
+# 进程级写入器，在app.py中通过init_app绑定应用
+interaction_log = InteractionLog()
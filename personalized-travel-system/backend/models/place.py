@@ -7,7 +7,16 @@ class Place(db.Model):
     包含景点基本信息和特征字段
     """
     __tablename__ = 'places'
-
+    
+    # to_dict输出的字段，批量查询推荐结果时只加载这些列
+    DICT_FIELDS = (
+        'id', 'name', 'description', 'latitude', 'longitude', 'address',
+        'city', 'province', 'country', 'opening_hours', 'ticket_price',
+        'contact_phone', 'website', 'place_type', 'tags', 'rating',
+        'review_count', 'popularity', 'suitable_seasons',
+        'recommended_visit_time', 'images'
+    )
+    
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(100), nullable=False, index=True)
     description = db.Column(db.Text)
@@ -59,6 +68,10 @@ class Place(db.Model):
             if hasattr(self, key):
                 setattr(self, key, value)
     
+    def to_dict(self):
+        """将景点信息转换为字典，用于API响应"""
+        return {field: getattr(self, field) for field in self.DICT_FIELDS}
+    
     def __repr__(self):
         return f'<Place {self.name}> at ({self.latitude}, {self.longitude})'
     
@@ -95,6 +108,37 @@ class Place(db.Model):
         
         return nearby_places
     
+    @staticmethod
+    def find_by_location(location_name=None, city=None, latitude=None, longitude=None, radius=0.3):
+        """查找位置标记（如日记的位置）对应的景点
+        
+        先按名称和城市精确匹配，找不到时取坐标radius公里内最近的景点
+        
+        Args:
+            location_name: 位置名称
+            city: 城市名称
+            latitude: 纬度
+            longitude: 经度
+            radius: 按坐标匹配的最大距离(公里)
+            
+        Returns:
+            景点，找不到时返回None
+        """
+        if location_name:
+            query = Place.query.filter(Place.name == location_name)
+            if city:
+                query = query.filter(Place.city == city)
+            place = query.first()
+            if place:
+                return place
+        
+        if latitude is not None and longitude is not None:
+            nearby_places = Place.get_nearby_places(latitude, longitude, radius=radius, limit=1)
+            if nearby_places:
+                return nearby_places[0]
+        
+        return None
+    
     @staticmethod
     def search_by_type_and_tags(place_type=None, tags=None, city=None, limit=20):
         """根据类型和标签搜索景点
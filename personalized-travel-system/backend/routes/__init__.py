@@ -9,6 +9,7 @@ from .search import search_bp
 from .map import map_bp
 from .diary import diary_bp
 from .food import food_bp
+from .place import place_bp
 from .indoor import indoor_bp
 from .aigc import aigc_bp
 
@@ -37,6 +38,9 @@ def register_blueprints(app: Flask):
     # 注册美食蓝图
     app.register_blueprint(food_bp, url_prefix='/api/food')
     
+    # 注册景点蓝图
+    app.register_blueprint(place_bp, url_prefix='/api/places')
+    
     # 注册室内导航蓝图
     app.register_blueprint(indoor_bp, url_prefix='/api/indoor')
     
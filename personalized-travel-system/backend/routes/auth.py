@@ -9,6 +9,7 @@ import re
 # 导入数据库和用户模型
 from models import db
 from models.user import User
+from utils.cache import recommendation_cache
 
 # 创建认证蓝图
 auth_bp = Blueprint('auth', __name__)
@@ -201,10 +202,14 @@ def update_user_info():
             user.avatar = data['avatar']
         if 'bio' in data:
             user.bio = data['bio']
-        if 'travel_preferences' in data:
+        # 偏好改变时推荐结果需要重新计算
+        preferences_changed = False
+        if 'travel_preferences' in data and data['travel_preferences'] != user.travel_preferences:
             user.travel_preferences = data['travel_preferences']
-        if 'food_preferences' in data:
+            preferences_changed = True
+        if 'food_preferences' in data and data['food_preferences'] != user.food_preferences:
             user.food_preferences = data['food_preferences']
+            preferences_changed = True
         if 'budget_level' in data:
             user.budget_level = data['budget_level']
         if 'transportation_preference' in data:
@@ -215,6 +220,9 @@ def update_user_info():
         # 保存到数据库
         db.session.commit()
         
+        if preferences_changed:
+            recommendation_cache.invalidate(user_id)
+        
         return jsonify({
             'status': 'success',
             'message': '用户信息更新成功',
@@ -389,6 +397,9 @@ def delete_account():
         db.session.delete(user)
         db.session.commit()
         
+        # 删除已注销用户缓存的推荐结果
+        recommendation_cache.invalidate(user_id)
+        
         return jsonify({
             'status': 'success',
             'message': '账户已成功注销'
@@ -9,6 +9,9 @@ from datetime import datetime
 from models import db
 from models.diary import Diary
 from models.user import User
+from models.place import Place
+from models.interaction import interaction_log
+from utils.cache import recommendation_cache
 
 # 创建日记蓝图
 diary_bp = Blueprint('diary', __name__)
@@ -16,6 +19,29 @@ diary_bp = Blueprint('diary', __name__)
 # 允许的图片扩展名
 ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif'}
 
+def record_place_interaction(user_id, diary, action):
+    """把对日记的浏览、点赞和取消点赞记为对日记所写景点的交互，供景点的协同过滤使用
+    
+    Args:
+        user_id: 用户ID
+        diary: 日记对象
+        action: 行为类型，'view'、'like'或'unlike'
+    
+    Returns:
+        是否找到了日记对应的景点
+    """
+    try:
+        place = Place.find_by_location(diary.location_name, diary.city, diary.latitude, diary.longitude)
+    except Exception as e:
+        print(f"Error finding place for diary {diary.id}: {e}")
+        return False
+    
+    if place is None:
+        return False
+    
+    interaction_log.record(user_id, 'place', place.id, action)
+    return True
+
 def allowed_file(filename):
     """检查文件扩展名是否允许"""
     return '.' in filename and \
@@ -223,6 +249,10 @@ def get_diary(diary_id):
     diary.view_count += 1
     db.session.commit()
     
+    # 登录用户的浏览记为对日记所写景点的浏览
+    if current_user_id:
+        record_place_interaction(current_user_id, diary, 'view')
+    
     # 获取作者信息
     user = User.query.get(diary.user_id)
     
@@ -539,6 +569,10 @@ def like_diary(diary_id):
     diary.like_count += 1
     db.session.commit()
     
+    # 点赞记为对日记所写景点的点赞，改变了用户的推荐结果
+    if record_place_interaction(get_jwt_identity(), diary, 'like'):
+        recommendation_cache.invalidate(get_jwt_identity())
+    
     return jsonify({
         'status': 'success',
         'message': '点赞成功',
@@ -565,6 +599,9 @@ def unlike_diary(diary_id):
     if diary.like_count > 0:
         diary.like_count -= 1
         db.session.commit()
+        
+        if record_place_interaction(get_jwt_identity(), diary, 'unlike'):
+            recommendation_cache.invalidate(get_jwt_identity())
     
     return jsonify({
         'status': 'success',
@@ -1,4 +1,4 @@
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, request, jsonify, current_app
 from flask_jwt_extended import jwt_required, get_jwt_identity
 from sqlalchemy import func
 
@@ -6,6 +6,8 @@ from sqlalchemy import func
 from models import db
 from models.user import User
 from models.food import Food
+from models.interaction import interaction_log
+from utils.cache import recommendation_cache
 
 # 创建美食蓝图
 food_bp = Blueprint('food', __name__)
@@ -28,6 +30,13 @@ def recommend_foods():
     """
     # 获取当前用户ID
     current_user_id = get_jwt_identity()
+    
+    # 获取查询参数
+    latitude = request.args.get('latitude', type=float)
+    longitude = request.args.get('longitude', type=float)
+    radius = request.args.get('radius', default=5.0, type=float)
+    limit = request.args.get('limit', default=10, type=int)
+    
     user = User.query.get(current_user_id)
     
     if not user:
@@ -36,11 +45,33 @@ def recommend_foods():
             'message': '用户不存在'
         }), 404
     
-    # 获取查询参数
-    latitude = request.args.get('latitude', type=float)
-    longitude = request.args.get('longitude', type=float)
-    radius = request.args.get('radius', default=5.0, type=float)
-    limit = request.args.get('limit', default=10, type=int)
+    # 同样的请求直接返回缓存的结果，位置按约100米取整，用户修改偏好或评分后缓存失效
+    cache_params = {
+        'endpoint': 'food/recommend',
+        'limit': limit,
+        'latitude': round(latitude, 3) if latitude is not None else None,
+        'longitude': round(longitude, 3) if longitude is not None else None,
+        'radius': radius
+    }
+    cached, cache_generation = recommendation_cache.get(current_user_id, 'food', None, cache_params)
+    if cached is not None:
+        return current_app.response_class(cached, mimetype='application/json')
+    
+    # 混合推荐：从向量索引、协同过滤、附近和热门美食召回候选，再按综合得分排序
+    hybrid_recommender = current_app.extensions.get('hybrid_recommender')
+    if hybrid_recommender is not None:
+        result = hybrid_recommender.recommend(user, 'food', limit, latitude, longitude, radius)
+        if result:
+            response = {
+                'status': 'success',
+                'data': {
+                    'foods': result,
+                    'count': len(result),
+                    'algorithm': '混合推荐'
+                }
+            }
+            recommendation_cache.set(current_user_id, 'food', None, cache_params, response, cache_generation)
+            return jsonify(response)
     
     # 基于用户偏好推荐
     recommended_foods = []
@@ -99,13 +130,16 @@ def recommend_foods():
         }
         result.append(food_dict)
     
-    return jsonify({
+    response = {
         'status': 'success',
         'data': {
             'foods': result,
             'count': len(result)
         }
-    })
+    }
+    recommendation_cache.set(current_user_id, 'food', None, cache_params, response, cache_generation)
+    
+    return jsonify(response)
 
 @food_bp.route('/nearby', methods=['GET'])
 def get_nearby_foods():
@@ -374,6 +408,12 @@ def rate_food(food_id):
     # 保存到数据库
     db.session.commit()
     
+    # 记录这次评分，供协同过滤使用
+    interaction_log.record(current_user_id, 'food', food_id, 'rate', float(rating))
+    
+    # 评分改变了用户的推荐结果
+    recommendation_cache.invalidate(current_user_id)
+    
     return jsonify({
         'status': 'success',
         'message': '评价成功',
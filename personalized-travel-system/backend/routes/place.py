@@ -0,0 +1,100 @@
+from flask import Blueprint, request, jsonify
+from flask_jwt_extended import jwt_required, get_jwt_identity
+
+# 导入数据库和模型
+from models import db
+from models.place import Place
+from models.interaction import interaction_log
+from utils.cache import recommendation_cache
+
+# 创建景点蓝图
+place_bp = Blueprint('place', __name__)
+
+@place_bp.route('/<int:place_id>', methods=['GET'])
+@jwt_required(optional=True)
+def get_place_detail(place_id):
+    """获取景点详情API
+    
+    登录用户的浏览记入交互日志，供景点的协同过滤使用
+    
+    Args:
+        place_id: 景点ID
+    
+    Returns:
+        景点详细信息
+    """
+    place = Place.query.get_or_404(place_id)
+    
+    current_user_id = get_jwt_identity()
+    if current_user_id:
+        interaction_log.record(current_user_id, 'place', place_id, 'view')
+    
+    result = place.to_dict()
+    result.update({
+        'created_at': place.created_at.isoformat() if place.created_at else None,
+        'updated_at': place.updated_at.isoformat() if place.updated_at else None
+    })
+    
+    return jsonify({
+        'status': 'success',
+        'data': result
+    })
+
+@place_bp.route('/<int:place_id>/rate', methods=['POST'])
+@jwt_required()
+def rate_place(place_id):
+    """景点评分API
+    
+    Args:
+        place_id: 景点ID
+    
+    Request Body:
+        rating: 评分 (1-5)
+    
+    Returns:
+        评分结果
+    """
+    # 获取当前用户ID
+    current_user_id = get_jwt_identity()
+    
+    # 获取景点
+    place = Place.query.get_or_404(place_id)
+    
+    # 获取请求数据
+    data = request.get_json()
+    
+    # 验证评分
+    rating = data.get('rating')
+    if rating is None or not (1 <= rating <= 5):
+        return jsonify({
+            'status': 'error',
+            'message': '评分必须在1-5之间'
+        }), 400
+    
+    # 计算新的平均评分
+    old_rating = place.rating or 0
+    old_count = place.review_count or 0
+    new_count = old_count + 1
+    new_rating = (old_rating * old_count + rating) / new_count
+    
+    # 更新景点评分和评价数
+    place.rating = new_rating
+    place.review_count = new_count
+    
+    # 保存到数据库
+    db.session.commit()
+    
+    # 记录这次评分，供协同过滤使用
+    interaction_log.record(current_user_id, 'place', place_id, 'rate', float(rating))
+    
+    # 评分改变了用户的推荐结果
+    recommendation_cache.invalidate(current_user_id)
+    
+    return jsonify({
+        'status': 'success',
+        'message': '评分成功',
+        'data': {
+            'new_rating': new_rating,
+            'review_count': new_count
+        }
+    })
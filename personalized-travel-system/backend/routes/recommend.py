@@ -1,4 +1,4 @@
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, request, jsonify, current_app
 from flask_jwt_extended import jwt_required, get_jwt_identity
 from sqlalchemy import func
 import random
@@ -7,6 +7,7 @@ import random
 from models import db
 from models.user import User
 from models.place import Place
+from utils.cache import recommendation_cache
 
 # 创建推荐蓝图
 recommend_bp = Blueprint('recommend', __name__)
@@ -23,6 +24,10 @@ def recommend_places():
     """
     # 获取当前用户ID
     current_user_id = get_jwt_identity()
+    
+    # 获取查询参数
+    limit = request.args.get('limit', default=10, type=int)
+    
     user = User.query.get(current_user_id)
     
     if not user:
@@ -31,8 +36,11 @@ def recommend_places():
             'message': '用户不存在'
         }), 404
     
-    # 获取查询参数
-    limit = request.args.get('limit', default=10, type=int)
+    # 同样的请求直接返回缓存的结果，用户修改偏好或评分后缓存失效
+    cache_params = {'endpoint': 'places', 'limit': limit}
+    cached, cache_generation = recommendation_cache.get(current_user_id, 'place', None, cache_params)
+    if cached is not None:
+        return current_app.response_class(cached, mimetype='application/json')
     
     # 基于用户偏好推荐
     recommended_places = []
@@ -62,13 +70,16 @@ def recommend_places():
     # 限制返回数量并转换为字典
     result = [place.to_dict() for place in recommended_places[:limit]]
     
-    return jsonify({
+    response = {
         'status': 'success',
         'data': {
             'places': result,
             'count': len(result)
         }
-    })
+    }
+    recommendation_cache.set(current_user_id, 'place', None, cache_params, response, cache_generation)
+    
+    return jsonify(response)
 
 @recommend_bp.route('/places/history', methods=['GET'])
 @jwt_required()
@@ -166,13 +177,29 @@ def recommend_nearby_places():
 def ai_recommend_places():
     """AI推荐算法
     
-    使用AI算法进行个性化推荐
+    使用混合推荐进行个性化推荐：先从向量索引、协同过滤模型、附近景点和热门景点召回候选，
+    再按内容相似度、协同过滤预测评分、距离和景点评分加权排序
+    
+    Query Parameters:
+        limit: 返回结果数量限制，默认10个
+        latitude: 纬度，可选
+        longitude: 经度，可选
+        radius: 附近景点的搜索半径(公里)，默认10公里
+        city: 只推荐该城市的景点，可选
     
     Returns:
         AI推荐的景点列表
     """
     # 获取当前用户ID
     current_user_id = get_jwt_identity()
+    
+    # 获取查询参数
+    limit = request.args.get('limit', default=10, type=int)
+    latitude = request.args.get('latitude', type=float)
+    longitude = request.args.get('longitude', type=float)
+    radius = request.args.get('radius', default=10.0, type=float)
+    city = request.args.get('city')
+    
     user = User.query.get(current_user_id)
     
     if not user:
@@ -181,26 +208,41 @@ def ai_recommend_places():
             'message': '用户不存在'
         }), 404
     
-    # 获取查询参数
-    limit = request.args.get('limit', default=10, type=int)
-    
-    # 这里应该调用AI推荐模块进行推荐
-    # 由于AI推荐模块尚未实现，这里使用随机推荐进行模拟
-    # 在实际应用中，应该导入并调用ai_recommendation模块中的算法
-    
-    # 随机选择一些景点作为推荐结果
-    ai_recommended_places = Place.query.order_by(
-        func.random()
-    ).limit(limit).all()
-    
-    # 转换为字典
-    result = [place.to_dict() for place in ai_recommended_places]
-    
-    return jsonify({
+    # 位置按约100米取整，附近的请求共用缓存
+    cache_params = {
+        'endpoint': 'places/ai',
+        'limit': limit,
+        'latitude': round(latitude, 3) if latitude is not None else None,
+        'longitude': round(longitude, 3) if longitude is not None else None,
+        'radius': radius
+    }
+    cached, cache_generation = recommendation_cache.get(current_user_id, 'place', city, cache_params)
+    if cached is not None:
+        return current_app.response_class(cached, mimetype='application/json')
+    
+    # 混合推荐：从向量索引、协同过滤、附近和热门景点召回候选，再按综合得分排序
+    result = []
+    algorithm = '混合推荐'
+    hybrid_recommender = current_app.extensions.get('hybrid_recommender')
+    if hybrid_recommender is not None:
+        result = hybrid_recommender.recommend(user, 'place', limit, latitude, longitude, radius, city)
+    
+    # 混合推荐不可用或没有结果时，返回评分最高的景点
+    if not result:
+        query = Place.query
+        if city:
+            query = query.filter(Place.city == city)
+        result = [place.to_dict() for place in query.order_by(Place.rating.desc()).limit(limit).all()]
+        algorithm = '评分最高'
+    
+    response = {
         'status': 'success',
         'data': {
             'places': result,
             'count': len(result),
-            'algorithm': 'AI推荐算法（模拟）'
+            'algorithm': algorithm
         }
-    })
\ No newline at end of file
+    }
+    recommendation_cache.set(current_user_id, 'place', city, cache_params, response, cache_generation)
+    
+    return jsonify(response)
\ No newline at end of file
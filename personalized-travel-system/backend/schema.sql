@@ -2,6 +2,7 @@
 -- 包含用户、景点、美食、日记和路径规划等表
 
 -- 删除已存在的表，避免冲突
+DROP TABLE IF EXISTS interactions;
 DROP TABLE IF EXISTS paths;
 DROP TABLE IF EXISTS diaries;
 DROP TABLE IF EXISTS foods;
@@ -150,6 +151,21 @@ CREATE TABLE paths (
     FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE SET NULL
 ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
 
+-- 创建用户交互记录表（只追加），协同过滤模型从这里读取评分、点赞和浏览记录
+CREATE TABLE interactions (
+    id BIGINT AUTO_INCREMENT PRIMARY KEY,
+    user_id INT NOT NULL,
+    item_type VARCHAR(20) NOT NULL,
+    item_id INT NOT NULL,
+    action VARCHAR(20) NOT NULL,
+    value FLOAT,
+    created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+    INDEX idx_interactions_type_id (item_type, id),
+    INDEX idx_interactions_user (user_id, item_type),
+    INDEX idx_created_at (created_at),
+    FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
+
 -- 添加初始数据
 
 -- 添加管理员用户 (密码哈希值对应 'admin123')
@@ -0,0 +1,276 @@
+import time
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from flask import json
+
+# 尝试导入Redis客户端，如果不可用则只使用进程内缓存
+try:
+    import redis
+    REDIS_AVAILABLE = True
+except ImportError:
+    print("Warning: redis not installed. Recommendation cache is process-local.")
+    REDIS_AVAILABLE = False
+
+
+class TTLCache:
+    """带过期时间的LRU缓存，线程安全
+    
+    条目在写入ttl秒后过期，超过max_entries条时淘汰最久未使用的条目
+    """
+    
+    def __init__(self, max_entries: int = 10000, ttl: float = 300.0):
+        """初始化缓存
+        
+        Args:
+            max_entries: 最多保存的条目数
+            ttl: 条目的有效期（秒）
+        """
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+    
+    def get(self, key: Any) -> Any:
+        """读取未过期的条目，不存在或已过期时返回None"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry[0] < time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return entry[1]
+    
+    def set(self, key: Any, value: Any):
+        """写入条目"""
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+    
+    def get_or_set(self, key: Any, factory: Callable[[], Any]) -> Tuple[Any, bool]:
+        """读取条目，不存在时调用factory生成并写入
+        
+        Returns:
+            (值, 是否命中缓存)
+        """
+        value = self.get(key)
+        if value is not None:
+            return value, True
+        value = factory()
+        self.set(key, value)
+        return value, False
+    
+    def pop(self, key: Any) -> Any:
+        """删除条目并返回其值，不存在时返回None"""
+        with self._lock:
+            entry = self._entries.pop(key, None)
+        return entry[1] if entry is not None else None
+    
+    def clear(self):
+        """清空缓存"""
+        with self._lock:
+            self._entries.clear()
+    
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+class RecommendationCache:
+    """推荐结果缓存
+    
+    按(用户ID, 物品类型, 城市, 请求参数)缓存推荐接口的响应JSON，命中时直接返回，不再查询数据库和重新计算。
+    默认保存在进程内的TTLCache中；配置RECOMMEND_CACHE_REDIS_URL且安装了redis时保存在Redis中，
+    同一台机器上的多个工作进程共享缓存和失效。Redis中每个用户的缓存是一个哈希，
+    失效时删除整个哈希，条目数量由Redis的maxmemory-policy（如allkeys-lru）限制。
+    
+    两种存储都按用户记录版本号，失效时版本号加一。条目写入计算前读取的版本号下，
+    只有版本号与当前一致的条目会被读取，旧条目之后按LRU淘汰。
+    只使用进程内缓存时，失效只对处理该请求的工作进程生效，其他进程最多在ttl秒后更新
+    """
+    
+    # Redis中缓存键的前缀
+    REDIS_PREFIX = 'recommend:'
+    
+    def __init__(self, max_entries: int = 10000, ttl: float = 60.0, redis_url: str = None):
+        """初始化缓存
+        
+        Args:
+            max_entries: 进程内缓存最多保存的条目数
+            ttl: 缓存的有效期（秒），为0时不缓存
+            redis_url: Redis连接地址，如redis://localhost:6379/0，为None时只使用进程内缓存
+        """
+        self.ttl = ttl
+        self.local = TTLCache(max_entries, ttl)
+        self.redis = None
+        self.hits = 0
+        self.misses = 0
+        self._generations = {}
+        self._listeners = []
+        self._lock = threading.Lock()
+        if redis_url:
+            self._connect(redis_url)
+    
+    def init_app(self, app):
+        """绑定应用并读取配置
+        
+        Args:
+            app: Flask应用实例
+        """
+        self.ttl = app.config.get('RECOMMEND_CACHE_TTL', self.ttl)
+        self.local = TTLCache(app.config.get('RECOMMEND_CACHE_MAX_ENTRIES', self.local.max_entries), self.ttl)
+        self.redis = None
+        self._generations = {}
+        self._listeners = []
+        redis_url = app.config.get('RECOMMEND_CACHE_REDIS_URL')
+        if redis_url:
+            self._connect(redis_url)
+        app.extensions['recommendation_cache'] = self
+    
+    def _connect(self, redis_url: str):
+        if not REDIS_AVAILABLE:
+            print("Warning: RECOMMEND_CACHE_REDIS_URL is set but redis is not installed. Using process-local cache.")
+            return
+        try:
+            client = redis.Redis.from_url(redis_url, socket_timeout=0.05, socket_connect_timeout=0.05)
+            client.ping()
+            self.redis = client
+        except redis.RedisError as e:
+            print(f"Warning: cannot connect to Redis at {redis_url}: {e}. Using process-local cache.")
+    
+    @staticmethod
+    def _field(item_type: str, city: Optional[str], params: Dict[str, Any]) -> str:
+        # 参数按键排序后序列化，保证同样的参数得到同样的键
+        return f"{item_type}|{city or ''}|{json.dumps(params, sort_keys=True)}"
+    
+    def get(self, user_id: int, item_type: str, city: Optional[str],
+            params: Dict[str, Any]) -> Tuple[Optional[str], int]:
+        """读取缓存的响应
+        
+        Args:
+            user_id: 用户ID
+            item_type: 物品类型，'place'或'food'
+            city: 城市，没有时为None
+            params: 其他影响结果的请求参数
+        
+        Returns:
+            (响应JSON字符串，未命中时为None, 用户缓存的版本号)；未命中时计算出的结果应带着这个版本号传给set，
+            计算期间缓存被失效时结果不会被读取
+        """
+        if self.ttl <= 0:
+            return None, 0
+        
+        body = None
+        field = self._field(item_type, city, params)
+        if self.redis is not None:
+            try:
+                pipeline = self.redis.pipeline(transaction=False)
+                pipeline.hget(f"{self.REDIS_PREFIX}{user_id}", field)
+                pipeline.get(f"{self.REDIS_PREFIX}generation:{user_id}")
+                value, generation = pipeline.execute()
+                generation = int(generation or 0)
+            except redis.RedisError:
+                value, generation = None, 0
+            if value is not None:
+                # 值为"版本号|过期时间戳|JSON"，哈希中的单个字段没有自己的过期时间
+                cached_generation, expires_at, cached_body = value.decode('utf-8').split('|', 2)
+                if int(cached_generation) == generation and float(expires_at) >= time.time():
+                    body = cached_body
+        else:
+            generation = self._generations.get(str(user_id), 0)
+            body = self.local.get((str(user_id), generation, field))
+        
+        with self._lock:
+            if body is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return body, generation
+    
+    def set(self, user_id: int, item_type: str, city: Optional[str], params: Dict[str, Any],
+            payload: Dict[str, Any], generation: int) -> str:
+        """缓存响应
+        
+        Args:
+            user_id: 用户ID
+            item_type: 物品类型
+            city: 城市
+            params: 其他影响结果的请求参数
+            payload: 响应内容
+            generation: 计算前get返回的版本号，写入该版本下，之后失效过的结果不会被读取
+        
+        Returns:
+            响应JSON字符串
+        """
+        body = json.dumps(payload)
+        if self.ttl <= 0:
+            return body
+        
+        field = self._field(item_type, city, params)
+        if self.redis is not None:
+            key = f"{self.REDIS_PREFIX}{user_id}"
+            try:
+                pipeline = self.redis.pipeline()
+                pipeline.hset(key, field, f"{generation}|{time.time() + self.ttl}|{body}")
+                pipeline.expire(key, int(self.ttl) + 1)
+                pipeline.execute()
+            except redis.RedisError:
+                pass
+        else:
+            self.local.set((str(user_id), generation, field), body)
+        
+        return body
+    
+    def invalidate(self, user_id: int):
+        """删除用户的全部缓存，在用户修改偏好、评分或删除账号后调用
+        
+        版本号加一，正在计算中的请求按旧版本号写入的结果不会再被读取
+        
+        Args:
+            user_id: 用户ID
+        """
+        if self.redis is not None:
+            try:
+                pipeline = self.redis.pipeline()
+                pipeline.incr(f"{self.REDIS_PREFIX}generation:{user_id}")
+                pipeline.delete(f"{self.REDIS_PREFIX}{user_id}")
+                pipeline.execute()
+            except redis.RedisError as e:
+                print(f"Error invalidating recommendation cache: {e}")
+        else:
+            with self._lock:
+                self._generations[str(user_id)] = self._generations.get(str(user_id), 0) + 1
+        
+        for listener in self._listeners:
+            listener(user_id)
+    
+    def add_listener(self, listener: Callable[[int], None]):
+        """注册失效回调，用户的缓存失效时以用户ID调用，用于清理其他按用户缓存的数据
+        
+        Args:
+            listener: 回调函数
+        """
+        if listener not in self._listeners:
+            self._listeners.append(listener)
+    
+    def clear(self):
+        """清空进程内缓存"""
+        self.local.clear()
+        with self._lock:
+            self._generations.clear()
+    
+    def stats(self) -> List[Tuple[str, str, Dict[str, Any], float]]:
+        """缓存的运行指标，格式与search_metrics的收集函数相同"""
+        backend = 'redis' if self.redis is not None else 'local'
+        return [
+            ('recommend_cache_hits', '推荐结果缓存的命中次数', {'backend': backend}, self.hits),
+            ('recommend_cache_misses', '推荐结果缓存的未命中次数', {'backend': backend}, self.misses),
+            ('recommend_cache_entries', '进程内推荐结果缓存的条目数', {}, len(self.local))
+        ]
+
+
+# 进程级推荐结果缓存，在app.py中通过init_app绑定应用
+recommendation_cache = RecommendationCache()
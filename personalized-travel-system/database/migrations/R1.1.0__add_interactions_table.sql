@@ -0,0 +1,5 @@
+-- 回滚脚本: add interactions table
+-- 版本: 1.1.0
+-- 创建时间: 2026-10-17 09:00:00
+
+DROP TABLE IF EXISTS interactions;
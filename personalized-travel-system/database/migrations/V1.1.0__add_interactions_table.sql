@@ -0,0 +1,18 @@
+-- 迁移脚本: add interactions table
+-- 版本: 1.1.0
+-- 创建时间: 2026-10-17 09:00:00
+
+-- 用户交互记录表（只追加），协同过滤模型从这里读取评分、点赞和浏览记录
+CREATE TABLE interactions (
+    id BIGINT AUTO_INCREMENT PRIMARY KEY,
+    user_id INT NOT NULL,
+    item_type VARCHAR(20) NOT NULL,
+    item_id INT NOT NULL,
+    action VARCHAR(20) NOT NULL,
+    value FLOAT,
+    created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+    INDEX idx_interactions_type_id (item_type, id),
+    INDEX idx_interactions_user (user_id, item_type),
+    INDEX idx_created_at (created_at),
+    FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
@@ -0,0 +1,142 @@
+import numpy as np
+import pytest
+
+from ai_recommendation.collaborative_filter import CollaborativeFilterRecommender, ImplicitALS, merge_interactions
+from ai_recommendation.evaluation import CollaborativeFilterModel, PopularityModel, ranking_metrics
+
+ALS_OPTIONS = {'n_factors': 8, 'iterations': 10, 'validation_fraction': 0, 'n_threads': 2}
+
+
+def planted_interactions(n_users: int = 200, n_groups: int = 4, items_per_group: int = 25,
+                         per_user: int = 10, seed: int = 0):
+    """每个用户只与自己所在组的物品交互，组内物品的热门程度不同
+    
+    Returns:
+        (训练交互, 每个用户留出的测试物品集合)
+    """
+    rng = np.random.default_rng(seed)
+    weights = 1.0 / np.arange(1, items_per_group + 1)
+    weights /= weights.sum()
+    train, test = [], {}
+    for user_id in range(n_users):
+        group = user_id % n_groups
+        items = rng.choice(items_per_group, per_user, replace=False, p=weights) + group * items_per_group
+        test[user_id] = set(int(item_id) for item_id in items[:2])
+        train.extend({'user_id': user_id, 'item_id': int(item_id), 'rating': 4.0} for item_id in items[2:])
+    return train, test
+
+
+def test_als_recall_beats_popularity_on_planted_structure():
+    """组结构明显时ALS的Recall@10明显高于热门基线"""
+    train, test = planted_interactions()
+    
+    results = {}
+    for name, model in (('popularity', PopularityModel()),
+                        ('als', CollaborativeFilterModel(method='mf', **ALS_OPTIONS))):
+        model.fit(train)
+        recommendations = {user_id: model.recommend(user_id, 10) for user_id in test}
+        results[name] = ranking_metrics(recommendations, test, 10, catalog_size=100)['recall']
+    
+    assert results['als'] > results['popularity'] + 0.2
+
+
+def test_als_low_ratings_are_negative_feedback():
+    """加入1星评分后这些物品的得分下降，而不是被当作弱的正反馈"""
+    train, _ = planted_interactions()
+    user_items = {interaction['item_id'] for interaction in train if interaction['user_id'] == 0}
+    disliked = [item_id for item_id in range(25) if item_id not in user_items][:3]
+    
+    def scores(interactions, **options):
+        model = CollaborativeFilterRecommender(factorization='als', als_options=dict(ALS_OPTIONS, **options))
+        model._build_user_item_matrix(interactions)
+        user_factor = model.user_factors[model.user_indices[0]]
+        return np.array([user_factor @ model.item_factors[model.item_indices[item_id]] for item_id in disliked])
+    
+    before = scores(train)
+    rated = train + [{'user_id': 0, 'item_id': item_id, 'rating': 1.0} for item_id in disliked]
+    
+    assert np.all(scores(rated) < before)
+    # positive_rating为0时所有评分都是正反馈，得分反而上升
+    assert np.all(scores(rated, positive_rating=0.0) > before)
+
+
+def test_merge_interactions_prefers_explicit_ratings_and_counts_unlikes():
+    """显式评分以最后一次为准，取消点赞抵消点赞后退回到浏览"""
+    records = [
+        (1, 10, 'rate', 2.0), (1, 10, 'like', None), (1, 10, 'rate', 5.0),
+        (1, 11, 'view', None), (1, 11, 'like', None), (1, 11, 'unlike', None),
+        (1, 12, 'like', None), (1, 12, 'unlike', None),
+        (2, 10, 'like', None)
+    ]
+    merged = {(interaction['user_id'], interaction['item_id']): (interaction['rating'], interaction['explicit'])
+              for interaction in merge_interactions(records)}
+    
+    assert merged == {(1, 10): (5.0, True), (1, 11): (3.0, False), (2, 10): (4.0, False)}
+
+
+def test_als_fold_in_matches_exact_solve_for_new_user():
+    """ALS增量加入的新用户因子等于固定物品因子后重新求解该用户的精确解"""
+    train, _ = planted_interactions()
+    model = CollaborativeFilterRecommender(factorization='als', als_options=ALS_OPTIONS)
+    model._build_user_item_matrix(train)
+    item_factors = model.item_factors.astype('float64')
+    
+    new_ratings = {3: 4.0, 7: 3.0, 12: 5.0, 30: 2.0}
+    stats = model.fold_in([{'user_id': 999, 'item_id': item_id, 'rating': rating}
+                           for item_id, rating in new_ratings.items()])
+    assert stats == {'interactions': 4, 'new_users': 1, 'new_items': 0}
+    
+    # 求解(YᵀY + λI + Yᵀ(C-I)Y)x = YᵀCp，低于positive_rating的评分偏好为0
+    als = ImplicitALS(**ALS_OPTIONS)
+    lhs = item_factors.T @ item_factors + als.regularization * np.eye(als.n_factors)
+    rhs = np.zeros(als.n_factors)
+    for item_id, rating in new_ratings.items():
+        y = item_factors[model.item_indices[item_id]]
+        positive = rating >= als.positive_rating
+        extra = als.alpha * (rating if positive else als.positive_rating - rating)
+        lhs += extra * np.outer(y, y)
+        rhs += (1 + extra) * y if positive else 0
+    expected = np.linalg.solve(lhs, rhs)
+    
+    assert model.user_factors[model.user_indices[999]] == pytest.approx(expected, rel=1e-3, abs=1e-4)
+
+
+def test_svd_fold_in_matches_existing_user_with_same_ratings():
+    """SVD增量加入与已有用户评分相同的新用户时，得到与训练时相同的因子和预测"""
+    rng = np.random.default_rng(1)
+    train = [{'user_id': user_id, 'item_id': int(item_id), 'rating': float(rng.integers(1, 6))}
+             for user_id in range(60) for item_id in rng.choice(80, 15, replace=False)]
+    model = CollaborativeFilterRecommender(factorization='svd')
+    model._build_user_item_matrix(train)
+    existing = model.user_factors[model.user_indices[7]].copy()
+    
+    model.fold_in([dict(interaction, user_id=999) for interaction in train if interaction['user_id'] == 7])
+    
+    assert model.user_factors[model.user_indices[999]] == pytest.approx(existing, abs=1e-8)
+    recommended, expected = model.recommend_item_ids(999, 5, 'mf'), model.recommend_item_ids(7, 5, 'mf')
+    assert [item_id for item_id, _ in recommended] == [item_id for item_id, _ in expected]
+    assert [score for _, score in recommended] == pytest.approx([score for _, score in expected])
+
+
+def test_fold_in_new_item_gets_factors():
+    """只被已有用户评分过的新物品加入模型并得到非零因子"""
+    train, _ = planted_interactions()
+    model = CollaborativeFilterRecommender(factorization='als', als_options=ALS_OPTIONS)
+    model._build_user_item_matrix(train)
+    
+    stats = model.fold_in([{'user_id': user_id, 'item_id': 500, 'rating': 5.0} for user_id in (0, 4, 8)])
+    
+    assert stats == {'interactions': 3, 'new_users': 0, 'new_items': 1}
+    assert np.linalg.norm(model.item_factors[model.item_indices[500]]) > 0
+
+
+def test_fold_in_unlike_removes_rating():
+    """评分为0的显式记录删除已有评分"""
+    train, _ = planted_interactions()
+    model = CollaborativeFilterRecommender(factorization='als', als_options=ALS_OPTIONS)
+    model._build_user_item_matrix(train)
+    item_id = next(interaction['item_id'] for interaction in train if interaction['user_id'] == 5)
+    
+    model.fold_in([{'user_id': 5, 'item_id': item_id, 'rating': 0.0}])
+    
+    assert model.user_item_matrix[model.user_indices[5], model.item_indices[item_id]] == 0
@@ -0,0 +1,69 @@
+import numpy as np
+import pytest
+
+from ai_recommendation.evaluation import ranking_metrics, time_split_folds
+
+
+def test_ranking_metrics_hand_computed():
+    """两个用户的指标与手算结果一致"""
+    recommendations = {
+        # 第1和第3个命中
+        1: [10, 11, 12],
+        # 没有命中
+        2: [10, 13, 14]
+    }
+    relevant = {1: {10, 12, 15, 16}, 2: {20}}
+    metrics = ranking_metrics(recommendations, relevant, k=3, catalog_size=10)
+    
+    # 用户1：DCG = 1/log2(2) + 1/log2(4) = 1.5，IDCG = 1 + 1/log2(3) + 1/log2(4)
+    ndcg1 = 1.5 / (1 + 1 / np.log2(3) + 0.5)
+    assert metrics['precision'] == pytest.approx((2 / 3 + 0) / 2)
+    assert metrics['recall'] == pytest.approx((2 / 4 + 0) / 2)
+    assert metrics['ndcg'] == pytest.approx(ndcg1 / 2)
+    assert metrics['hit_rate'] == pytest.approx(0.5)
+    # 推荐过的物品为10、11、12、13、14
+    assert metrics['coverage'] == pytest.approx(0.5)
+
+
+def test_ranking_metrics_short_list_and_missing_user():
+    """推荐不足K个时按K计算精确率，没有推荐的用户指标为0"""
+    metrics = ranking_metrics({1: [5]}, {1: {5}, 2: {6}}, k=2, catalog_size=4)
+    
+    assert metrics['precision'] == pytest.approx((1 / 2 + 0) / 2)
+    assert metrics['recall'] == pytest.approx(0.5)
+    assert metrics['ndcg'] == pytest.approx(0.5)
+    assert metrics['coverage'] == pytest.approx(0.25)
+
+
+def test_ranking_metrics_empty():
+    """没有相关物品时所有指标为0"""
+    metrics = ranking_metrics({1: [1, 2]}, {}, k=2, catalog_size=5)
+    
+    assert all(value == 0.0 for value in metrics.values())
+
+
+def test_time_split_folds_uses_rolling_windows():
+    """每折用窗口之前的全部记录训练，相关物品只含训练用户新交互的高分物品"""
+    records = [
+        (1, 1, 1, 'rate', 5.0, 1.0),
+        (2, 1, 2, 'rate', 4.0, 2.0),
+        (3, 2, 1, 'rate', 4.0, 3.0),
+        (4, 2, 3, 'view', None, 4.0),
+        (5, 1, 3, 'like', None, 5.0),
+        (6, 2, 2, 'rate', 2.0, 6.0),
+        # 第1折的测试窗口：用户3没有出现在训练集中
+        (7, 1, 4, 'rate', 5.0, 7.0),
+        (8, 3, 4, 'rate', 5.0, 8.0),
+        # 第2折的测试窗口：低分不算相关，用户3已出现在训练集中
+        (9, 2, 5, 'rate', 2.0, 9.0),
+        (10, 3, 1, 'rate', 4.0, 10.0)
+    ]
+    folds = time_split_folds(records, n_folds=2, test_fraction=0.4)
+    
+    assert [fold['relevant'] for fold in folds] == [{1: {4}}, {3: {1}}]
+    assert [(fold['train_end'], fold['test_end']) for fold in folds] == [(6.0, 8.0), (8.0, 10.0)]
+    assert len(folds[0]['train']) == 6
+    assert len(folds[1]['train']) == 8
+    
+    # 测试记录少于折数时不切分
+    assert time_split_folds(records, n_folds=3, test_fraction=0.2) == []
@@ -0,0 +1,70 @@
+import pytest
+from flask import Flask
+
+from backend.models import db, Place, User
+from backend.models.interaction import Interaction, InteractionLog
+from ai_recommendation.collaborative_filter import CollaborativeFilterRecommender
+
+
+@pytest.fixture
+def app(tmp_path):
+    """使用临时SQLite数据库的应用，包含两个景点和三个用户"""
+    app = Flask(__name__)
+    app.config.update(SQLALCHEMY_DATABASE_URI=f"sqlite:///{tmp_path / 'test.db'}",
+                      SQLALCHEMY_TRACK_MODIFICATIONS=False)
+    db.init_app(app)
+    
+    with app.app_context():
+        db.create_all()
+        db.session.add_all([
+            Place(name='西湖', latitude=30.25, longitude=120.15, city='杭州'),
+            Place(name='灵隐寺', latitude=30.24, longitude=120.10, city='杭州')
+        ])
+        db.session.add_all([User(username=f'user{i}', email=f'user{i}@example.com', password='password')
+                            for i in range(3)])
+        db.session.commit()
+        yield app
+
+
+def test_interaction_log_writes_in_batches(app):
+    """缓冲区达到batch_size条时一次写入"""
+    log = InteractionLog(batch_size=3, flush_interval=3600)
+    log.app = app
+    
+    log.record(1, 'place', 1, 'view')
+    log.record(1, 'place', 1, 'like')
+    assert Interaction.query.count() == 0
+    
+    log.record(2, 'place', 2, 'rate', 4.0)
+    assert Interaction.query.count() == 3
+
+
+def test_place_model_trains_and_refreshes_from_log(app):
+    """景点的交互记录训练出景点模型，之后的取消点赞在增量刷新时删除之前的点赞"""
+    log = InteractionLog(batch_size=1)
+    log.app = app
+    for user_id in (1, 2, 3):
+        log.record(user_id, 'place', 1, 'like')
+        log.record(user_id, 'place', 2, 'view')
+    log.record(1, 'place', 2, 'rate', 2.0)
+    
+    model = CollaborativeFilterRecommender(factorization='svd')
+    model.train_from_log('place')
+    
+    def rating(user_id, item_id):
+        return model.user_item_matrix[model.user_indices[user_id], model.item_indices[item_id]]
+    
+    assert (rating(1, 1), rating(1, 2), rating(2, 2)) == (4.0, 2.0, 3.0)
+    
+    log.record(2, 'place', 1, 'unlike')
+    model.refresh_from_log('place')
+    
+    assert rating(2, 1) == 0
+
+
+def test_find_place_for_diary_location(app):
+    """按名称和城市匹配景点，找不到时取坐标附近最近的景点"""
+    assert Place.find_by_location('西湖', '杭州').name == '西湖'
+    assert Place.find_by_location('西湖', '北京') is None
+    assert Place.find_by_location(None, None, 30.2405, 120.1005).name == '灵隐寺'
+    assert Place.find_by_location('不存在', None, 31.0, 121.0) is None
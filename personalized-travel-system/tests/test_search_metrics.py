@@ -0,0 +1,71 @@
+import numpy as np
+import pytest
+
+from ai_recommendation.search_metrics import MetricsRegistry
+from ai_recommendation.vector_search import VectorIndex, SEARCH_QUERIES
+
+
+def test_counter_and_histogram_prometheus_output():
+    """计数器按标签分别计数，直方图输出累计分桶、总和和次数"""
+    registry = MetricsRegistry()
+    queries = registry.counter('queries_total', '查询次数', ('index',))
+    latency = registry.histogram('latency_seconds', '查询耗时', ('index',), buckets=(0.01, 0.1))
+    
+    queries.inc(index='place')
+    queries.inc(2, index='place')
+    queries.inc(index='food')
+    for value in (0.005, 0.05, 0.5):
+        latency.observe(value, index='place')
+    
+    lines = registry.render_prometheus().splitlines()
+    
+    assert 'queries_total{index="place"} 3.0' in lines
+    assert 'queries_total{index="food"} 1.0' in lines
+    assert 'latency_seconds_bucket{index="place",le="0.01"} 1' in lines
+    assert 'latency_seconds_bucket{index="place",le="0.1"} 2' in lines
+    assert 'latency_seconds_bucket{index="place",le="+Inf"} 3' in lines
+    assert 'latency_seconds_sum{index="place"} 0.555' in lines
+    assert 'latency_seconds_count{index="place"} 3' in lines
+    # 同名指标重复注册时返回已有对象
+    assert registry.counter('queries_total', '查询次数', ('index',)) is queries
+
+
+def test_histogram_snapshot_quantiles():
+    """分位数按分桶上界估计，落在+Inf桶时返回最大的有限上界"""
+    registry = MetricsRegistry()
+    latency = registry.histogram('latency_seconds', '查询耗时', buckets=(0.01, 0.1, 1.0))
+    for value in [0.005] * 90 + [0.5] * 9 + [5.0]:
+        latency.observe(value)
+    
+    entry = registry.snapshot()['latency_seconds'][0]
+    
+    assert entry['count'] == 100
+    assert entry['avg'] == pytest.approx((0.005 * 90 + 0.5 * 9 + 5.0) / 100)
+    assert entry['p50'] == 0.01
+    assert entry['p95'] == 1.0
+
+
+def test_failing_collector_does_not_hide_other_gauges():
+    """单个收集函数出错时其他收集函数的指标照常导出"""
+    registry = MetricsRegistry()
+    
+    def broken():
+        raise RuntimeError('boom')
+    
+    registry.register_collector(broken)
+    registry.register_collector(lambda: [('index_items', '索引中的项目数', {'index': 'place'}, 42)])
+    
+    assert 'index_items{index="place"} 42.0' in registry.render_prometheus().splitlines()
+    assert registry.snapshot()['index_items'] == [{'index': 'place', 'value': 42}]
+
+
+def test_vector_index_search_is_counted():
+    """每次搜索按索引名称和后端计数"""
+    index = VectorIndex(name='metrics_test')
+    index.build([1, 2, 3], np.random.default_rng(0).standard_normal((3, 8)))
+    before = SEARCH_QUERIES.value(index='metrics_test', backend=index.backend)
+    
+    index.search(np.ones(8, dtype='float32'), 2)
+    index.search(np.ones(8, dtype='float32'), 2)
+    
+    assert SEARCH_QUERIES.value(index='metrics_test', backend=index.backend) == before + 2
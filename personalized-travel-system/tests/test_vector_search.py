@@ -0,0 +1,174 @@
+import numpy as np
+import pytest
+
+from ai_recommendation.vector_search import VectorIndex, ShardedVectorIndex, VectorSearchEngine, FAISS_AVAILABLE
+
+CITIES = ['北京', '上海', '杭州']
+
+
+@pytest.fixture
+def items():
+    """60个随机向量，轮流分到三个城市，坐标在同一片区域内"""
+    rng = np.random.default_rng(0)
+    ids = list(range(100, 160))
+    vectors = rng.standard_normal((len(ids), 16)).astype('float32')
+    cities = [CITIES[i % len(CITIES)] for i in range(len(ids))]
+    coords = [(30.0 + rng.random() * 0.2, 120.0 + rng.random() * 0.2) for _ in ids]
+    return ids, vectors, cities, coords
+
+
+def _assert_same_results(result, expected):
+    assert [item_id for item_id, _ in result] == [item_id for item_id, _ in expected]
+    assert [score for _, score in result] == pytest.approx([score for _, score in expected], abs=1e-5)
+
+
+def _build_sharded(items) -> ShardedVectorIndex:
+    ids, vectors, cities, coords = items
+    index = ShardedVectorIndex(('city',), faiss_index_type='flat')
+    index.build(ids, vectors, coords, shard_keys=[(city,) for city in cities])
+    return index
+
+
+def _build_flat(items) -> VectorIndex:
+    ids, vectors, _, coords = items
+    index = VectorIndex(faiss_index_type='flat')
+    index.build(ids, vectors, coords)
+    return index
+
+
+@pytest.mark.parametrize('mmap', [True, False])
+def test_flat_index_save_load_round_trip(items, tmp_path, mmap):
+    """保存后加载的索引返回相同的搜索结果，删除的项目不会恢复"""
+    index = _build_flat(items)
+    index.remove(101)
+    path = str(tmp_path / 'place.index')
+    index.save(path)
+    
+    loaded = VectorIndex(faiss_index_type='flat')
+    loaded.load(path, mmap=mmap)
+    query = np.random.default_rng(3).standard_normal(16).astype('float32')
+    
+    assert len(loaded) == len(index)
+    assert 101 not in loaded.id_to_index
+    _assert_same_results(loaded.search(query, 10), index.search(query, 10))
+    _assert_same_results(loaded.search(query, 10, (30.1, 120.1), 5.0), index.search(query, 10, (30.1, 120.1), 5.0))
+
+
+def test_memory_mapped_index_accepts_updates(items, tmp_path):
+    """以内存映射加载的只读索引在第一次修改时读入内存，修改不会写回文件"""
+    index = _build_flat(items)
+    path = str(tmp_path / 'place.index')
+    index.save(path)
+    
+    loaded = VectorIndex(faiss_index_type='flat')
+    loaded.load(path, mmap=True)
+    vector = np.random.default_rng(5).standard_normal(16).astype('float32')
+    loaded.add(999, vector, (30.1, 120.1))
+    loaded.remove(100)
+    
+    assert loaded.search(vector, 1)[0][0] == 999
+    assert 100 not in loaded.id_to_index
+    
+    reloaded = VectorIndex(faiss_index_type='flat')
+    reloaded.load(path, mmap=True)
+    assert 999 not in reloaded.id_to_index
+    assert 100 in reloaded.id_to_index
+
+
+@pytest.mark.skipif(not FAISS_AVAILABLE, reason='精确比较需要FAISS的flat索引')
+def test_sharded_search_equals_flat_search_filtered_by_city(items):
+    """按城市过滤的分片搜索与全量搜索后按城市过滤的结果相同"""
+    ids, _, cities, _ = items
+    sharded, flat = _build_sharded(items), _build_flat(items)
+    city_of = dict(zip(ids, cities))
+    query = np.random.default_rng(1).standard_normal(16).astype('float32')
+    
+    for city in CITIES:
+        expected = [(item_id, score) for item_id, score in flat.search(query, len(ids))
+                    if city_of[item_id] == city][:5]
+        
+        _assert_same_results(sharded.search(query, 5, filters={'city': city}), expected)
+
+
+@pytest.mark.skipif(not FAISS_AVAILABLE, reason='精确比较需要FAISS的flat索引')
+def test_sharded_geo_search_equals_flat_geo_search_filtered_by_city(items):
+    """带半径的分片搜索与全量半径搜索后按城市过滤的结果相同"""
+    ids, _, cities, _ = items
+    sharded, flat = _build_sharded(items), _build_flat(items)
+    city_of = dict(zip(ids, cities))
+    query = np.random.default_rng(2).standard_normal(16).astype('float32')
+    center, radius = (30.1, 120.1), 8.0
+    
+    expected = [(item_id, score) for item_id, score in flat.search(query, len(ids), center, radius)
+                if city_of[item_id] == '上海'][:5]
+    
+    assert expected
+    _assert_same_results(sharded.search(query, 5, center, radius, filters={'city': '上海'}), expected)
+
+
+def test_route_ignores_unknown_fields(items):
+    """不是分片字段的条件不影响路由"""
+    sharded = _build_sharded(items)
+    
+    assert sharded.route({'city': '杭州'}) == [('杭州',)]
+    assert sorted(sharded.route({'place_type': 'museum'})) == sorted((city,) for city in CITIES)
+
+
+def test_sharded_id_map_follows_updates(items):
+    """项目ID到(分片键, 分片内行号)的映射随单条增删、换分片和分片内压缩更新"""
+    sharded = _build_sharded(items)
+    vector = np.random.default_rng(6).standard_normal(16).astype('float32')
+    
+    key, row = sharded.id_to_index[100]
+    assert key == ('北京',) and sharded.shards[key].ids[row] == 100
+    
+    # 城市变化后移到新分片
+    sharded.add(100, vector, (30.1, 120.1), ('上海',))
+    key, row = sharded.id_to_index[100]
+    assert key == ('上海',) and sharded.shards[key].ids[row] == 100
+    assert 100 not in sharded.shards[('北京',)].id_to_index
+    
+    sharded.remove(103)
+    assert 103 not in sharded.id_to_index
+    assert len(sharded.id_to_index) == len(items[0]) - 1
+    
+    sharded.shards[('北京',)].compact()
+    key, row = sharded.id_to_index[106]
+    assert sharded.shards[key].ids[row] == 106
+
+
+def test_engine_backend_index_of_sharded_type():
+    """分片的索引类型的place_index为分片键到各分片底层索引的映射"""
+    engine = VectorSearchEngine(use_bert=False, shard_fields={'place': ('city',)})
+    rng = np.random.default_rng(7)
+    engine.indices['place'].build([1, 2, 3], rng.standard_normal((3, 8)), None, [('北京',), ('上海',), ('北京',)])
+    
+    assert sorted(engine.place_index) == [('上海',), ('北京',)]
+    assert engine.place_id_to_index[3] == (('北京',), 1)
+
+
+def test_sharded_index_save_load_round_trip(items, tmp_path):
+    """保存后加载的分片索引在每个城市返回相同的搜索结果"""
+    index = _build_sharded(items)
+    path = str(tmp_path / 'place.index')
+    index.save(path)
+    
+    loaded = ShardedVectorIndex(('city',), faiss_index_type='flat')
+    loaded.load(path)
+    query = np.random.default_rng(4).standard_normal(16).astype('float32')
+    
+    assert sorted(loaded.shards) == sorted(index.shards)
+    for city in CITIES:
+        _assert_same_results(loaded.search(query, 5, filters={'city': city}),
+                             index.search(query, 5, filters={'city': city}))
+
+
+def test_sharded_load_ignores_different_shard_fields(items, tmp_path):
+    """分片字段不同时不加载保存的分片"""
+    path = str(tmp_path / 'place.index')
+    _build_sharded(items).save(path)
+    
+    loaded = ShardedVectorIndex(('city', 'place_type'))
+    loaded.load(path)
+    
+    assert not loaded.shards